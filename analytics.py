@@ -3,7 +3,9 @@
 专门负责计算收益率、持仓成本、资产占比等逻辑计算
 """
 
+import functools
 import sqlite3
+import time
 import pandas as pd
 from typing import Optional, Dict, List
 from decimal import Decimal
@@ -18,6 +20,39 @@ COST_METHOD_FIFO = "FIFO"  # 先进先出法
 COST_METHOD_WAC = "WAC"  # 加权平均成本法
 DEFAULT_COST_METHOD = COST_METHOD_FIFO
 
+# 按 (币种, 日期) 缓存的汇率有效期（秒），兜底其他进程写入的新汇率
+_FX_CACHE_TTL = 60
+
+# 批量折算时每条 SQL 携带的 (币种, 日期) 组合数：SQLite 复合 SELECT 最多 500 项，
+# 每项 2 个参数，旧版 SQLite 绑定参数上限为 999
+_FX_BATCH_PAIRS = 400
+
+# 库存计算所需的交易记录（按账本），调用方追加过滤条件与排序
+_INVENTORY_TRANSACTIONS_SQL = """
+    SELECT
+        t.id as 编号,
+        t.date as 日期,
+        t.code as 代码,
+        t.name as 名称,
+        t.ledger_id as 账本ID,
+        CASE
+            WHEN t.type IN ('买入', '开仓') THEN t.quantity
+            WHEN t.type IN ('卖出', '平仓') THEN -t.quantity
+        END as 数量,
+        CASE
+            WHEN t.type IN ('买入', '开仓') THEN -t.amount
+            WHEN t.type IN ('卖出', '平仓') THEN t.amount
+        END as 金额,
+        a.name as 账户,
+        c.code as 币种,
+        c.exchange_rate as 汇率
+    FROM transactions t
+    LEFT JOIN accounts a ON t.account_id = a.id
+    LEFT JOIN currencies c ON t.currency_id = c.id
+    WHERE t.type IN ('买入', '卖出', '开仓', '平仓')
+      AND t.ledger_id = ?
+"""
+
 
 class Analytics:
     """逻辑计算类 - 负责收益率、持仓成本、资产占比等计算"""
@@ -36,6 +71,9 @@ class Analytics:
         self.wac_inventory: Optional[WACInventory] = None
         self._ledger_cost_methods: Dict[int, str] = {}
         self._last_processed_ids: Dict[int, int] = {}
+        self._rate_at_date = functools.lru_cache(maxsize=4096)(self._lookup_rate_at_date)
+        self._current_rate = functools.lru_cache(maxsize=256)(self._lookup_exchange_rate)
+        self._rate_cache_time = time.monotonic()
         self._init_inventory_managers()
 
     @property
@@ -182,12 +220,15 @@ class Analytics:
             ledger_id = int(ledger_row["id"])
             self._rebuild_ledger_inventory(ledger_id, force_full)
 
-    def _rebuild_ledger_inventory(self, ledger_id: int, force_full: bool = False):
+    def _rebuild_ledger_inventory(
+        self, ledger_id: int, force_full: bool = False, commit: bool = True
+    ):
         """按账本重建库存
 
         Args:
             ledger_id: 账本ID
             force_full: 是否强制全量重建
+            commit: 是否在保存库存状态后提交；调用方处于写事务中时传 False，由调用方统一提交
         """
         last_id = self._last_processed_ids.get(ledger_id, 0)
 
@@ -196,33 +237,10 @@ class Analytics:
             self._last_processed_ids[ledger_id] = 0
 
         if last_id == 0 and not force_full:
-            self._rebuild_ledger_inventory(ledger_id, force_full=True)
+            self._rebuild_ledger_inventory(ledger_id, force_full=True, commit=commit)
             return
 
-        query = """
-            SELECT
-                t.id as 编号,
-                t.date as 日期,
-                t.code as 代码,
-                t.name as 名称,
-                t.ledger_id as 账本ID,
-                CASE
-                    WHEN t.type IN ('买入', '开仓') THEN t.quantity
-                    WHEN t.type IN ('卖出', '平仓') THEN -t.quantity
-                END as 数量,
-                CASE
-                    WHEN t.type IN ('买入', '开仓') THEN -t.amount
-                    WHEN t.type IN ('卖出', '平仓') THEN t.amount
-                END as 金额,
-                a.name as 账户,
-                c.code as 币种,
-                c.exchange_rate as 汇率
-            FROM transactions t
-            LEFT JOIN accounts a ON t.account_id = a.id
-            LEFT JOIN currencies c ON t.currency_id = c.id
-            WHERE t.type IN ('买入', '卖出', '开仓', '平仓')
-              AND t.ledger_id = ?
-        """
+        query = _INVENTORY_TRANSACTIONS_SQL
         params: list = [ledger_id]
 
         if last_id > 0:
@@ -250,7 +268,8 @@ class Analytics:
 
             self._last_processed_ids[ledger_id] = int(df["编号"].max())
             self._save_inventory_state(ledger_id)
-            self.conn.commit()
+            if commit:
+                self.conn.commit()
 
     def _incremental_update_inventory(self):
         """增量更新库存（仅处理新增交易，按账本隔离）"""
@@ -350,8 +369,9 @@ class Analytics:
 
         last_processed = self._last_processed_ids.get(ledger_id, 0)
         # 若该账本库存可能不完整（如多进程、重启后或首次加仓），先全量重建再同步，避免股数只显示最后一笔
+        # update_position 在新增交易的写事务内调用，重建时不提交，由调用方统一 commit/rollback
         if last_processed < transaction_id - 1:
-            self._rebuild_ledger_inventory(ledger_id, force_full=True)
+            self._rebuild_ledger_inventory(ledger_id, force_full=True, commit=False)
         else:
             # 增量：仅把当前交易加入该账本所对应的库存（只更新与成本法匹配的库存，避免 WAC 在 FIFO 账本下误报「创建空头寸」）
             cost_method = self.get_ledger_cost_method(ledger_id)
@@ -523,6 +543,136 @@ class Analytics:
                         ),
                     )
 
+    def _upsert_position_row(
+        self, cursor, ledger_id: int, account_id: int, code: str, pos_data: dict
+    ) -> bool:
+        """按库存汇总结果写入/删除单个 (账本, 账户, 代码) 的持仓行，返回该持仓是否保留
+
+        Args:
+            pos_data: 包含 name、currency、quantity、total_cost 的持仓汇总
+        """
+        total_quantity = pos_data["quantity"]
+        total_cost = pos_data["total_cost"]
+
+        # 计算平均成本
+        avg_cost = (
+            abs(total_cost / total_quantity)
+            if abs(total_quantity) > 0.0001
+            else 0.0
+        )
+
+        # 获取最新交易记录以获取名称、类别ID、当前价格、币种ID
+        cursor.execute(
+            """
+            SELECT name, category_id, price, currency_id
+            FROM transactions
+            WHERE ledger_id = ? AND account_id = ? AND code = ?
+            ORDER BY date DESC, id DESC
+            LIMIT 1
+        """,
+            (ledger_id, account_id, code),
+        )
+        trans_row = cursor.fetchone()
+
+        if trans_row:
+            pos_data["name"] = trans_row[0] or pos_data["name"]
+            pos_data["category_id"] = trans_row[1]
+            current_price = trans_row[2] or 0.0
+            pos_data["currency_id"] = trans_row[3]
+        else:
+            current_price = avg_cost if avg_cost > 0 else 0.0
+            pos_data["category_id"] = None
+            pos_data["currency_id"] = None
+            # 从 inv 的币种代码解析 currency_id
+            _cur_code = pos_data.get("currency") or "CNY"
+            cursor.execute(
+                "SELECT id FROM currencies WHERE code = ? LIMIT 1",
+                (_cur_code,),
+            )
+            r = cursor.fetchone()
+            pos_data["currency_id"] = r[0] if r else None
+        if not pos_data.get("category_id") or not pos_data.get(
+            "currency_id"
+        ):
+            if not pos_data.get("category_id"):
+                cursor.execute(
+                    "SELECT id FROM categories ORDER BY id LIMIT 1"
+                )
+                r = cursor.fetchone()
+                pos_data["category_id"] = r[0] if r else None
+            if not pos_data.get("currency_id"):
+                cursor.execute(
+                    "SELECT id FROM currencies WHERE code = 'CNY' LIMIT 1"
+                )
+                r = cursor.fetchone()
+                pos_data["currency_id"] = r[0] if r else None
+
+        cursor.execute(
+            """
+            SELECT id FROM positions
+            WHERE ledger_id = ? AND account_id = ? AND code = ?
+        """,
+            (ledger_id, account_id, code),
+        )
+        existing_position = cursor.fetchone()
+
+        kept = bool(
+            abs(total_quantity) > 0.0001
+            and pos_data.get("category_id")
+            and pos_data.get("currency_id")
+        )
+        if kept:
+            if existing_position:
+                cursor.execute(
+                    """
+                    UPDATE positions
+                    SET quantity = ?, avg_cost = ?, current_price = ?,
+                        name = ?, category_id = ?, currency_id = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE ledger_id = ? AND account_id = ? AND code = ?
+                """,
+                    (
+                        total_quantity,
+                        avg_cost,
+                        current_price,
+                        pos_data["name"],
+                        pos_data["category_id"],
+                        pos_data["currency_id"],
+                        ledger_id,
+                        account_id,
+                        code,
+                    ),
+                )
+            else:
+                cursor.execute(
+                    """
+                    INSERT INTO positions (ledger_id, account_id, code, name, category_id, currency_id,
+                                          quantity, avg_cost, current_price)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                    (
+                        ledger_id,
+                        account_id,
+                        code,
+                        pos_data["name"],
+                        pos_data["category_id"],
+                        pos_data["currency_id"],
+                        total_quantity,
+                        avg_cost,
+                        current_price,
+                    ),
+                )
+        else:
+            # 清空持仓（数量为0或接近0）
+            if existing_position:
+                cursor.execute(
+                    """
+                    DELETE FROM positions
+                    WHERE ledger_id = ? AND account_id = ? AND code = ?
+                """,
+                    (ledger_id, account_id, code),
+                )
+        return kept
+
     def rebuild_all_positions(self):
         """重建所有持仓（从库存管理器同步到数据库）
 
@@ -604,126 +754,10 @@ class Analytics:
                 # 同步持仓到数据库
                 for key, pos_data in position_dict.items():
                     ledger_id, account_id, code = key
-                    total_quantity = pos_data["quantity"]
-                    total_cost = pos_data["total_cost"]
-
-                    # 计算平均成本
-                    avg_cost = (
-                        abs(total_cost / total_quantity)
-                        if abs(total_quantity) > 0.0001
-                        else 0.0
-                    )
-
-                    # 获取最新交易记录以获取名称、类别ID、当前价格、币种ID
-                    cursor.execute(
-                        """
-                        SELECT name, category_id, price, currency_id
-                        FROM transactions
-                        WHERE ledger_id = ? AND account_id = ? AND code = ?
-                        ORDER BY date DESC, id DESC
-                        LIMIT 1
-                    """,
-                        (ledger_id, account_id, code),
-                    )
-                    trans_row = cursor.fetchone()
-
-                    if trans_row:
-                        pos_data["name"] = trans_row[0] or pos_data["name"]
-                        pos_data["category_id"] = trans_row[1]
-                        current_price = trans_row[2] or 0.0
-                        pos_data["currency_id"] = trans_row[3]
-                    else:
-                        current_price = avg_cost if avg_cost > 0 else 0.0
-                        pos_data["category_id"] = None
-                        pos_data["currency_id"] = None
-                        # 从 inv 的币种代码解析 currency_id
-                        _cur_code = pos_data.get("currency") or "CNY"
-                        cursor.execute(
-                            "SELECT id FROM currencies WHERE code = ? LIMIT 1",
-                            (_cur_code,),
-                        )
-                        r = cursor.fetchone()
-                        pos_data["currency_id"] = r[0] if r else None
-                    if not pos_data.get("category_id") or not pos_data.get(
-                        "currency_id"
-                    ):
-                        if not pos_data.get("category_id"):
-                            cursor.execute(
-                                "SELECT id FROM categories ORDER BY id LIMIT 1"
-                            )
-                            r = cursor.fetchone()
-                            pos_data["category_id"] = r[0] if r else None
-                        if not pos_data.get("currency_id"):
-                            cursor.execute(
-                                "SELECT id FROM currencies WHERE code = 'CNY' LIMIT 1"
-                            )
-                            r = cursor.fetchone()
-                            pos_data["currency_id"] = r[0] if r else None
-
-                    cursor.execute(
-                        """
-                        SELECT id FROM positions
-                        WHERE ledger_id = ? AND account_id = ? AND code = ?
-                    """,
-                        (ledger_id, account_id, code),
-                    )
-                    existing_position = cursor.fetchone()
-
-                    if (
-                        abs(total_quantity) > 0.0001
-                        and pos_data.get("category_id")
-                        and pos_data.get("currency_id")
+                    if self._upsert_position_row(
+                        cursor, ledger_id, account_id, code, pos_data
                     ):
-                        positions_to_keep.add((ledger_id, account_id, code))
-                        if existing_position:
-                            cursor.execute(
-                                """
-                                UPDATE positions
-                                SET quantity = ?, avg_cost = ?, current_price = ?,
-                                    name = ?, category_id = ?, currency_id = ?, updated_at = CURRENT_TIMESTAMP
-                                WHERE ledger_id = ? AND account_id = ? AND code = ?
-                            """,
-                                (
-                                    total_quantity,
-                                    avg_cost,
-                                    current_price,
-                                    pos_data["name"],
-                                    pos_data["category_id"],
-                                    pos_data["currency_id"],
-                                    ledger_id,
-                                    account_id,
-                                    code,
-                                ),
-                            )
-                        else:
-                            cursor.execute(
-                                """
-                                INSERT INTO positions (ledger_id, account_id, code, name, category_id, currency_id,
-                                                      quantity, avg_cost, current_price)
-                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            """,
-                                (
-                                    ledger_id,
-                                    account_id,
-                                    code,
-                                    pos_data["name"],
-                                    pos_data["category_id"],
-                                    pos_data["currency_id"],
-                                    total_quantity,
-                                    avg_cost,
-                                    current_price,
-                                ),
-                            )
-                    else:
-                        # 清空持仓（数量为0或接近0）
-                        if existing_position:
-                            cursor.execute(
-                                """
-                                DELETE FROM positions
-                                WHERE ledger_id = ? AND account_id = ? AND code = ?
-                            """,
-                                (ledger_id, account_id, code),
-                            )
+                        positions_to_keep.add(key)
 
             # 删除不再存在的持仓（不在库存中的持仓）
             cursor.execute("""
@@ -748,6 +782,85 @@ class Analytics:
             self.conn.rollback()
             raise
 
+    def rebuild_positions_for(self, keys):
+        """仅重建受影响的 (账本ID, 账户ID, 代码) 持仓
+
+        修改/删除单笔交易时使用：清空并重放相关 (账本, 代码) 的库存后只同步这些持仓行，
+        代价与受影响证券的交易数成正比，而不是全部交易。
+
+        Args:
+            keys: (ledger_id, account_id, code) 的可迭代对象，修改交易时应同时包含修改前后的值
+        """
+        codes_by_ledger: Dict[int, set] = {}
+        accounts_by_ledger: Dict[int, set] = {}
+        for ledger_id, account_id, code in keys:
+            codes_by_ledger.setdefault(int(ledger_id), set()).add(str(code))
+            accounts_by_ledger.setdefault(int(ledger_id), set()).add(int(account_id))
+
+        try:
+            cursor = self.conn.cursor()
+            for ledger_id, codes in codes_by_ledger.items():
+                inventory_manager = self._get_inventory_manager(ledger_id)
+                # 先补齐该账本尚未处理的新交易（未加载过的账本会在此全量重建）
+                self._rebuild_ledger_inventory(ledger_id)
+
+                for code in codes:
+                    inventory_manager.inventory.pop((ledger_id, code), None)
+                inventory_manager.realized_pl_details[:] = [
+                    d
+                    for d in inventory_manager.realized_pl_details
+                    if not (d.ledger_id == ledger_id and str(d.code) in codes)
+                ]
+                placeholders = ",".join("?" * len(codes))
+                df = pd.read_sql_query(
+                    _INVENTORY_TRANSACTIONS_SQL
+                    + f" AND t.code IN ({placeholders}) AND t.id <= ? ORDER BY t.date, t.id",
+                    self.conn,
+                    params=[ledger_id, *codes, self._last_processed_ids.get(ledger_id, 0)],
+                )
+                if not df.empty:
+                    inventory_manager.add_stock_from_df(self._prepare_transaction_df(df))
+
+                cursor.execute(
+                    "SELECT id, name FROM accounts WHERE ledger_id = ?", (ledger_id,)
+                )
+                account_ids = {name: account_id for account_id, name in cursor.fetchall()}
+                position_dict = {}
+                for code in codes:
+                    for inv in inventory_manager.get_inventory_list(ledger_id, code):
+                        account_id = account_ids.get(inv["账户"])
+                        if account_id is None:
+                            continue
+                        pos_data = position_dict.setdefault(
+                            (account_id, code),
+                            {
+                                "name": inv.get("名称", ""),
+                                "currency": inv.get("币种", "CNY"),
+                                "quantity": 0.0,
+                                "total_cost": 0.0,
+                            },
+                        )
+                        pos_data["quantity"] += float(inv["数量"])
+                        pos_data["total_cost"] += float(inv["账面价值"])
+                # 库存已清空的受影响持仓也要同步（删除对应持仓行）
+                for account_id in accounts_by_ledger[ledger_id]:
+                    for code in codes:
+                        position_dict.setdefault(
+                            (account_id, code),
+                            {"name": "", "currency": "CNY", "quantity": 0.0, "total_cost": 0.0},
+                        )
+
+                for (account_id, code), pos_data in position_dict.items():
+                    self._upsert_position_row(
+                        cursor, ledger_id, account_id, code, pos_data
+                    )
+
+            self.conn.commit()
+        except Exception as e:
+            logging.error(f"重建持仓时发生错误: {e}")
+            self.conn.rollback()
+            raise
+
     def _get_position_cost_cny_map(
         self, ledger_id: Optional[int] = None, account_id: Optional[int] = None
     ) -> dict:
@@ -876,9 +989,35 @@ class Analytics:
                 - profit_rate: 收益率（%）
                 - position_count: 持仓数量
         """
-        positions = self.get_positions(ledger_id, account_id)
+        # 只取汇总所需的列，不构造 DataFrame；cost_cny 依赖库存计算，无法完全下推到 SQL
+        query = """
+            SELECT
+                p.ledger_id,
+                a.name as account_name,
+                p.code,
+                p.quantity * p.avg_cost as cost,
+                p.quantity * p.current_price as market_value,
+                c.exchange_rate
+            FROM positions p
+            LEFT JOIN accounts a ON p.account_id = a.id
+            LEFT JOIN currencies c ON p.currency_id = c.id
+            WHERE p.quantity > 0
+        """
+        params = []
 
-        if positions.empty:
+        if ledger_id:
+            query += " AND p.ledger_id = ?"
+            params.append(ledger_id)
+
+        if account_id:
+            query += " AND p.account_id = ?"
+            params.append(account_id)
+
+        cursor = self.conn.cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+
+        if not rows:
             return {
                 "total_cost": 0,
                 "total_value": 0,
@@ -890,22 +1029,36 @@ class Analytics:
                 "position_count": 0,
             }
 
-        total_cost_cny = positions["cost_cny"].sum()
-        total_value_cny = positions["market_value_cny"].sum()
+        cost_cny_map = self._get_position_cost_cny_map(ledger_id, account_id)
+        total_cost = total_value = total_cost_cny = total_value_cny = 0.0
+        # 与 pandas 求和一致：NULL 参与的项视为缺失，跳过
+        for lid, account_name, code, cost, value, rate in rows:
+            if cost is not None:
+                total_cost += cost
+            if value is not None:
+                total_value += value
+                if rate is not None:
+                    total_value_cny += value * rate
+            cost_cny = cost_cny_map.get((lid, account_name, code))
+            if cost_cny is None and cost is not None and rate is not None:
+                cost_cny = cost * rate
+            if cost_cny is not None:
+                total_cost_cny += cost_cny
+
         total_profit_cny = total_value_cny - total_cost_cny
         profit_rate = (
             (total_profit_cny / total_cost_cny * 100) if total_cost_cny > 0 else 0
         )
 
         return {
-            "total_cost": positions["cost"].sum(),
-            "total_value": positions["market_value"].sum(),
+            "total_cost": total_cost,
+            "total_value": total_value,
             "total_cost_cny": total_cost_cny,
             "total_value_cny": total_value_cny,
-            "total_profit": positions["market_value"].sum() - positions["cost"].sum(),
+            "total_profit": total_value - total_cost,
             "total_profit_cny": total_profit_cny,
             "profit_rate": profit_rate,
-            "position_count": len(positions),
+            "position_count": len(rows),
         }
 
     def get_realized_pl(
@@ -1020,12 +1173,19 @@ class Analytics:
     def get_exchange_rate(self, currency: str) -> float:
         """获取汇率
 
+        与按日期汇率共用进程内缓存及其失效规则，同一次写入中的多次折算只查询一次
+
         Args:
             currency: 币种代码
 
         Returns:
             float: 汇率（相对于人民币）
         """
+        self._expire_rate_cache()
+        return self._current_rate(currency)
+
+    def _lookup_exchange_rate(self, currency: str) -> float:
+        """查询币种当前汇率，无记录时按 1.0 处理"""
         cursor = self.conn.cursor()
         cursor.execute(
             "SELECT exchange_rate FROM currencies WHERE code = ?", (currency,)
@@ -1072,9 +1232,30 @@ class Analytics:
         row = cursor.fetchone()
         return float(row[0]) if row else None
 
+    def _lookup_rate_at_date(self, currency: str, date: str) -> float:
+        """查询指定日期适用的汇率：该日及之前最新的历史汇率，无则回退到当前汇率"""
+        rate = self.get_latest_rate_before_date(currency, date)
+        if rate is None:
+            rate = self._current_rate(currency)
+        return rate
+
+    def invalidate_rate_cache(self) -> None:
+        """汇率（当前汇率或历史汇率）变更后清空按日期缓存的汇率"""
+        self._rate_at_date.cache_clear()
+        self._current_rate.cache_clear()
+        self._rate_cache_time = time.monotonic()
+
+    def _expire_rate_cache(self) -> None:
+        """汇率缓存超过 _FX_CACHE_TTL 秒后整体失效，以便读到其他进程写入的汇率"""
+        if time.monotonic() - self._rate_cache_time > _FX_CACHE_TTL:
+            self.invalidate_rate_cache()
+
     def convert_to_cny_at_date(self, amount: float, currency: str, date: str) -> float:
         """按指定日期的汇率转换为人民币，若无历史汇率则回退到当前汇率
 
+        同一 (币种, 日期) 的汇率及当前汇率在进程内缓存，本进程写入汇率时立即失效，
+        其他进程的写入最迟在 _FX_CACHE_TTL 秒后生效。
+
         Args:
             amount: 金额
             currency: 币种代码
@@ -1083,10 +1264,51 @@ class Analytics:
         Returns:
             float: 人民币金额
         """
-        rate = self.get_latest_rate_before_date(currency, date)
-        if rate is None:
-            rate = self.get_exchange_rate(currency)
-        return amount * rate
+        self._expire_rate_cache()
+        return amount * self._rate_at_date(currency, date)
+
+    def convert_to_cny_batched(self, rows) -> List[float]:
+        """批量按日期汇率折算人民币，与逐条调用 convert_to_cny_at_date / convert_to_cny 结果一致
+
+        (币种, 日期) 组合按 _FX_BATCH_PAIRS 分批，每批一条 SQL 取回「该日及之前最新的历史汇率」，
+        无历史汇率（或日期为空）时回退到当前汇率。
+
+        Args:
+            rows: (金额, 币种代码, 日期) 的列表，日期可为空
+
+        Returns:
+            List[float]: 与 rows 顺序一致的人民币金额
+        """
+        # 有日期的人民币汇率恒为 1，无需查询
+        pairs = list(
+            dict.fromkeys(
+                (code, date or None)
+                for _, code, date in rows
+                if not (code == "CNY" and date)
+            )
+        )
+        rates = {}
+        cursor = self.conn.cursor()
+        for start in range(0, len(pairs), _FX_BATCH_PAIRS):
+            batch = pairs[start:start + _FX_BATCH_PAIRS]
+            union = " UNION ALL ".join(["SELECT ? AS code, ? AS date"] * len(batch))
+            cursor.execute(
+                f"""
+                SELECT q.code, q.date,
+                    (SELECT h.rate FROM exchange_rate_history h
+                     WHERE h.currency_code = q.code AND h.date <= q.date
+                     ORDER BY h.date DESC LIMIT 1),
+                    (SELECT c.exchange_rate FROM currencies c WHERE c.code = q.code)
+                FROM ({union}) q
+            """,
+                [v for pair in batch for v in pair],
+            )
+            for code, date, hist_rate, current_rate in cursor.fetchall():
+                if hist_rate is not None:
+                    rates[(code, date)] = float(hist_rate)
+                else:
+                    rates[(code, date)] = current_rate if current_rate is not None else 1.0
+        return [amount * rates.get((code, date or None), 1.0) for amount, code, date in rows]
 
     def get_accounts(self) -> pd.DataFrame:
         """获取账户列表（辅助方法）
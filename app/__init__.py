@@ -9,10 +9,12 @@ import os
 import logging
 from flask import Flask, request
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 
 from app.config import get_config_path
+from app.extensions import preload_db_module, release_db
 from app.auth_middleware import get_token_from_request, verify_token
-from app.utils import api_error
+from app.utils import OrjsonProvider, api_error
 from app.blueprints.main import main_bp
 from app.blueprints.auth import auth_bp
 from app.blueprints.ledgers import ledgers_bp
@@ -25,7 +27,7 @@ from app.blueprints.market import market_bp
 from app.blueprints.analysis import analysis_bp
 from app.blueprints.plugins_bp import plugins_bp
 from app.plugins.manager import PluginManager
-from app.plugins.registry import PluginRegistry
+from app.plugins.registry import REGISTRY
 
 
 def create_app(config_path: str | None = None) -> Flask:
@@ -45,6 +47,7 @@ def create_app(config_path: str | None = None) -> Flask:
 
     # 不注册 Flask 自带的 /frontend 静态路由，改由 main 蓝图统一提供（便于对 styles.css 做合并等优化）
     app = Flask(__name__, static_folder=None, static_url_path=None)
+    app.json = OrjsonProvider(app)
 
     # 1. 加载配置
     app.config["CONFIG_PATH"] = config_path
@@ -60,12 +63,20 @@ def create_app(config_path: str | None = None) -> Flask:
         if not _api_only and isinstance(cfg.get("server"), dict):
             _api_only = cfg["server"].get("api_only", False)
         app.config["API_ONLY"] = bool(_api_only)
+        # 静态文件交由反向代理发送：x-accel（Nginx X-Accel-Redirect）| x-sendfile（Apache/lighttpd）
+        _offload = os.environ.get("FINO_STATIC_OFFLOAD", "").strip().lower()
+        if not _offload and isinstance(cfg.get("server"), dict):
+            _offload = str(cfg["server"].get("static_offload") or "").strip().lower()
+        app.config["STATIC_OFFLOAD"] = _offload if _offload in ("x-accel", "x-sendfile") else None
+        app.config["USE_X_SENDFILE"] = app.config["STATIC_OFFLOAD"] == "x-sendfile"
     except Exception:
         app.config["SECRET_KEY"] = "investment_tracker_secret"
         app.config["API_ONLY"] = False
+        app.config["STATIC_OFFLOAD"] = None
 
     # 2. 初始化扩展
     CORS(app, supports_credentials=True)
+    app.teardown_appcontext(release_db)
 
     # 3. 认证：支持 (1) Session 登录 (2) API Token (Bearer)
     _EXEMPT_PATHS = [
@@ -91,6 +102,14 @@ def create_app(config_path: str | None = None) -> Flask:
             return None
         return api_error("未登录或 Token 已过期，请重新登录", 401)
 
+    # 统一异常处理：未捕获的异常记录堆栈并返回 JSON 500；HTTP 异常（404/405 等）保持原有响应
+    @app.errorhandler(Exception)
+    def handle_unexpected_error(e):
+        if isinstance(e, HTTPException):
+            return e
+        logging.getLogger(__name__).exception("%s %s 处理失败: %s", request.method, request.path, e)
+        return api_error(str(e), 500)
+
     # 4. 注册蓝图
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp)
@@ -115,7 +134,7 @@ def create_app(config_path: str | None = None) -> Flask:
     if plugin_center_enabled:
         app.register_blueprint(plugins_bp)
         app.plugin_manager = PluginManager(app)
-        app.plugin_registry = PluginRegistry()
+        app.plugin_registry = REGISTRY
         try:
             app.plugin_manager.load_and_register_all()
             logging.info("插件中心已开启，已加载 %d 个插件", len(app.plugin_manager._loaded))
@@ -167,5 +186,6 @@ def create_app(config_path: str | None = None) -> Flask:
         level=logging.INFO,
         format="%(asctime)s - %(levelname)s - %(message)s",
     )
+    preload_db_module()
 
     return app
@@ -6,7 +6,7 @@ import logging
 from flask import Blueprint, request
 
 from app.extensions import get_db
-from app.utils import api_error, api_success
+from app.utils import api_error, api_success, df_to_records
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +21,7 @@ def get_accounts():
     try:
         database = get_db()
         accounts = database.get_accounts(ledger_id)
-        accounts_list = accounts.to_dict(orient="records") if not accounts.empty else []
+        accounts_list = df_to_records(accounts)
         return api_success(data={"accounts": accounts_list})
     except Exception as e:
         logger.error(f"Get accounts error: {e}", exc_info=True)
@@ -622,7 +622,8 @@ def _chat_with_tools(base_url: str, api_key: str, model: str, messages: list, ma
                 executions.append({"code": "", "ok": False, "stdout": "", "error": "参数无效", "result": None})
                 continue
             out = run_python_sandbox(code=code, api_base=api_base, api_token=api_token, username=username, timeout=25)
-            current.append({"role": "tool", "tool_call_id": tid, "content": json.dumps(out)})
+            # 沙箱结果原样交给模型，不转义非 ASCII 字符以缩小大结果的消息体
+            current.append({"role": "tool", "tool_call_id": tid, "content": json.dumps(out, ensure_ascii=False)})
             executions.append({
                 "code": code,
                 "ok": out.get("ok", False),
@@ -6,7 +6,7 @@ import logging
 from flask import Blueprint, request
 
 from app.extensions import get_db
-from app.utils import api_error, api_success
+from app.utils import api_error, api_success, df_to_records
 
 logger = logging.getLogger(__name__)
 
@@ -31,7 +31,7 @@ def get_returns_analysis():
             drop_cols = ["id", "ledger_id", "created_at", "updated_at"]
             df = df.drop(columns=[c for c in drop_cols if c in df.columns])
             df["date"] = df["date"].astype(str)
-            nav_details = df.to_dict(orient="records")
+            nav_details = df_to_records(df)
 
         return api_success(data={
             "cumulative_return": return_rate,
@@ -6,7 +6,7 @@ import logging
 from flask import Blueprint, request
 
 from app.extensions import get_db
-from app.utils import api_error, api_success
+from app.utils import api_error, api_success, df_to_records
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +25,7 @@ def get_fund_transactions():
 
     try:
         database = get_db()
-        fund_transactions = database.get_fund_transactions(
+        fund_transactions, total_count = database.get_fund_transactions_page(
             ledger_id=ledger_id,
             account_id=account_id,
             trans_type=trans_type,
@@ -34,10 +34,11 @@ def get_fund_transactions():
             limit=limit,
             offset=offset,
         )
-        fund_list = fund_transactions.to_dict(orient="records") if not fund_transactions.empty else []
+        fund_list = df_to_records(fund_transactions)
 
         return api_success(data={
             "fund_transactions": fund_list,
+            "total": total_count,
             "limit": limit,
             "offset": offset,
         })
@@ -6,7 +6,7 @@ import logging
 from flask import Blueprint, request
 
 from app.extensions import get_db
-from app.utils import api_error, api_success
+from app.utils import api_error, api_success, df_to_records
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +21,7 @@ def get_ledgers():
     try:
         database = get_db()
         ledgers = database.get_ledgers(username)
-        ledgers_list = ledgers.to_dict(orient="records") if not ledgers.empty else []
+        ledgers_list = df_to_records(ledgers)
         return api_success(data={"ledgers": ledgers_list})
     except Exception as e:
         logger.error(f"Get ledgers error: {e}")
@@ -2,14 +2,104 @@
 主蓝图 - 健康检查、首页、静态文件、PWA 配置
 """
 
-from datetime import datetime
+from copy import deepcopy
+import json
+import mimetypes
 import os
-from flask import Blueprint, send_from_directory, current_app, request, jsonify, Response
+import re
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import quote
+from jinja2 import Template
+from werkzeug.security import safe_join
+from flask import Blueprint, send_from_directory, current_app, request, jsonify, Response, g, session
 
 from app.utils import api_success, api_error
+from utils.auth_config import load_config, save_config, is_admin, get_user
+from utils.db_config import (
+    get_database_config as get_db_cfg,
+    save_database_config as save_db_cfg,
+    test_postgresql_connection,
+    test_d1_connection,
+)
+from utils.email_sender import send_email
 
 main_bp = Blueprint("main", __name__)
 
+_GITHUB_LATEST_RELEASE_URL = "https://api.github.com/repos/nihilo-lu/fino/releases/latest"
+
+# 版本检测用的 HTTP 会话：复用到 api.github.com 的 TCP/TLS 连接，读超时与 5xx 自动重试
+_HTTP = requests.Session()
+_HTTP.mount("https://", HTTPAdapter(
+    pool_connections=2,
+    pool_maxsize=4,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+))
+
+# 最新 Release 状态：后台线程每 6 小时以 If-None-Match 条件请求刷新，接口只读内存
+_RELEASE_REFRESH_INTERVAL = 6 * 3600
+_RELEASE_FIRST_WAIT = 3
+_RELEASE_STATE = {"etag": None, "data": None, "fetched_at": None, "pid": None}
+_RELEASE_LOCK = threading.Lock()
+_RELEASE_READY = threading.Event()
+
+# config.yaml 解析结果缓存：按 (路径, mtime, 大小) 失效，只读共享，修改前需 deepcopy
+_CONFIG_CACHE = {"key": None, "cfg": None}
+_CONFIG_LOCK = threading.Lock()
+
+
+def _load_config_cached(config_path):
+    """读取 config.yaml（文件未变化时复用上次解析结果）。返回的 dict 不可原地修改。"""
+    try:
+        st = os.stat(config_path)
+        key = (config_path, st.st_mtime_ns, st.st_size)
+    except (OSError, TypeError):
+        return None
+    with _CONFIG_LOCK:
+        if _CONFIG_CACHE["key"] == key:
+            return _CONFIG_CACHE["cfg"]
+        cfg = load_config(config_path)
+        _CONFIG_CACHE.update(key=key, cfg=cfg)
+        return cfg
+
+
+def _save_config_cached(config_path, cfg):
+    """写回 config.yaml，成功后直接用内存中的 cfg 更新缓存，避免下一次读取重新解析 YAML"""
+    if not save_config(config_path, cfg):
+        return False
+    try:
+        st = os.stat(config_path)
+    except OSError:
+        return True
+    with _CONFIG_LOCK:
+        _CONFIG_CACHE.update(key=(config_path, st.st_mtime_ns, st.st_size), cfg=cfg)
+    return True
+
+
+@main_bp.before_app_request
+def _load_current_user():
+    """为 /api/* 请求解析当前会话用户，写入 g.username / g.user / g.is_admin / g.config"""
+    g.username = None
+    g.user = {}
+    g.is_admin = False
+    g.config = None
+    if not request.path.startswith("/api/"):
+        return None
+    username = session.get("username")
+    if not username:
+        return None
+    cfg = _load_config_cached(current_app.config.get("CONFIG_PATH")) or {}
+    user = get_user(cfg, username) or {}
+    g.username = username
+    g.user = user
+    g.is_admin = is_admin(user.get("roles"))
+    g.config = cfg
+    return None
+
+
 _DEFAULT_PWA = {
     "name": "投资追踪器",
     "short_name": "投资追踪",
@@ -23,24 +113,34 @@ _DEFAULT_PWA = {
 }
 
 
+def _merge_pwa(cfg):
+    """将 config 中的 pwa 段合并到默认值上"""
+    pwa = (cfg or {}).get("pwa") or {}
+    out = _DEFAULT_PWA.copy()
+    for k, v in pwa.items():
+        if v is not None and v != "":
+            out[k] = v
+    return out
+
+
 def _get_pwa_config():
     """从 config.yaml 读取 PWA 配置，合并默认值"""
     try:
-        from utils.auth_config import load_config
-        cfg = load_config(current_app.config.get("CONFIG_PATH"))
-        pwa = (cfg or {}).get("pwa") or {}
-        out = _DEFAULT_PWA.copy()
-        for k, v in pwa.items():
-            if v is not None and v != "":
-                out[k] = v
-        return out
+        return _merge_pwa(_load_config_cached(current_app.config.get("CONFIG_PATH")))
     except Exception:
         return _DEFAULT_PWA
 
 
+# /api/health 与 /api/pwa/config 的预序列化响应体，避免每次请求走 jsonify
+_HEALTH_PREFIX = b'{"status":"ok","success":true,"timestamp":"'
+_HEALTH_SUFFIX = b'"}'
+_PWA_BODY = {"entry": (None, None)}  # (config 对象, 序列化字节)
+
+
 @main_bp.route("/api/health", methods=["GET"])
 def health_check():
-    return api_success(data={"status": "ok", "timestamp": datetime.now().isoformat()})
+    ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()).encode()
+    return Response(_HEALTH_PREFIX + ts + _HEALTH_SUFFIX, mimetype="application/json")
 
 
 def _parse_version(v):
@@ -55,6 +155,18 @@ def _parse_version(v):
         return (0, 0, 0)
 
 
+_VERSION = None
+
+
+def _get_version():
+    """当前应用版本（app 包导入本模块，故延迟读取并缓存）"""
+    global _VERSION
+    if _VERSION is None:
+        from app import __version__
+        _VERSION = __version__
+    return _VERSION
+
+
 def _version_lt(current, latest):
     """判断 current 是否小于 latest"""
     return _parse_version(current) < _parse_version(latest)
@@ -63,39 +175,71 @@ def _version_lt(current, latest):
 @main_bp.route("/api/version", methods=["GET"])
 def get_version():
     """获取当前版本（需登录）"""
-    from flask import session
-    if not session.get("username"):
+    if not g.username:
         return api_error("未登录", 401)
-    from app import __version__
-    return api_success(data={"version": __version__})
+    return api_success(data={"version": _get_version()})
 
 
-@main_bp.route("/api/check-update", methods=["GET"])
-def check_update():
-    """检测是否有新版本（需登录，从 GitHub Releases 获取）"""
-    from flask import session
-    if not session.get("username"):
-        return api_error("未登录", 401)
-    from app import __version__
-    current = __version__
-    latest = None
-    release_url = None
-    release_notes = None
+def _refresh_latest_release():
+    """请求 GitHub 最新 Release 并更新 _RELEASE_STATE；304 仅刷新时间，失败时保留上次结果"""
+    with _RELEASE_LOCK:
+        etag, data = _RELEASE_STATE["etag"], _RELEASE_STATE["data"]
+    headers = {"Accept": "application/vnd.github.v3+json", "User-Agent": "fino-check-update"}
+    if etag and data:
+        headers["If-None-Match"] = etag
     try:
-        import urllib.request
-        req = urllib.request.Request(
-            "https://api.github.com/repos/nihilo-lu/fino/releases/latest",
-            headers={"Accept": "application/vnd.github.v3+json", "User-Agent": "fino-check-update"}
+        resp = _HTTP.get(_GITHUB_LATEST_RELEASE_URL, headers=headers, timeout=(3, 8))
+        if resp.status_code == 304:
+            with _RELEASE_LOCK:
+                _RELEASE_STATE["fetched_at"] = time.time()
+            return
+        resp.raise_for_status()
+        obj = resp.json()
+        data = (
+            obj.get("tag_name", "").lstrip("vV"),
+            obj.get("html_url", ""),
+            (obj.get("body") or "")[:500],
         )
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = resp.read()
-        import json
-        obj = json.loads(data)
-        latest = obj.get("tag_name", "").lstrip("vV")
-        release_url = obj.get("html_url", "")
-        release_notes = (obj.get("body") or "")[:500]
+        with _RELEASE_LOCK:
+            _RELEASE_STATE.update(etag=resp.headers.get("ETag"), data=data, fetched_at=time.time())
     except Exception:
         pass
+    finally:
+        _RELEASE_READY.set()
+
+
+def _release_check_loop():
+    while True:
+        _refresh_latest_release()
+        time.sleep(_RELEASE_REFRESH_INTERVAL)
+
+
+def _ensure_release_checker():
+    """在当前进程启动版本检测后台线程（按 pid 判断，fork 出的 worker 各自启动一次）"""
+    pid = os.getpid()
+    with _RELEASE_LOCK:
+        if _RELEASE_STATE["pid"] == pid:
+            return
+        _RELEASE_STATE["pid"] = pid
+    threading.Thread(target=_release_check_loop, name="fino-release-check", daemon=True).start()
+
+
+def _get_latest_release():
+    """读取最新 Release (latest, release_url, release_notes)，尚未获取到时 latest 为 None"""
+    _ensure_release_checker()
+    # 仅进程内首次调用时短暂等待第一次拉取结果
+    _RELEASE_READY.wait(timeout=_RELEASE_FIRST_WAIT)
+    with _RELEASE_LOCK:
+        return _RELEASE_STATE["data"] or (None, None, None)
+
+
+@main_bp.route("/api/check-update", methods=["GET"])
+def check_update():
+    """检测是否有新版本（需登录，从 GitHub Releases 获取）"""
+    if not g.username:
+        return api_error("未登录", 401)
+    current = _get_version()
+    latest, release_url, release_notes = _get_latest_release()
     if not latest:
         return api_success(data={
             "current": current,
@@ -117,23 +261,28 @@ def check_update():
 @main_bp.route("/api/pwa/config", methods=["GET"])
 def get_pwa_config():
     """获取 PWA 配置（公开，供 manifest 和前端使用）"""
-    return api_success(data=_get_pwa_config())
+    try:
+        cfg = _load_config_cached(current_app.config.get("CONFIG_PATH"))
+    except Exception:
+        return api_success(data=_DEFAULT_PWA)
+    # 配置未变化（缓存命中同一对象）时直接复用上次序列化的字节
+    src, data = _PWA_BODY["entry"]
+    if data is None or src is not cfg:
+        body = {"success": True, **_merge_pwa(cfg)}
+        data = json.dumps(body, sort_keys=True, separators=(",", ":")).encode()
+        _PWA_BODY["entry"] = (cfg, data)
+    return Response(data, mimetype="application/json")
 
 
 @main_bp.route("/api/database/config", methods=["GET"])
 def get_database_config():
     """获取数据库配置（仅管理员）"""
-    from flask import session
-    if not session.get("username"):
+    if not g.username:
         return api_error("未登录", 401)
-    from utils.auth_config import load_config, is_admin, get_user
-    cfg = load_config(current_app.config.get("CONFIG_PATH"))
-    user = get_user(cfg or {}, session["username"])
-    if not is_admin(user.get("roles")):
+    if not g.is_admin:
         return api_error("仅管理员可查看", 403)
     try:
-        from utils.db_config import get_database_config
-        db_cfg = get_database_config(current_app.config.get("CONFIG_PATH"))
+        db_cfg = get_db_cfg(current_app.config.get("CONFIG_PATH"))
         # 不返回 api_token 全文，仅返回掩码
         out = {
             "type": db_cfg["type"],
@@ -153,16 +302,11 @@ def get_database_config():
 @main_bp.route("/api/database/config", methods=["PUT"])
 def save_database_config():
     """保存数据库配置（仅管理员）"""
-    from flask import session
-    if not session.get("username"):
+    if not g.username:
         return api_error("未登录", 401)
-    from utils.auth_config import load_config, is_admin, get_user
-    cfg = load_config(current_app.config.get("CONFIG_PATH"))
-    user = get_user(cfg or {}, session["username"])
-    if not is_admin(user.get("roles")):
+    if not g.is_admin:
         return api_error("仅管理员可修改", 403)
     try:
-        from utils.db_config import save_database_config as save_db_cfg, get_database_config as get_db_cfg
         body = request.get_json() or {}
         db_type = body.get("type", "sqlite")
         d1_cfg = body.get("d1", {})
@@ -195,19 +339,14 @@ def save_database_config():
 @main_bp.route("/api/database/test", methods=["POST"])
 def test_database_connection():
     """测试数据库连接（仅管理员）"""
-    from flask import session
-    if not session.get("username"):
+    if not g.username:
         return api_error("未登录", 401)
-    from utils.auth_config import load_config, is_admin, get_user
-    cfg = load_config(current_app.config.get("CONFIG_PATH"))
-    user = get_user(cfg or {}, session["username"])
-    if not is_admin(user.get("roles")):
+    if not g.is_admin:
         return api_error("仅管理员可测试", 403)
     try:
         body = request.get_json() or {}
         db_type = body.get("type", "sqlite")
         if db_type == "postgresql":
-            from utils.db_config import test_postgresql_connection
             pg = body.get("postgresql", {})
             ok, msg = test_postgresql_connection(
                 host=pg.get("host", "localhost"),
@@ -218,7 +357,6 @@ def test_database_connection():
                 sslmode=pg.get("sslmode", "prefer"),
             )
         elif db_type == "d1":
-            from utils.db_config import test_d1_connection
             d1 = body.get("d1", {})
             ok, msg = test_d1_connection(
                 account_id=d1.get("account_id", ""),
@@ -236,22 +374,21 @@ def test_database_connection():
 @main_bp.route("/api/pwa/config", methods=["PUT"])
 def save_pwa_config():
     """保存 PWA 配置（需登录）"""
-    from flask import session
-    if not session.get("username"):
+    if not g.username:
         return api_error("未登录", 401)
     try:
-        from utils.auth_config import load_config, save_config
         body = request.get_json() or {}
-        cfg = load_config(current_app.config.get("CONFIG_PATH")) or {}
+        cfg = deepcopy(g.config or {})
         if "pwa" not in cfg:
             cfg["pwa"] = {}
         allowed = {"name", "short_name", "description", "theme_color", "background_color", "display", "icon_192", "icon_512", "favicon"}
         for k, v in body.items():
             if k in allowed and v is not None:
                 cfg["pwa"][k] = str(v).strip() if isinstance(v, str) else v
-        if not save_config(current_app.config.get("CONFIG_PATH"), cfg):
+        # 内容未变化时跳过写盘，避免无谓的 YAML 输出与 mtime 变化导致缓存失效
+        if cfg != g.config and not _save_config_cached(current_app.config.get("CONFIG_PATH"), cfg):
             return api_error("保存配置失败", 500)
-        return api_success(data=_get_pwa_config(), message="PWA 配置已保存")
+        return api_success(data=_merge_pwa(cfg), message="PWA 配置已保存")
     except Exception as e:
         return api_error(str(e), 500)
 
@@ -259,13 +396,10 @@ def save_pwa_config():
 @main_bp.route("/api/settings/plugin-center", methods=["GET"])
 def get_plugin_center_setting():
     """获取插件中心是否开启（需登录）"""
-    from flask import session
-    if not session.get("username"):
+    if not g.username:
         return api_error("未登录", 401)
     try:
-        from utils.auth_config import load_config
-        cfg = load_config(current_app.config.get("CONFIG_PATH")) or {}
-        lab = cfg.get("lab") or {}
+        lab = (g.config or {}).get("lab") or {}
         enabled = lab.get("plugin_center_enabled", True)
         return api_success(data={"enabled": bool(enabled)})
     except Exception as e:
@@ -275,21 +409,18 @@ def get_plugin_center_setting():
 @main_bp.route("/api/settings/plugin-center", methods=["PUT"])
 def save_plugin_center_setting():
     """保存插件中心开关（仅管理员）"""
-    from flask import session
-    if not session.get("username"):
+    if not g.username:
         return api_error("未登录", 401)
-    from utils.auth_config import load_config, save_config, is_admin, get_user
-    cfg = load_config(current_app.config.get("CONFIG_PATH"))
-    user = get_user(cfg or {}, session["username"])
-    if not is_admin(user.get("roles")):
+    if not g.is_admin:
         return api_error("仅管理员可修改", 403)
     try:
-        cfg = cfg or {}
+        cfg = deepcopy(g.config or {})
         if "lab" not in cfg:
             cfg["lab"] = {}
         body = request.get_json() or {}
         cfg["lab"]["plugin_center_enabled"] = bool(body.get("enabled", True))
-        if not save_config(current_app.config.get("CONFIG_PATH"), cfg):
+        # 内容未变化时跳过写盘，避免无谓的 YAML 输出与 mtime 变化导致缓存失效
+        if cfg != g.config and not _save_config_cached(current_app.config.get("CONFIG_PATH"), cfg):
             return api_error("保存配置失败", 500)
         return api_success(data={"enabled": cfg["lab"]["plugin_center_enabled"]}, message="已保存")
     except Exception as e:
@@ -308,28 +439,31 @@ _DEFAULT_EMAIL = {
 }
 
 
+def _merge_email(cfg):
+    """将 config 中的 lab.email 段合并到默认值上"""
+    lab = (cfg or {}).get("lab") or {}
+    email = lab.get("email") or {}
+    out = _DEFAULT_EMAIL.copy()
+    for k, v in email.items():
+        if k in out and v is not None:
+            if k == "smtp_port":
+                try:
+                    out[k] = int(v)
+                except (TypeError, ValueError):
+                    out[k] = 587
+            elif k == "use_tls":
+                out[k] = bool(v)
+            elif k == "require_verification_for_register":
+                out[k] = bool(v)
+            else:
+                out[k] = v
+    return out
+
+
 def _get_email_config():
     """从 config.yaml 读取邮件配置，合并默认值"""
     try:
-        from utils.auth_config import load_config
-        cfg = load_config(current_app.config.get("CONFIG_PATH"))
-        lab = (cfg or {}).get("lab") or {}
-        email = lab.get("email") or {}
-        out = _DEFAULT_EMAIL.copy()
-        for k, v in email.items():
-            if k in out and v is not None:
-                if k == "smtp_port":
-                    try:
-                        out[k] = int(v)
-                    except (TypeError, ValueError):
-                        out[k] = 587
-                elif k == "use_tls":
-                    out[k] = bool(v)
-                elif k == "require_verification_for_register":
-                    out[k] = bool(v)
-                else:
-                    out[k] = v
-        return out
+        return _merge_email(_load_config_cached(current_app.config.get("CONFIG_PATH")))
     except Exception:
         return _DEFAULT_EMAIL.copy()
 
@@ -337,13 +471,9 @@ def _get_email_config():
 @main_bp.route("/api/settings/email", methods=["GET"])
 def get_email_config():
     """获取邮件配置（仅管理员）"""
-    from flask import session
-    if not session.get("username"):
+    if not g.username:
         return api_error("未登录", 401)
-    from utils.auth_config import load_config, is_admin, get_user
-    cfg = load_config(current_app.config.get("CONFIG_PATH"))
-    user = get_user(cfg or {}, session["username"])
-    if not is_admin(user.get("roles")):
+    if not g.is_admin:
         return api_error("仅管理员可查看", 403)
     data = _get_email_config()
     if data.get("smtp_password"):
@@ -354,16 +484,12 @@ def get_email_config():
 @main_bp.route("/api/settings/email", methods=["PUT"])
 def save_email_config():
     """保存邮件配置（仅管理员）"""
-    from flask import session
-    if not session.get("username"):
+    if not g.username:
         return api_error("未登录", 401)
-    from utils.auth_config import load_config, save_config, is_admin, get_user
-    cfg = load_config(current_app.config.get("CONFIG_PATH"))
-    user = get_user(cfg or {}, session["username"])
-    if not is_admin(user.get("roles")):
+    if not g.is_admin:
         return api_error("仅管理员可修改", 403)
     try:
-        cfg = cfg or {}
+        cfg = deepcopy(g.config or {})
         if "lab" not in cfg:
             cfg["lab"] = {}
         if "email" not in cfg["lab"]:
@@ -385,9 +511,10 @@ def save_email_config():
                     cfg["lab"]["email"][k] = bool(v)
                 else:
                     cfg["lab"]["email"][k] = str(v).strip() if v is not None else ""
-        if not save_config(current_app.config.get("CONFIG_PATH"), cfg):
+        # 内容未变化时跳过写盘，避免无谓的 YAML 输出与 mtime 变化导致缓存失效
+        if cfg != g.config and not _save_config_cached(current_app.config.get("CONFIG_PATH"), cfg):
             return api_error("保存配置失败", 500)
-        data = _get_email_config()
+        data = _merge_email(cfg)
         if data.get("smtp_password"):
             data["smtp_password"] = "***"
         return api_success(data=data, message="邮件配置已保存")
@@ -395,32 +522,29 @@ def save_email_config():
         return api_error(str(e), 500)
 
 
+_EMAIL_RE = re.compile(r"^[^@]+@[^@]+\.[^@]+$")
+
+
 @main_bp.route("/api/settings/email/test", methods=["POST"])
 def send_test_email():
     """发送测试邮件（仅管理员）"""
-    from flask import session
-    if not session.get("username"):
+    if not g.username:
         return api_error("未登录", 401)
-    from utils.auth_config import load_config, is_admin, get_user
-    cfg = load_config(current_app.config.get("CONFIG_PATH"))
-    user = get_user(cfg or {}, session["username"])
-    if not is_admin(user.get("roles")):
+    if not g.is_admin:
         return api_error("仅管理员可操作", 403)
     body = request.get_json() or {}
-    to_email = (body.get("to_email") or "").strip() or (user.get("email") or "").strip()
+    to_email = (body.get("to_email") or "").strip() or (g.user.get("email") or "").strip()
     if not to_email:
         return api_error("请填写收件邮箱或在个人资料中设置邮箱", 400)
-    import re
-    if not re.match(r"^[^@]+@[^@]+\.[^@]+$", to_email):
+    if not _EMAIL_RE.match(to_email):
         return api_error("邮箱格式不正确", 400)
     ec = _get_email_config()
     if not ec.get("enabled") or not ec.get("smtp_host"):
         return api_error("请先启用并保存邮件配置", 400)
     # 密码可能在前端被掩码，需要从当前 config 读取真实密码
-    lab = (cfg or {}).get("lab") or {}
+    lab = (g.config or {}).get("lab") or {}
     lab_email = lab.get("email") or {}
     smtp_password = lab_email.get("smtp_password") or ""
-    from utils.email_sender import send_email
     ok, msg = send_email(
         smtp_host=ec["smtp_host"],
         smtp_port=int(ec.get("smtp_port", 587)),
@@ -462,7 +586,6 @@ def spa_pages():
 
 def _render_index(pwa):
     """渲染带 PWA 配置的首页"""
-    import os
     static_folder = current_app.config.get("STATIC_FOLDER", "frontend")
     html_path = os.path.join(static_folder, "index.html")
     with open(html_path, "r", encoding="utf-8") as f:
@@ -475,7 +598,6 @@ def _render_index(pwa):
     tpl = tpl.replace('<link rel="icon" type="image/png" sizes="192x192" href="/frontend/icons/icon-192.png">', '<link rel="icon" type="image/png" sizes="192x192" href="{{ favicon_href }}">')
     icon_192 = pwa.get("icon_192", "/frontend/icons/icon-192.png")
     favicon_href = (pwa.get("favicon") or "").strip() or icon_192
-    from jinja2 import Template
     return Template(tpl).render(
         name=pwa.get("name", "投资追踪器"),
         short_name=pwa.get("short_name", "投资追踪"),
@@ -517,7 +639,23 @@ def serve_sw():
     if current_app.config.get("API_ONLY"):
         return jsonify({"error": "Not found"}), 404
     static_folder = current_app.config.get("STATIC_FOLDER", "frontend")
-    return send_from_directory(static_folder, "sw.js", mimetype="application/javascript")
+    return _send_static_file(static_folder, "sw.js", "frontend", mimetype="application/javascript")
+
+
+def _send_static_file(directory, filename, internal_prefix, mimetype=None):
+    """
+    发送静态文件。server.static_offload 为 x-accel 时只返回 X-Accel-Redirect 头，
+    由 Nginx 的 internal location（/internal/<internal_prefix>/）以 sendfile 直接发送；
+    为 x-sendfile 时由 send_from_directory 按 USE_X_SENDFILE 输出 X-Sendfile 头。
+    """
+    if current_app.config.get("STATIC_OFFLOAD") != "x-accel":
+        return send_from_directory(directory, filename, mimetype=mimetype)
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        return jsonify({"error": "未找到"}), 404
+    resp = Response(mimetype=mimetype or mimetypes.guess_type(filename)[0] or "application/octet-stream")
+    resp.headers["X-Accel-Redirect"] = f"/internal/{internal_prefix}/{quote(filename)}"
+    return resp
 
 
 # 主站 CSS 合并列表（与 frontend/css/styles.css 中 @import 顺序一致），一次响应减少请求数
@@ -545,47 +683,64 @@ def serve_static(filename):
         resp.headers["Cache-Control"] = "public, max-age=3600"
         resp.headers["X-Served-As"] = "css-bundle"  # 便于确认命中合并逻辑
         return resp
-    return send_from_directory(static_folder, filename)
+    return _send_static_file(static_folder, filename, "frontend")
+
+
+# 插件目录与头像目录的 realpath 缓存：目录在安装时固定，只需解析一次
+_PLUGIN_DIRS: dict[tuple[str, str], str] = {}
+_AVATAR_DIRS: dict[str, str] = {}
+
+
+def _plugin_realpath(base_dir, plugin_id):
+    """返回插件目录的 realpath（须位于 base_dir 内且存在），否则返回 None；仅缓存命中结果"""
+    key = (base_dir, plugin_id)
+    real_plugin = _PLUGIN_DIRS.get(key)
+    if real_plugin is not None:
+        return real_plugin
+    real_plugin = os.path.realpath(os.path.join(base_dir, "plugins", plugin_id))
+    if not real_plugin.startswith(os.path.realpath(base_dir) + os.sep) or not os.path.isdir(real_plugin):
+        return None
+    _PLUGIN_DIRS[key] = real_plugin
+    return real_plugin
+
+
+def _file_within(real_dir, filename):
+    """返回 real_dir 下的文件路径；文件不存在或经符号链接解析后位于 real_dir 之外时返回 None"""
+    path = safe_join(real_dir, filename)
+    if path is None or not os.path.realpath(path).startswith(real_dir + os.sep):
+        return None
+    return path if os.path.isfile(path) else None
 
 
 @main_bp.route("/plugins/<plugin_id>/<path:filename>")
 def serve_plugin_static(plugin_id, filename):
     """提供插件目录下的静态文件（如 css、js），仅允许在插件目录内"""
-    import os
     if current_app.config.get("API_ONLY"):
         return jsonify({"error": "Not found"}), 404
-    static_folder = current_app.config.get("STATIC_FOLDER", "frontend")
-    base_dir = os.path.dirname(os.path.abspath(static_folder))
-    plugin_dir = os.path.join(base_dir, "plugins", plugin_id)
     if ".." in filename or ".." in plugin_id:
         return jsonify({"error": "非法路径"}), 400
-    real_plugin = os.path.realpath(plugin_dir)
-    real_base = os.path.realpath(base_dir)
-    if not real_plugin.startswith(real_base + os.sep) or not os.path.isdir(real_plugin):
-        return jsonify({"error": "未找到"}), 404
-    file_path = os.path.join(plugin_dir, filename)
-    real_file = os.path.realpath(file_path)
-    if not real_file.startswith(real_plugin + os.sep) and real_file != real_plugin:
+    static_folder = current_app.config.get("STATIC_FOLDER", "frontend")
+    real_plugin = _plugin_realpath(os.path.dirname(os.path.abspath(static_folder)), plugin_id)
+    if real_plugin is None:
         return jsonify({"error": "未找到"}), 404
-    if not os.path.isfile(real_file):
+    if _file_within(real_plugin, filename) is None:
         return jsonify({"error": "未找到"}), 404
-    return send_from_directory(plugin_dir, filename)
+    # 插件由插件中心在后端运行时安装，Nginx 侧没有对应目录，不走 X-Accel-Redirect
+    return send_from_directory(real_plugin, filename)
 
 
 @main_bp.route("/api/avatars/<path:filename>")
 def serve_avatar(filename):
     """提供用户头像静态文件"""
-    import os
     uploads = current_app.config.get("UPLOADS_FOLDER")
     if not uploads:
         return jsonify({"error": "未配置"}), 404
-    avatars_dir = os.path.join(uploads, "avatars")
     # 仅允许文件名，防止路径遍历
     if ".." in filename or "/" in filename or "\\" in filename:
         return jsonify({"error": "非法路径"}), 400
-    path = os.path.join(avatars_dir, filename)
-    real_path = os.path.realpath(path)
-    real_avatars = os.path.realpath(avatars_dir)
-    if not real_path.startswith(real_avatars + os.sep) or not os.path.isfile(real_path):
+    avatars_dir = _AVATAR_DIRS.get(uploads)
+    if avatars_dir is None:
+        avatars_dir = _AVATAR_DIRS[uploads] = os.path.realpath(os.path.join(uploads, "avatars"))
+    if _file_within(avatars_dir, filename) is None:
         return jsonify({"error": "未找到"}), 404
-    return send_from_directory(avatars_dir, filename)
+    return _send_static_file(avatars_dir, filename, "avatars")
@@ -3,15 +3,48 @@
 """
 
 import logging
+import threading
+from concurrent.futures import Future
 from flask import Blueprint, request
 
 from app.extensions import get_db
 from app.utils import api_error, api_success
+from utils.cache_utils import TTLCache
 
 logger = logging.getLogger(__name__)
 
 market_bp = Blueprint("market", __name__, url_prefix="/api")
 
+# 行情与汇率的进程内缓存：实时价格/汇率 60 秒，历史日期汇率 1 小时
+_PRICE_CACHE = TTLCache(maxsize=4096, ttl=60)
+_FX_CACHE = TTLCache(maxsize=256, ttl=60)
+_RATES_AT_DATE_CACHE = TTLCache(maxsize=1024, ttl=3600)
+
+# 进行中的行情请求：同一代码的并发请求共享一次上游查询
+_INFLIGHT: dict[str, Future] = {}
+_INFLIGHT_LOCK = threading.Lock()
+_INFLIGHT_TIMEOUT = 10
+
+
+def _single_flight(key, fn):
+    """同一 key 同时只执行一次 fn()，其余并发调用者等待并共享其结果或异常"""
+    with _INFLIGHT_LOCK:
+        fut = _INFLIGHT.get(key)
+        leader = fut is None
+        if leader:
+            fut = Future()
+            _INFLIGHT[key] = fut
+    if not leader:
+        return fut.result(timeout=_INFLIGHT_TIMEOUT)
+    try:
+        fut.set_result(fn())
+    except BaseException as e:
+        fut.set_exception(e)
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT.pop(key, None)
+    return fut.result()
+
 
 @market_bp.route("/market/price", methods=["POST"])
 def fetch_market_price():
@@ -21,15 +54,20 @@ def fetch_market_price():
     if not code:
         return api_error("股票代码为必填", 400)
 
+    price = _PRICE_CACHE.get(code)
+    if price is not None:
+        return api_success(data={"price": price})
+
     try:
         database = get_db()
-        price = database.fetch_market_price(code)
+        price = _single_flight(code, lambda: database.fetch_market_price(code))
         if price is not None:
+            _PRICE_CACHE.set(code, price)
             return api_success(data={"price": price})
         return api_error("无法获取价格", 500)
     except Exception as e:
         logger.error(f"Fetch market price error: {e}")
-        return cors_jsonify({"error": str(e)}, 500)
+        return api_error(str(e), 500)
 
 
 @market_bp.route("/exchange-rates", methods=["GET"])
@@ -38,9 +76,13 @@ def get_exchange_rates_at_date():
     date = request.args.get("date")
     if not date:
         return api_error("缺少参数 date（YYYY-MM-DD）", 400)
+    rates = _RATES_AT_DATE_CACHE.get(date)
+    if rates is not None:
+        return api_success(data={"rates": rates})
     try:
         database = get_db()
         rates = database.get_exchange_rates_at_date(date)
+        _RATES_AT_DATE_CACHE.set(date, rates)
         return api_success(data={"rates": rates})
     except Exception as e:
         logger.error(f"Get exchange rates at date error: {e}")
@@ -55,12 +97,17 @@ def fetch_exchange_rate():
     if not currency:
         return api_error("币种代码为必填", 400)
 
+    rate = _FX_CACHE.get(currency)
+    if rate is not None:
+        return api_success(data={"rate": rate})
+
     try:
         database = get_db()
         rate = database.fetch_exchange_rate_from_market(currency)
         if rate is not None:
+            _FX_CACHE.set(currency, rate)
             return api_success(data={"rate": rate})
         return api_error("无法获取汇率", 500)
     except Exception as e:
         logger.error(f"Fetch exchange rate error: {e}")
-        return cors_jsonify({"error": str(e)}, 500)
+        return api_error(str(e), 500)
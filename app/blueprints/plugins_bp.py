@@ -3,7 +3,7 @@
 """
 
 import logging
-from flask import Blueprint, request, current_app
+from flask import Blueprint, request, current_app, g, Response
 
 from app.utils import api_error, api_success
 
@@ -11,6 +11,9 @@ logger = logging.getLogger(__name__)
 
 plugins_bp = Blueprint("plugins", __name__, url_prefix="/api/plugins")
 
+# 前端清单的序列化缓存：((管理器, 版本戳), 响应字节)
+_FRONTEND_MANIFEST_CACHE = {"entry": (None, None)}
+
 
 def _get_manager():
     """获取插件管理器"""
@@ -23,14 +26,10 @@ def _get_registry():
 
 
 def _require_admin():
-    """检查管理员权限"""
-    from flask import session
-    from utils.auth_config import load_config, is_admin, get_user
-    if not session.get("username"):
+    """检查管理员权限（用户信息由 main 蓝图的 before_app_request 写入 g）"""
+    if not g.get("username"):
         return False, "未登录"
-    cfg = load_config(current_app.config.get("CONFIG_PATH"))
-    user = get_user(cfg or {}, session["username"])
-    if not is_admin(user.get("roles")):
+    if not g.get("is_admin"):
         return False, "仅管理员可操作"
     return True, None
 
@@ -44,7 +43,7 @@ def get_registry():
     reg = _get_registry()
     if not reg:
         return api_error("插件中心未初始化", 500)
-    plugins = reg.fetch_registry()
+    plugins = [dict(p) for p in reg.fetch_registry()]
     return api_success(data={"plugins": plugins})
 
 
@@ -57,7 +56,7 @@ def get_plugin_info(plugin_id):
     info = reg.get_plugin_info(plugin_id)
     if not info:
         return api_error("插件不存在", 404)
-    return api_success(data=info)
+    return api_success(data=dict(info))
 
 
 # ========== 已安装插件管理 ==========
@@ -138,19 +137,10 @@ def get_frontend_manifest():
     mgr = _get_manager()
     if not mgr:
         return api_success(data={"nav_items": [], "settings_tabs": [], "floating_widgets": []})
-    manifests = mgr.get_registered_manifests()
-    nav_items = []
-    settings_tabs = []
-    floating_widgets = []
-    for m in manifests:
-        if m.get("nav_item"):
-            nav_items.append({**m["nav_item"], "plugin_id": m["id"]})
-        if m.get("settings_tab"):
-            settings_tabs.append({**m["settings_tab"], "plugin_id": m["id"]})
-        if m.get("floating_widget"):
-            floating_widgets.append({**m["floating_widget"], "plugin_id": m["id"]})
-    return api_success(data={
-        "nav_items": nav_items,
-        "settings_tabs": settings_tabs,
-        "floating_widgets": floating_widgets,
-    })
+    stamp, buckets = mgr.get_frontend_buckets()
+    key = (id(mgr), stamp)
+    cached_key, body = _FRONTEND_MANIFEST_CACHE["entry"]
+    if body is None or cached_key != key:
+        body = current_app.json.dumps({"success": True, **buckets}).encode()
+        _FRONTEND_MANIFEST_CACHE["entry"] = (key, body)
+    return Response(body, mimetype="application/json")
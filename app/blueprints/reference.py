@@ -2,27 +2,40 @@
 参考数据蓝图 - 分类、币种
 """
 
+import hashlib
 import logging
-from flask import Blueprint, request
+from flask import Blueprint, Response, request
 
 from app.extensions import get_db
 from app.utils import api_error, api_success
+from utils.cache_utils import TTLCache
 
 logger = logging.getLogger(__name__)
 
 reference_bp = Blueprint("reference", __name__, url_prefix="/api")
 
+# 分类/币种列表的序列化响应缓存：(响应字节, ETag)
+# 分类写接口主动失效；币种由后台汇率任务更新，依赖 60 秒过期
+_REF_CACHE = TTLCache(maxsize=4, ttl=60)
+
+
+def _reference_response(name: str, loader) -> Response:
+    """返回缓存的参考数据列表响应，支持 If-None-Match 协商缓存"""
+    entry = _REF_CACHE.get(name)
+    if entry is None:
+        body = api_success(data={name: loader()}).get_data()
+        entry = (body, hashlib.md5(body).hexdigest())
+        _REF_CACHE.set(name, entry)
+    body, etag = entry
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
 
 @reference_bp.route("/categories", methods=["GET"])
 def get_categories():
-    try:
-        database = get_db()
-        categories = database.get_categories()
-        categories_list = categories.to_dict(orient="records") if not categories.empty else []
-        return api_success(data={"categories": categories_list})
-    except Exception as e:
-        logger.error(f"Get categories error: {e}")
-        return api_error(str(e), 500)
+    return _reference_response("categories", get_db().get_categories)
 
 
 @reference_bp.route("/categories", methods=["POST"])
@@ -34,15 +47,12 @@ def create_category():
     if not name:
         return api_error("类别名称为必填", 400)
 
-    try:
-        database = get_db()
-        result = database.add_category(name, description or None)
-        if result:
-            return api_success(message="类别创建成功")
-        return api_error("类别名称已存在", 400)
-    except Exception as e:
-        logger.error(f"Create category error: {e}")
-        return api_error(str(e), 500)
+    database = get_db()
+    result = database.add_category(name, description or None)
+    if result:
+        _REF_CACHE.pop("categories")
+        return api_success(message="类别创建成功")
+    return api_error("类别名称已存在", 400)
 
 
 @reference_bp.route("/categories/<int:category_id>", methods=["PUT"])
@@ -54,37 +64,24 @@ def update_category(category_id):
     if not name:
         return api_error("类别名称为必填", 400)
 
-    try:
-        database = get_db()
-        result = database.update_category(category_id, name, description or None)
-        if result:
-            return api_success(message="类别更新成功")
-        return api_error("更新失败，类别不存在或名称已存在", 404)
-    except Exception as e:
-        logger.error(f"Update category error: {e}")
-        return api_error(str(e), 500)
+    database = get_db()
+    result = database.update_category(category_id, name, description or None)
+    if result:
+        _REF_CACHE.pop("categories")
+        return api_success(message="类别更新成功")
+    return api_error("更新失败，类别不存在或名称已存在", 404)
 
 
 @reference_bp.route("/categories/<int:category_id>", methods=["DELETE"])
 def delete_category(category_id):
-    try:
-        database = get_db()
-        result = database.delete_category(category_id)
-        if result:
-            return api_success(message="类别删除成功")
-        return api_error("删除失败，类别不存在或已被交易/持仓使用", 400)
-    except Exception as e:
-        logger.error(f"Delete category error: {e}")
-        return api_error(str(e), 500)
+    database = get_db()
+    result = database.delete_category(category_id)
+    if result:
+        _REF_CACHE.pop("categories")
+        return api_success(message="类别删除成功")
+    return api_error("删除失败，类别不存在或已被交易/持仓使用", 400)
 
 
 @reference_bp.route("/currencies", methods=["GET"])
 def get_currencies():
-    try:
-        database = get_db()
-        currencies = database.get_currencies()
-        currencies_list = currencies.to_dict(orient="records") if not currencies.empty else []
-        return api_success(data={"currencies": currencies_list})
-    except Exception as e:
-        logger.error(f"Get currencies error: {e}")
-        return api_error(str(e), 500)
+    return _reference_response("currencies", get_db().get_currencies)
@@ -23,73 +23,92 @@ def get_transactions():
     end_date = request.args.get("end_date")
     limit = request.args.get("limit", type=int, default=50)
     offset = request.args.get("offset", type=int, default=0)
-
-    try:
-        database = get_db()
-        transactions = database.get_transactions(
-            ledger_id=ledger_id,
-            account_id=account_id,
-            trans_type=trans_type,
-            category=category,
-            start_date=start_date,
-            end_date=end_date,
-            limit=limit,
-            offset=offset,
-        )
-        transactions_list = transactions.to_dict(orient="records") if not transactions.empty else []
-
-        total_count = database.get_transactions_count(
-            ledger_id=ledger_id,
-            account_id=account_id,
-            trans_type=trans_type,
-            category=category,
-            start_date=start_date,
-            end_date=end_date,
-        )
-
-        return api_success(data={
-            "transactions": transactions_list,
-            "total": total_count,
-            "limit": limit,
-            "offset": offset,
-        })
-    except Exception as e:
-        logger.error(f"Get transactions error: {e}")
-        return api_error(str(e), 500)
+    # 游标分页（推荐）：传入上一页返回的 next_cursor，深翻页时不随 offset 变慢
+    after_date = request.args.get("after_date")
+    after_id = request.args.get("after_id", type=int)
+
+    database = get_db()
+    transactions_list, total_count = database.get_transactions_page(
+        ledger_id=ledger_id,
+        account_id=account_id,
+        trans_type=trans_type,
+        category=category,
+        start_date=start_date,
+        end_date=end_date,
+        limit=limit,
+        offset=offset,
+        after_date=after_date,
+        after_id=after_id,
+    )
+    next_cursor = None
+    if limit and len(transactions_list) == limit:
+        last = transactions_list[-1]
+        next_cursor = {"after_date": last["date"], "after_id": last["id"]}
+
+    return api_success(data={
+        "transactions": transactions_list,
+        "total": total_count,
+        "limit": limit,
+        "offset": offset,
+        "next_cursor": next_cursor,
+    })
+
+
+_REQUIRED = ("ledger_id", "account_id", "type", "code", "name", "date")
+_FIELDS = (
+    "ledger_id", "account_id", "type", "code", "name", "date",
+    "price", "quantity", "amount", "fee", "category", "currency", "notes",
+)
+_DEFAULTS = {"fee": 0, "currency": "CNY", "notes": ""}
+
+
+def _transaction_from_payload(data: dict) -> tuple[dict | None, list]:
+    """从请求体构建交易记录字典，返回 (交易字典, 缺失的必填字段)；有缺失时交易字典为 None"""
+    missing = [f for f in _REQUIRED if not data.get(f)]
+    if missing:
+        return None, missing
+    return {k: data.get(k, _DEFAULTS.get(k)) for k in _FIELDS}, missing
 
 
 @transactions_bp.route("/transactions", methods=["POST"])
 def create_transaction():
-    data = request.get_json()
+    data = request.get_json() or {}
+
+    transaction, missing = _transaction_from_payload(data)
+    if transaction is None:
+        return api_error(f"缺少必填字段: {', '.join(missing)}", 400)
+
+    database = get_db()
+    result = database.add_transaction(transaction)
+    if result:
+        return api_success(message="交易记录添加成功")
+    return api_error("添加交易记录失败", 500)
 
-    required_fields = ["ledger_id", "account_id", "type", "code", "name", "date"]
-    if not all(data.get(f) for f in required_fields):
-        return api_error("缺少必填字段", 400)
+
+@transactions_bp.route("/transactions/bulk", methods=["POST"])
+def create_transactions_bulk():
+    """批量添加交易记录（单个事务写入，适用于导入场景）"""
+    data = request.get_json() or {}
+    items = data.get("transactions")
+    if not items or not isinstance(items, list):
+        return api_error("请提供 transactions 数组", 400)
+
+    transactions = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            return api_error(f"第 {i + 1} 条交易格式错误", 400)
+        transaction, missing = _transaction_from_payload(item)
+        if transaction is None:
+            return api_error(f"第 {i + 1} 条交易缺少必填字段: {', '.join(missing)}", 400)
+        transactions.append(transaction)
 
     try:
         database = get_db()
-        transaction = {
-            "ledger_id": data.get("ledger_id"),
-            "account_id": data.get("account_id"),
-            "type": data.get("type"),
-            "code": data.get("code"),
-            "name": data.get("name"),
-            "date": data.get("date"),
-            "price": data.get("price"),
-            "quantity": data.get("quantity"),
-            "amount": data.get("amount"),
-            "fee": data.get("fee", 0),
-            "category": data.get("category"),
-            "currency": data.get("currency", "CNY"),
-            "notes": data.get("notes", ""),
-        }
-
-        result = database.add_transaction(transaction)
-        if result:
-            return api_success(message="交易记录添加成功")
-        return api_error("添加交易记录失败", 500)
+        if database.add_transactions(transactions):
+            return api_success(data={"count": len(transactions)}, message="交易记录添加成功")
+        return api_error("批量添加交易记录失败", 500)
     except Exception as e:
-        logger.error(f"Create transaction error: {e}")
+        logger.error(f"Bulk create transactions error: {e}")
         return api_error(str(e), 500)
 
 
@@ -111,26 +130,11 @@ def update_transaction(transaction_id):
     data = request.get_json()
     if not data:
         return api_error("请求体为空", 400)
-    required_fields = ["ledger_id", "account_id", "type", "code", "name", "date"]
-    if not all(data.get(f) for f in required_fields):
-        return api_error("缺少必填字段", 400)
+    transaction, missing = _transaction_from_payload(data)
+    if transaction is None:
+        return api_error(f"缺少必填字段: {', '.join(missing)}", 400)
     try:
         database = get_db()
-        transaction = {
-            "ledger_id": data.get("ledger_id"),
-            "account_id": data.get("account_id"),
-            "type": data.get("type"),
-            "code": data.get("code"),
-            "name": data.get("name"),
-            "date": data.get("date"),
-            "price": data.get("price"),
-            "quantity": data.get("quantity"),
-            "amount": data.get("amount"),
-            "fee": data.get("fee", 0),
-            "category": data.get("category"),
-            "currency": data.get("currency", "CNY"),
-            "notes": data.get("notes", ""),
-        }
         result = database.update_transaction(transaction_id, transaction)
         if result:
             return api_success(message="更新成功")
@@ -148,8 +152,7 @@ def batch_delete_transactions():
         return api_error("请提供 ids 数组", 400)
     try:
         database = get_db()
-        for i, tid in enumerate(ids):
-            database.delete_transaction(int(tid), rebuild_positions=(i == len(ids) - 1))
+        database.delete_transactions_bulk([int(tid) for tid in ids])
         return api_success(message="删除成功")
     except Exception as e:
         logger.error(f"Batch delete transactions error: {e}")
@@ -158,12 +161,8 @@ def batch_delete_transactions():
 
 @transactions_bp.route("/transactions/<int:transaction_id>", methods=["DELETE"])
 def delete_transaction(transaction_id):
-    try:
-        database = get_db()
-        result = database.delete_transaction(transaction_id)
-        if result:
-            return api_success(message="删除成功")
-        return api_error("删除失败", 404)
-    except Exception as e:
-        logger.error(f"Delete transaction error: {e}")
-        return api_error(str(e), 500)
+    database = get_db()
+    result = database.delete_transaction(transaction_id)
+    if result:
+        return api_success(message="删除成功")
+    return api_error("删除失败", 404)
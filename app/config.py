@@ -3,6 +3,7 @@
 支持从 config.yaml 加载，并可被环境变量覆盖
 """
 
+import functools
 import os
 from pathlib import Path
 
@@ -13,20 +14,33 @@ def get_config_path() -> str:
     return str(base_dir / "conf" / "config.yaml")
 
 
-def load_config_dict(config_path: str | None = None) -> dict:
-    """加载 YAML 配置为字典"""
-    path = config_path or get_config_path()
-    if not path or not os.path.exists(path):
-        return {}
+@functools.lru_cache(maxsize=8)
+def _parse_config_file(path: str, mtime_ns: int, size: int) -> dict:
+    """解析 YAML 配置；mtime/size 参与缓存键，文件修改后自动重新解析"""
     try:
         import yaml
-        from yaml.loader import SafeLoader
+        try:
+            from yaml import CSafeLoader as SafeLoader
+        except ImportError:
+            from yaml import SafeLoader
         with open(path, "r", encoding="utf-8") as f:
             return yaml.load(f, Loader=SafeLoader) or {}
     except Exception:
         return {}
 
 
+def load_config_dict(config_path: str | None = None) -> dict:
+    """加载 YAML 配置为字典（文件未变化时复用上次解析结果，返回的 dict 不可原地修改）"""
+    path = config_path or get_config_path()
+    if not path:
+        return {}
+    try:
+        st = os.stat(path)
+    except OSError:
+        return {}
+    return _parse_config_file(os.path.realpath(path), st.st_mtime_ns, st.st_size)
+
+
 class Config:
     """应用配置类 - 封装配置访问"""
 
@@ -3,16 +3,45 @@
 数据库等资源在首次使用时初始化，避免循环导入
 """
 
+import os
+import sys
+import threading
+
 from flask import g, current_app
 
+# 项目根目录加入导入路径（仅一次），以便导入根目录下的 database 模块
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+
+# 防止并发的首批请求重复创建 Database
+_db_init_lock = threading.Lock()
+
+
+def preload_db_module() -> None:
+    """预先导入 database 模块（pandas 等重依赖），避免首个请求承担导入耗时。
+
+    需在应用日志配置完成后调用：database 依赖的部分模块导入时会调用 logging.basicConfig。
+    """
+    import database  # noqa: F401
+
 
 def get_db():
     """获取数据库实例（按应用实例缓存）"""
-    if "database" not in current_app.extensions:
-        import sys
-        import os
-        sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-        from database import Database
-        config_path = current_app.config.get("CONFIG_PATH")
-        current_app.extensions["database"] = Database(config_path=config_path)
-    return current_app.extensions["database"]
+    database = current_app.extensions.get("database")
+    if database is None:
+        with _db_init_lock:
+            database = current_app.extensions.get("database")
+            if database is None:
+                from database import Database
+                config_path = current_app.config.get("CONFIG_PATH")
+                database = Database(config_path=config_path)
+                current_app.extensions["database"] = database
+    return database
+
+
+def release_db(exc=None):
+    """应用上下文结束时归还当前线程借用的数据库连接"""
+    database = current_app.extensions.get("database")
+    if database is not None:
+        database.release_connection()
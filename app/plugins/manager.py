@@ -12,11 +12,17 @@ import json
 import logging
 import os
 import sys
+import tempfile
 from pathlib import Path
 from typing import Any, Optional
 
 from app.plugins.interface import PluginInterface, PluginManifest
 
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -29,6 +35,15 @@ class PluginManager:
         self._loaded: dict[str, PluginInterface] = {}
         self._enabled: set[str] = set()
         self._base_dir: Optional[Path] = None
+        # enabled_plugins.json 解析缓存：((mtime_ns, size), 已启用集合)
+        self._enabled_cache: Optional[tuple[tuple[int, int], frozenset]] = None
+        # manifest 缓存：文件路径 -> ((mtime_ns, size), manifest)，避免每次发现都执行插件模块
+        self._manifest_cache: dict[str, tuple[tuple[int, int], dict]] = {}
+        # 前端清单分桶缓存：(版本戳, 分桶)，插件启用/禁用/加载时递增版本号使其失效
+        self._frontend_version = 0
+        self._frontend_buckets: Optional[tuple[tuple, dict]] = None
+        # 插件状态缓存：((plugins 目录 mtime, enabled_plugins.json mtime), 状态)，安装/卸载/启用/禁用时清空
+        self._state_cache: Optional[tuple[tuple, dict]] = None
         if app:
             self.init_app(app)
 
@@ -52,28 +67,58 @@ class PluginManager:
         return Path("conf") / "enabled_plugins.json"
 
     def _load_enabled_list(self) -> set[str]:
-        """加载已启用插件列表。若文件不存在，默认启用内置插件以保持向后兼容"""
+        """加载已启用插件列表（文件未变化时复用上次解析结果）。若文件不存在，默认启用内置插件以保持向后兼容"""
         path = self._get_enabled_list_path()
-        if not path.exists():
+        try:
+            st = path.stat()
+        except OSError:
             #  backward compat: 默认启用 AI 和网盘
             default_enabled = {"fino-ai-chat", "fino-cloudreve"}
             self._save_enabled_list(default_enabled)
             return default_enabled
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self._enabled_cache
+        if cached is not None and cached[0] == stamp:
+            return set(cached[1])
         try:
             with open(path, "r", encoding="utf-8") as f:
                 data = json.load(f)
-            return set(data.get("enabled", []))
+            enabled = set(data.get("enabled", []))
         except Exception as e:
             logger.warning("加载 enabled_plugins.json 失败: %s", e)
             return set()
+        self._enabled_cache = (stamp, frozenset(enabled))
+        return enabled
 
     def _save_enabled_list(self, enabled: set[str]) -> bool:
-        """保存已启用插件列表"""
+        """保存已启用插件列表（内容未变化时不写盘；写入临时文件后原子替换，避免中途崩溃损坏文件）"""
         path = self._get_enabled_list_path()
-        path.parent.mkdir(parents=True, exist_ok=True)
+        cached = self._enabled_cache
+        if cached is not None and cached[1] == enabled:
+            try:
+                st = path.stat()
+                if cached[0] == (st.st_mtime_ns, st.st_size):
+                    return True
+            except OSError:
+                pass
+        payload = {"enabled": list(enabled)}
+        if orjson is not None:
+            data = orjson.dumps(payload, option=orjson.OPT_INDENT_2)
+        else:
+            data = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
         try:
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump({"enabled": list(enabled)}, f, ensure_ascii=False, indent=2)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".enabled_plugins.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.chmod(tmp, 0o644)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            st = path.stat()
+            self._enabled_cache = ((st.st_mtime_ns, st.st_size), frozenset(enabled))
             return True
         except Exception as e:
             logger.error("保存 enabled_plugins.json 失败: %s", e)
@@ -87,10 +132,9 @@ class PluginManager:
         result = []
         if not os.path.isdir(self._plugins_dir):
             return result
-        for name in os.listdir(self._plugins_dir):
-            plugin_path = os.path.join(self._plugins_dir, name)
-            if not os.path.isdir(plugin_path):
-                continue
+        with os.scandir(self._plugins_dir) as it:
+            dirs = [(e.name, e.path) for e in it if e.is_dir()]
+        for name, plugin_path in dirs:
             # 查找 plugin.py 或 __init__.py
             for entry in ("plugin.py", "__init__.py"):
                 fp = os.path.join(plugin_path, entry)
@@ -107,13 +151,29 @@ class PluginManager:
         return result
 
     def _load_manifest_from_file(self, filepath: str, default_id: str) -> Optional[dict]:
-        """从插件文件加载 manifest（通过导入模块并调用 get_manifest）"""
+        """从插件文件加载 manifest（文件未变化时复用缓存，否则导入模块并调用 get_manifest）"""
         try:
-            spec = importlib.util.spec_from_file_location("plugin_temp", filepath)
+            st = os.stat(filepath)
+        except OSError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self._manifest_cache.get(filepath)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        manifest = self._exec_manifest(filepath)
+        if manifest is not None:
+            self._manifest_cache[filepath] = (stamp, manifest)
+        return manifest
+
+    def _exec_manifest(self, filepath: str) -> Optional[dict]:
+        """执行插件文件并读取 manifest；临时模块名按路径区分，读取后从 sys.modules 移除"""
+        mod_name = f"plugin_temp_{abs(hash(filepath))}"
+        try:
+            spec = importlib.util.spec_from_file_location(mod_name, filepath)
             if not spec or not spec.loader:
                 return None
             mod = importlib.util.module_from_spec(spec)
-            sys.modules["plugin_temp"] = mod
+            sys.modules[mod_name] = mod
             spec.loader.exec_module(mod)
             # 获取 Plugin 类实例
             plugin = getattr(mod, "Plugin", None) or getattr(mod, "plugin", None)
@@ -126,6 +186,8 @@ class PluginManager:
         except Exception as e:
             logger.debug("加载插件 manifest 失败 %s: %s", filepath, e)
             return None
+        finally:
+            sys.modules.pop(mod_name, None)
 
     def load_plugin(self, plugin_id: str) -> Optional[PluginInterface]:
         """加载单个插件实例"""
@@ -176,9 +238,11 @@ class PluginManager:
         if not self._save_enabled_list(enabled):
             return False
         self._enabled.add(plugin_id)
+        self._state_cache = None
         # 加载插件实例到 _loaded（用于 get_manifest 等）
         if plugin_id not in self._loaded:
             self._loaded[plugin_id] = plugin
+        self._invalidate_frontend()
         return True
 
     def disable_plugin(self, plugin_id: str) -> bool:
@@ -190,29 +254,37 @@ class PluginManager:
         if not self._save_enabled_list(enabled):
             return False
         self._enabled.discard(plugin_id)
+        self._state_cache = None
+        self._invalidate_frontend()
         # 注意：Flask 无法在运行时注销 blueprint，保持注册但通过 check_plugin_enabled 拦截请求
         # 保留 _loaded 中的插件实例以供 get_manifest 等查询
         return True
 
     def uninstall_plugin(self, plugin_id: str) -> bool:
         """卸载插件：从 plugins 目录移除插件文件夹"""
-        if plugin_id not in {p["id"] for p in self.discover_installed()}:
+        item = next((p for p in self.discover_installed() if p["id"] == plugin_id), None)
+        if item is None:
             return False
         if plugin_id in self._enabled:
             self.disable_plugin(plugin_id)
-        for item in self.discover_installed():
-            if item["id"] == plugin_id:
-                import shutil
-                path = item.get("path")
-                if path and os.path.isdir(path):
-                    try:
-                        shutil.rmtree(path)
-                        return True
-                    except OSError as e:
-                        logger.error("卸载插件失败 %s: %s", plugin_id, e)
-                        return False
+        import shutil
+        path = item.get("path")
+        if path and os.path.isdir(path):
+            self._forget_manifests(path)
+            self._state_cache = None
+            try:
+                shutil.rmtree(path)
+                return True
+            except OSError as e:
+                logger.error("卸载插件失败 %s: %s", plugin_id, e)
+                return False
         return False
 
+    def _forget_manifests(self, plugin_path: str) -> None:
+        """清除某插件目录下入口文件的 manifest 缓存"""
+        for entry in ("plugin.py", "__init__.py"):
+            self._manifest_cache.pop(os.path.join(plugin_path, entry), None)
+
     def install_builtin(self, plugin_id: str) -> bool:
         """安装内置插件：从 app.plugins.builtin 复制到 plugins 目录"""
         import shutil
@@ -226,6 +298,8 @@ class PluginManager:
         source = app_plugins / "builtin" / plugin_id
         if not source.is_dir():
             return False
+        self._forget_manifests(target)
+        self._state_cache = None
         try:
             shutil.copytree(str(source), target)
             return True
@@ -251,6 +325,7 @@ class PluginManager:
                     logger.exception("插件注册失败 %s: %s", plugin_id, e)
             else:
                 logger.warning("插件 %s 加载失败，已跳过", plugin_id)
+        self._invalidate_frontend()
 
     def get_registered_manifests(self) -> list[dict]:
         """获取当前已启用插件的 manifest 列表"""
@@ -265,11 +340,51 @@ class PluginManager:
             result.append(d)
         return result
 
+    def _invalidate_frontend(self) -> None:
+        """使前端清单分桶缓存失效"""
+        self._frontend_version += 1
+        self._frontend_buckets = None
+
+    def _enabled_list_mtime(self) -> Optional[int]:
+        """enabled_plugins.json 的修改时间（纳秒），用于感知其他进程对启用列表的修改"""
+        try:
+            return self._get_enabled_list_path().stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def get_frontend_buckets(self) -> tuple[tuple, dict]:
+        """
+        获取前端清单分桶（nav_items / settings_tabs / floating_widgets）
+        返回 (版本戳, 分桶)；仅在插件状态或启用列表文件变化后重建
+        """
+        stamp = (self._frontend_version, self._enabled_list_mtime())
+        cached = self._frontend_buckets
+        if cached is not None and cached[0] == stamp:
+            return cached
+        buckets = {"nav_items": [], "settings_tabs": [], "floating_widgets": []}
+        for m in self.get_registered_manifests():
+            for field, bucket in (("nav_item", "nav_items"), ("settings_tab", "settings_tabs"), ("floating_widget", "floating_widgets")):
+                if m.get(field):
+                    buckets[bucket].append({**m[field], "plugin_id": m["id"]})
+        self._frontend_buckets = (stamp, buckets)
+        return self._frontend_buckets
+
+    def _plugins_dir_mtime(self) -> Optional[int]:
+        """plugins 目录的修改时间（纳秒），子目录增删时变化"""
+        try:
+            return os.stat(self._plugins_dir).st_mtime_ns
+        except OSError:
+            return None
+
     def get_plugin_state(self) -> dict:
-        """获取插件状态概要（供 API 使用）"""
+        """获取插件状态概要（供 API 使用）；plugins 目录与启用列表均未变化时直接返回缓存"""
+        stamp = (self._plugins_dir_mtime(), self._enabled_list_mtime())
+        cached = self._state_cache
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
         installed = self.discover_installed()
         enabled = self._load_enabled_list()
-        return {
+        state = {
             "installed": [
                 {
                     "id": item["id"],
@@ -282,3 +397,5 @@ class PluginManager:
             ],
             "enabled": list(enabled),
         }
+        self._state_cache = (stamp, state)
+        return state
@@ -8,13 +8,24 @@ from __future__ import annotations
 
 import json
 import logging
+import os
+import pickle
+import tempfile
+import threading
 from pathlib import Path
-from typing import Any, Optional
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库 json
+    _json_loads = json.loads
 
 logger = logging.getLogger(__name__)
 
 # 内置插件中心数据（可替换为远程 JSON URL）
-DEFAULT_REGISTRY = [
+_BUILTIN_REGISTRY = [
     {
         "id": "fino-ai-chat",
         "name": "AI 智能助手",
@@ -52,15 +63,27 @@ DEFAULT_REGISTRY = [
 ]
 
 
+# 对外提供只读视图：条目在线程间共享，调用方不得修改（需要修改时先 dict(entry) 复制）
+DEFAULT_REGISTRY: tuple[Mapping[str, Any], ...] = tuple(MappingProxyType(d) for d in _BUILTIN_REGISTRY)
+
+
 class PluginRegistry:
     """插件中心 - 管理可安装插件的注册表"""
 
     def __init__(self, registry_url: Optional[str] = None):
         self.registry_url = registry_url
-        self._cache: Optional[list[dict]] = None
+        self._cache: Optional[list[Mapping[str, Any]]] = None
+        # id -> 插件信息索引，与 _cache 同时构建
+        self._index: dict[Any, Mapping[str, Any]] = {}
+        # 本地注册表路径在初始化时解析一次；解析结果按文件 mtime 缓存，文件变化时才重新读取
+        self._registry_path = self._resolve_registry_path()
+        self._mtime: Optional[int] = None
+        self._local_cache: list[dict] = []
+        # 重建缓存时加锁，避免并发请求同时解析注册表
+        self._lock = threading.Lock()
 
-    def get_registry_path(self) -> Optional[Path]:
-        """获取本地注册表文件路径（conf/plugin_registry.json）"""
+    @staticmethod
+    def _resolve_registry_path() -> Path:
         # 尝试从项目根推断
         for base in [Path.cwd(), Path(__file__).parent.parent.parent]:
             conf = base / "conf" / "plugin_registry.json"
@@ -68,40 +91,107 @@ class PluginRegistry:
                 return conf
         return Path("conf") / "plugin_registry.json"
 
+    def get_registry_path(self) -> Optional[Path]:
+        """获取本地注册表文件路径（conf/plugin_registry.json）"""
+        return self._registry_path
+
+    def _registry_mtime(self) -> Optional[int]:
+        """本地注册表文件的修改时间（纳秒），文件不存在时为 None"""
+        try:
+            return self._registry_path.stat().st_mtime_ns
+        except OSError:
+            return None
+
     def _load_local_registry(self) -> list[dict]:
-        """加载本地自定义注册表"""
-        path = self.get_registry_path()
-        if path and path.exists():
+        """加载本地自定义注册表（文件未变化时复用上次解析结果）"""
+        mtime = self._registry_mtime()
+        if mtime == self._mtime:
+            return self._local_cache
+        plugins: list[dict] = []
+        if mtime is not None:
+            cached = self._read_pickle_cache(mtime)
+            if cached is not None:
+                plugins = cached
+            else:
+                try:
+                    data = _json_loads(self._registry_path.read_bytes())
+                    plugins = data.get("plugins", [])
+                    self._write_pickle_cache(mtime, plugins)
+                except Exception as e:
+                    logger.warning("加载 plugin_registry.json 失败: %s", e)
+        self._mtime = mtime
+        self._local_cache = plugins
+        return plugins
+
+    def _pickle_cache_path(self) -> Path:
+        """解析结果缓存文件（conf/plugin_registry.cache.pkl），供多个 worker 进程共享"""
+        return self._registry_path.with_suffix(".cache.pkl")
+
+    def _read_pickle_cache(self, mtime: int) -> Optional[list[dict]]:
+        """读取与 JSON 文件 mtime 一致的解析缓存；不存在或已过期时返回 None"""
+        try:
+            with open(self._pickle_cache_path(), "rb") as f:
+                cached_mtime, plugins = pickle.load(f)
+        except Exception:
+            return None
+        return plugins if cached_mtime == mtime else None
+
+    def _write_pickle_cache(self, mtime: int, plugins: list[dict]) -> None:
+        """原子写入解析缓存；conf 目录不可写时静默跳过"""
+        path = self._pickle_cache_path()
+        try:
+            fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=".plugin_registry.", suffix=".tmp")
             try:
-                with open(path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                return data.get("plugins", [])
-            except Exception as e:
-                logger.warning("加载 plugin_registry.json 失败: %s", e)
-        return []
-
-    def fetch_registry(self) -> list[dict]:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump((mtime, plugins), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as e:
+            logger.debug("写入插件注册表缓存失败: %s", e)
+
+    def fetch_registry(self) -> list[Mapping[str, Any]]:
         """
-        获取插件中心完整列表
+        获取插件中心完整列表（条目为只读 Mapping）
         合并：内置 + 本地 conf/plugin_registry.json + 远程（若配置）
+        本地注册表文件未变化时直接返回缓存
         """
-        if self._cache is not None:
+        if self._cache is not None and self._registry_mtime() == self._mtime:
             return self._cache
+        with self._lock:
+            if self._cache is not None and self._registry_mtime() == self._mtime:
+                return self._cache
+            return self._rebuild()
+
+    def _rebuild(self) -> list[Mapping[str, Any]]:
+        """合并内置与本地注册表并重建索引（调用方持有 _lock）"""
         registry = list(DEFAULT_REGISTRY)
-        local = self._load_local_registry()
-        for p in local:
-            if not any(r.get("id") == p.get("id") for r in registry):
-                registry.append(p)
+        index = {r.get("id"): r for r in registry}
+        # 同 id 以先出现者为准（内置优先于本地）；缺少 id 或格式不对的本地条目无法安装/查询，直接跳过
+        for p in self._load_local_registry():
+            pid = p.get("id") if isinstance(p, dict) else None
+            if pid and pid not in index:
+                entry = MappingProxyType(p)
+                index[pid] = entry
+                registry.append(entry)
         self._cache = registry
+        self._index = index
         return registry
 
-    def get_plugin_info(self, plugin_id: str) -> Optional[dict]:
+    def get_plugin_info(self, plugin_id: str) -> Optional[Mapping[str, Any]]:
         """根据 id 获取插件信息"""
-        for p in self.fetch_registry():
-            if p.get("id") == plugin_id:
-                return p
-        return None
+        self.fetch_registry()
+        return self._index.get(plugin_id)
 
     def invalidate_cache(self) -> None:
         """清除缓存"""
-        self._cache = None
+        with self._lock:
+            self._cache = None
+            self._index = {}
+            self._mtime = None
+            self._local_cache = []
+
+
+# 进程内共享的插件中心实例
+REGISTRY = PluginRegistry()
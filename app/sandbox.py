@@ -6,7 +6,18 @@ import os
 import sys
 import json
 import logging
+import selectors
 import subprocess
+import threading
+import time
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库 json
+    _json_loads = json.loads
+
+from app.sandbox_pool import SandboxOutputTooLarge, SandboxPool, SandboxTimeout
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +25,105 @@ logger = logging.getLogger(__name__)
 DEFAULT_TIMEOUT = 25
 # 代码最大长度（字符）
 MAX_CODE_LENGTH = 16 * 1024
+# 子进程输出（stdout + stderr / 结果帧）最大字节数，超出即终止
+MAX_OUTPUT_BYTES = 4 * 1024 * 1024
+
+# 传给沙箱子进程的环境变量白名单（导入时取一次），其余父进程环境（数据库口令等）不下发
+_ENV_KEYS = (
+    "PATH", "PYTHONPATH", "PYTHONHOME", "SYSTEMROOT", "LANG", "LC_ALL", "LD_LIBRARY_PATH", "HOME", "TMPDIR",
+    "REQUESTS_CA_BUNDLE", "SSL_CERT_FILE", "HTTP_PROXY", "HTTPS_PROXY", "NO_PROXY", "http_proxy", "https_proxy", "no_proxy",
+)
+_BASE_ENV = {k: os.environ[k] for k in _ENV_KEYS if k in os.environ}
+
+_OUTPUT_TOO_LARGE = f"输出超过 {MAX_OUTPUT_BYTES // (1024 * 1024)} MB 上限，请减少 print 或 result 的数据量"
+
+# 常驻进程池（依赖 select 读管道，仅 POSIX 可用；FINO_SANDBOX_POOL=0 时每次启动新进程）
+_POOL_ENABLED = os.name == "posix" and os.environ.get("FINO_SANDBOX_POOL", "").strip().lower() not in ("0", "false", "no")
+_pool: SandboxPool | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(runner_script: str) -> SandboxPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SandboxPool(runner_script, max_output=MAX_OUTPUT_BYTES)
+    return _pool
+
+
+def _run_once(runner_script: str, code: str, env: dict, timeout: float) -> tuple[bytes, bytes]:
+    """启动一次性子进程执行代码，返回 (stdout, stderr)；超时抛出 SandboxTimeout，输出超限抛出 SandboxOutputTooLarge"""
+    proc = subprocess.Popen(
+        [sys.executable, "-u", runner_script],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+        cwd=os.path.dirname(runner_script),
+        bufsize=0,
+        close_fds=True,
+        start_new_session=os.name == "posix",
+    )
+    try:
+        if os.name != "posix":
+            # Windows 管道不支持 selectors，退回 communicate，事后检查大小
+            try:
+                out, err = proc.communicate(code.encode("utf-8"), timeout=timeout)
+            except subprocess.TimeoutExpired:
+                raise SandboxTimeout() from None
+            if len(out) + len(err) > MAX_OUTPUT_BYTES:
+                raise SandboxOutputTooLarge()
+            return out, err
+
+        deadline = time.monotonic() + timeout
+        # 代码不超过 MAX_CODE_LENGTH，runner 启动后先读完 stdin，直接写入即可
+        proc.stdin.write(code.encode("utf-8"))
+        proc.stdin.close()
+        bufs = {proc.stdout: bytearray(), proc.stderr: bytearray()}
+        total = 0
+        with selectors.DefaultSelector() as sel:
+            for stream in bufs:
+                sel.register(stream, selectors.EVENT_READ)
+            while sel.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise SandboxTimeout()
+                for key, _ in sel.select(remaining):
+                    chunk = os.read(key.fd, 65536)
+                    if not chunk:
+                        sel.unregister(key.fileobj)
+                        continue
+                    total += len(chunk)
+                    if total > MAX_OUTPUT_BYTES:
+                        raise SandboxOutputTooLarge()
+                    bufs[key.fileobj] += chunk
+        proc.wait(timeout=max(deadline - time.monotonic(), 0.1))
+        return bytes(bufs[proc.stdout]), bytes(bufs[proc.stderr])
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        for stream in (proc.stdin, proc.stdout, proc.stderr):
+            if stream and not stream.closed:
+                stream.close()
+
+
+def _result_from_payload(data: dict, stderr_text: str = "") -> dict:
+    """将 sandbox_runner 输出的 {"error", "stdout", "stderr", "result"} 转为对外返回格式
+
+    stderr_text 为一次性子进程自身的 stderr（常驻模式下为空），接在执行期间捕获的 stderr 之后
+    """
+    err = data.get("error")
+    out = data.get("stdout", "")
+    result = data.get("result")
+    if err:
+        return {"ok": False, "stdout": out, "result": result, "error": err}
+    stderr_text = (data.get("stderr", "") + "\n" + stderr_text).strip()
+    if stderr_text:
+        out = (out + "\n" + stderr_text).strip()
+    return {"ok": True, "stdout": out, "result": result, "error": None}
 
 
 def run_python_sandbox(
@@ -49,46 +159,48 @@ def run_python_sandbox(
     if not os.path.isfile(runner_script):
         return {"ok": False, "stdout": "", "result": None, "error": "沙箱运行器未找到"}
 
-    env = os.environ.copy()
-    env["SANDBOX_API_BASE"] = api_base
-    env["SANDBOX_API_TOKEN"] = api_token
-    env["SANDBOX_USERNAME"] = username or ""
+    env = {
+        **_BASE_ENV,
+        "SANDBOX_API_BASE": api_base,
+        "SANDBOX_API_TOKEN": api_token,
+        "SANDBOX_USERNAME": username or "",
+    }
+
+    if _POOL_ENABLED:
+        try:
+            reply = _get_pool(runner_script).run(code, env, (api_base, api_token, username or ""), timeout)
+        except SandboxTimeout:
+            return {"ok": False, "stdout": "", "result": None, "error": f"执行超时（{timeout} 秒）"}
+        except SandboxOutputTooLarge:
+            return {"ok": False, "stdout": "", "result": None, "error": _OUTPUT_TOO_LARGE}
+        except Exception as e:
+            logger.exception("Sandbox worker error")
+            return {"ok": False, "stdout": "", "result": None, "error": str(e)}
+        try:
+            return _result_from_payload(_json_loads(reply))
+        except json.JSONDecodeError:
+            return {"ok": False, "stdout": "", "result": None, "error": "沙箱输出格式异常"}
 
     try:
-        proc = subprocess.run(
-            [sys.executable, "-u", runner_script],
-            input=code.encode("utf-8"),
-            env=env,
-            capture_output=True,
-            timeout=timeout,
-            cwd=runner_dir,
-        )
-    except subprocess.TimeoutExpired:
+        stdout_raw, stderr_raw = _run_once(runner_script, code, env, timeout)
+    except SandboxTimeout:
         return {"ok": False, "stdout": "", "result": None, "error": f"执行超时（{timeout} 秒）"}
+    except SandboxOutputTooLarge:
+        return {"ok": False, "stdout": "", "result": None, "error": _OUTPUT_TOO_LARGE}
     except Exception as e:
         logger.exception("Sandbox subprocess error")
         return {"ok": False, "stdout": "", "result": None, "error": str(e)}
 
-    stderr_text = (proc.stderr or b"").decode("utf-8", errors="replace").strip()
-    stdout_raw = (proc.stdout or b"").decode("utf-8", errors="replace")
+    stderr_text = stderr_raw.decode("utf-8", errors="replace").strip()
 
-    # 最后一行应为 JSON
-    lines = stdout_raw.strip().split("\n")
-    last = lines[-1] if lines else ""
+    # 最后一行应为 JSON：只切出最后一行解析，完整输出仅在出错时解码
+    _, _, last = stdout_raw.strip().rpartition(b"\n")
     try:
-        data = json.loads(last)
-        err = data.get("error")
-        out = data.get("stdout", "")
-        result = data.get("result")
-        if err:
-            return {"ok": False, "stdout": out, "result": result, "error": err}
-        if stderr_text:
-            out = (out + "\n" + stderr_text).strip()
-        return {"ok": True, "stdout": out, "result": result, "error": None}
-    except json.JSONDecodeError:
+        return _result_from_payload(_json_loads(last), stderr_text)
+    except json.JSONDecodeError:  # orjson.JSONDecodeError 为其子类
         return {
             "ok": False,
-            "stdout": stdout_raw,
+            "stdout": stdout_raw.decode("utf-8", errors="replace"),
             "result": None,
             "error": stderr_text or "沙箱输出格式异常",
         }
@@ -0,0 +1,181 @@
+"""
+沙箱常驻进程池：复用已启动的 sandbox_runner 子进程，省去每次执行的解释器启动与 requests 导入。
+
+协议：父进程写入 4 字节长度（网络字节序）+ UTF-8 代码，子进程返回 4 字节长度 + JSON 结果。
+子进程按 (API 基地址, Token, 用户名) 区分，只复用给同一用户，避免不同用户之间共享进程状态。
+"""
+
+import atexit
+import logging
+import os
+import select
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_FRAME_HEADER = struct.Struct("!I")
+
+
+class SandboxTimeout(Exception):
+    """沙箱执行超时"""
+
+
+class SandboxOutputTooLarge(Exception):
+    """沙箱输出超过上限"""
+
+
+class _Worker:
+    """一个常驻的 sandbox_runner 子进程"""
+
+    __slots__ = ("proc", "key", "uses", "last_used")
+
+    def __init__(self, proc: subprocess.Popen, key: tuple):
+        self.proc = proc
+        self.key = key
+        self.uses = 0
+        self.last_used = time.monotonic()
+
+    def kill(self) -> None:
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=5)
+        except Exception:
+            pass
+        for stream in (self.proc.stdin, self.proc.stdout):
+            try:
+                if stream:
+                    stream.close()
+            except OSError:
+                pass
+
+
+class SandboxPool:
+    """
+    常驻沙箱进程池
+    - max_idle: 最多保留的空闲进程数，超出时回收最早使用的
+    - idle_ttl: 空闲超过该秒数的进程被回收
+    - max_uses: 单个进程执行次数上限，达到后回收，避免用户代码残留状态长期累积
+    - max_output: 单次结果帧最大字节数，超出时终止该进程
+    """
+
+    def __init__(
+        self,
+        runner_script: str,
+        max_idle: int = 4,
+        idle_ttl: float = 300.0,
+        max_uses: int = 100,
+        max_output: int = 4 * 1024 * 1024,
+    ):
+        self._runner_script = runner_script
+        self._max_output = max_output
+        self._max_idle = max_idle
+        self._idle_ttl = idle_ttl
+        self._max_uses = max_uses
+        self._idle: list[_Worker] = []
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def run(self, code: str, env: dict, key: tuple, timeout: float) -> bytes:
+        """
+        在常驻进程中执行代码，返回结果 JSON 字节
+        超时抛出 SandboxTimeout，结果超限抛出 SandboxOutputTooLarge，子进程异常抛出 OSError
+        """
+        worker = self._acquire(key, env)
+        try:
+            data = code.encode("utf-8")
+            self._write_all(worker, _FRAME_HEADER.pack(len(data)) + data)
+            deadline = time.monotonic() + timeout
+            (size,) = _FRAME_HEADER.unpack(self._read_exact(worker, _FRAME_HEADER.size, deadline))
+            if size > self._max_output:
+                raise SandboxOutputTooLarge()
+            reply = self._read_exact(worker, size, deadline)
+        except BaseException:
+            # 超时或通信失败的进程状态不可信，直接回收
+            worker.kill()
+            raise
+        self._release(worker)
+        return reply
+
+    def close(self) -> None:
+        """回收所有空闲进程"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for w in idle:
+            w.kill()
+
+    def _spawn(self, key: tuple, env: dict) -> _Worker:
+        proc = subprocess.Popen(
+            [sys.executable, "-u", self._runner_script],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env={**env, "SANDBOX_PERSISTENT": "1"},
+            cwd=os.path.dirname(self._runner_script),
+            bufsize=0,
+            close_fds=True,
+            start_new_session=True,
+        )
+        return _Worker(proc, key)
+
+    def _acquire(self, key: tuple, env: dict) -> _Worker:
+        now = time.monotonic()
+        expired = []
+        worker = None
+        with self._lock:
+            alive = []
+            for w in self._idle:
+                if w.proc.poll() is not None or now - w.last_used > self._idle_ttl:
+                    expired.append(w)
+                else:
+                    alive.append(w)
+            # 取同一 key 下最近使用的进程
+            for i in range(len(alive) - 1, -1, -1):
+                if alive[i].key == key:
+                    worker = alive.pop(i)
+                    break
+            self._idle = alive
+        for w in expired:
+            w.kill()
+        return worker or self._spawn(key, env)
+
+    def _release(self, worker: _Worker) -> None:
+        worker.uses += 1
+        worker.last_used = time.monotonic()
+        if worker.uses >= self._max_uses:
+            worker.kill()
+            return
+        evicted = []
+        with self._lock:
+            self._idle.append(worker)
+            while len(self._idle) > self._max_idle:
+                evicted.append(self._idle.pop(0))
+        for w in evicted:
+            w.kill()
+
+    @staticmethod
+    def _write_all(worker: _Worker, data: bytes) -> None:
+        fd = worker.proc.stdin.fileno()
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+
+    @staticmethod
+    def _read_exact(worker: _Worker, n: int, deadline: float) -> bytes:
+        fd = worker.proc.stdout.fileno()
+        buf = bytearray()
+        while len(buf) < n:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise SandboxTimeout()
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                raise SandboxTimeout()
+            chunk = os.read(fd, n - len(buf))
+            if not chunk:
+                raise OSError("沙箱进程意外退出")
+            buf += chunk
+        return bytes(buf)
@@ -7,79 +7,157 @@ import os
 import sys
 import json
 import io
+import re
+import struct
+from functools import partialmethod
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库 json
+    orjson = None
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:  # 未安装 requests 时沙箱仍可执行不访问 API 的代码
+    requests = None
 
 # 从环境变量读取，由父进程注入
 API_BASE = (os.environ.get("SANDBOX_API_BASE") or "").rstrip("/")
 API_TOKEN = os.environ.get("SANDBOX_API_TOKEN") or ""
 CURRENT_USERNAME = os.environ.get("SANDBOX_USERNAME") or ""
 
+# 允许访问的 URL：API_BASE 本身或其下路径（要求紧跟 / ? # 或结尾，防止 http://host:80 匹配 http://host:8080）
+_API_RE = re.compile(re.escape(API_BASE) + r"(?:[/?#]|$)") if API_BASE else None
+
+# 模型返回代码中常见的 JSON 转义序列及其还原字符
+_UNESCAPE_MAP = {"\\n": "\n", "\\t": "\t", "\\r": "\r", '\\"': '"', "\\'": "'"}
+_UNESCAPE_RE = re.compile(r"""\\[ntr"']""")
+
+# 受限 builtins：禁止 open/exec/eval 等；__import__ 在执行时注入，仅允许 requests 与 json
+_SAFE_BUILTIN_NAMES = frozenset((
+    "print", "len", "str", "int", "float", "list", "dict", "tuple", "set",
+    "range", "enumerate", "zip", "map", "filter", "sorted", "reversed",
+    "min", "max", "sum", "abs", "round", "isinstance", "bool", "type",
+    "None", "True", "False", "Exception", "KeyError", "ValueError", "IndexError",
+    "AssertionError", "AttributeError", "TypeError", "ZeroDivisionError",
+    "getattr", "setattr", "hasattr", "callable", "iter", "next",
+    "repr", "format", "ord", "chr", "divmod", "pow", "all", "any",
+    "slice", "object", "frozenset", "bytes",
+))
+_b = __builtins__ if isinstance(__builtins__, dict) else __builtins__.__dict__
+_SAFE_BUILTINS = {k: _b[k] for k in _SAFE_BUILTIN_NAMES if k in _b}
+del _b
+
+# result 最大嵌套层级
+_MAX_RESULT_DEPTH = 500
+
+# 常驻模式的帧头：4 字节无符号长度（网络字节序）
+_FRAME_HEADER = struct.Struct("!I")
+
+# 共享的 HTTP 会话：同一进程内的多次请求复用 TCP/TLS 连接（常驻进程在启动时即完成导入与创建）
+_SESSION = None
+if requests is not None:
+    _SESSION = requests.Session()
+    if API_BASE:
+        _SESSION.mount(API_BASE, HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0))
+
 
 def _allowed_request(method, url, **kwargs):
     """只允许请求 SANDBOX_API_BASE 下的 URL，并自动加上 Authorization"""
-    if not API_BASE or not url.startswith(API_BASE):
+    if _API_RE is None or not _API_RE.match(url):
         raise ValueError("仅允许请求当前应用的 API 地址")
     headers = kwargs.get("headers") or {}
     headers = dict(headers)
     headers["Authorization"] = f"Bearer {API_TOKEN}"
     kwargs["headers"] = headers
-    import requests as _requests
-    return _requests.request(method, url, **kwargs)
+    if _SESSION is None:
+        raise ImportError("沙箱环境未安装 requests")
+    return _SESSION.request(method, url, **kwargs)
 
 
 class SafeRequests:
     """仅允许访问 API_BASE 的 requests 封装"""
 
-    def get(self, path_or_url, **kwargs):
-        url = path_or_url if path_or_url.startswith("http") else f"{API_BASE}{path_or_url}"
-        return _allowed_request("GET", url, **kwargs)
-
-    def post(self, path_or_url, **kwargs):
-        url = path_or_url if path_or_url.startswith("http") else f"{API_BASE}{path_or_url}"
-        return _allowed_request("POST", url, **kwargs)
-
-    def put(self, path_or_url, **kwargs):
-        url = path_or_url if path_or_url.startswith("http") else f"{API_BASE}{path_or_url}"
-        return _allowed_request("PUT", url, **kwargs)
-
-    def delete(self, path_or_url, **kwargs):
-        url = path_or_url if path_or_url.startswith("http") else f"{API_BASE}{path_or_url}"
-        return _allowed_request("DELETE", url, **kwargs)
-
-
-def main():
+    @staticmethod
+    def _url(path_or_url):
+        return path_or_url if path_or_url.startswith("http") else API_BASE + path_or_url
+
+    def request(self, method, path_or_url, **kwargs):
+        return _allowed_request(method.upper(), self._url(path_or_url), **kwargs)
+
+    get = partialmethod(request, "GET")
+    post = partialmethod(request, "POST")
+    put = partialmethod(request, "PUT")
+    delete = partialmethod(request, "DELETE")
+
+
+def _dumps(payload) -> bytes:
+    """序列化结果为 UTF-8 JSON 字节"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload)
+        except TypeError:  # 超出 64 位的整数等，回退标准库
+            pass
+    return json.dumps(payload).encode("utf-8")
+
+
+def _emit(payload):
+    """将结果以单行 JSON 写到 stdout（父进程解析最后一行），直接输出 UTF-8 字节"""
+    sys.stdout.flush()
+    sys.stdout.buffer.write(_dumps(payload) + b"\n")
+    sys.stdout.flush()
+
+
+def _serializable(val):
+    """
+    将 result 转为可 JSON 序列化的结构：list/tuple 转 list，dict 键转 str，其他对象取 repr
+    用显式栈遍历代替递归；嵌套超过 _MAX_RESULT_DEPTH（含循环引用）时报错
+    """
+    root = [None]
+    stack = [(root, 0, val, 0)]
+    while stack:
+        parent, key, v, depth = stack.pop()
+        if v is None or isinstance(v, (bool, int, float, str)):
+            parent[key] = v
+            continue
+        if depth >= _MAX_RESULT_DEPTH:
+            raise ValueError("result 嵌套层级过深")
+        if isinstance(v, (list, tuple)):
+            out = [None] * len(v)
+            stack.extend((out, i, x, depth + 1) for i, x in enumerate(v))
+        elif isinstance(v, dict):
+            out = {}
+            items = []
+            for k, x in v.items():
+                sk = str(k)
+                out[sk] = None  # 先占位以保持键顺序
+                items.append((out, sk, x, depth + 1))
+            # 逆序入栈，出栈时按原顺序赋值，键冲突时仍以后出现者为准
+            stack.extend(reversed(items))
+        else:
+            out = repr(v)
+        parent[key] = out
+    return root[0]
+
+
+def _execute(code: str) -> dict:
+    """在受限环境中执行一段用户代码，返回 {"error", "stdout", "stderr", "result"}
+
+    stderr（如第三方库的警告）也在进程内捕获并随结果返回，常驻模式下子进程的 stderr 不被读取
+    """
     if not API_BASE:
-        out = json.dumps({"error": "SANDBOX_API_BASE 未设置", "stdout": "", "result": None})
-        print(out, flush=True)
-        sys.exit(1)
+        return {"error": "SANDBOX_API_BASE 未设置", "stdout": "", "stderr": "", "result": None}
 
-    code = sys.stdin.read()
     # 模型返回的代码常为 JSON 转义：字面量 \\n、\\"、\\' 等，需还原为真实字符，否则 exec 报 line continuation 等错误
-    code = (
-        code.replace("\\n", "\n")
-        .replace("\\t", "\t")
-        .replace("\\r", "\r")
-        .replace('\\"', '"')
-        .replace("\\'", "'")
-    )
+    code = _UNESCAPE_RE.sub(lambda m: _UNESCAPE_MAP[m.group(0)], code)
     out_capture = io.StringIO()
-    old_stdout = sys.stdout
-    sys.stdout = out_capture
-
-    # 受限 builtins：禁止 open/exec/eval 等；提供安全 __import__ 仅允许 requests 与 json
-    _b = __builtins__ if isinstance(__builtins__, dict) else __builtins__.__dict__
-    _safe = {
-        k: _b[k] for k in (
-            "print", "len", "str", "int", "float", "list", "dict", "tuple", "set",
-            "range", "enumerate", "zip", "map", "filter", "sorted", "reversed",
-            "min", "max", "sum", "abs", "round", "isinstance", "bool", "type",
-            "None", "True", "False", "Exception", "KeyError", "ValueError", "IndexError",
-            "AssertionError", "AttributeError", "TypeError", "ZeroDivisionError",
-            "getattr", "setattr", "hasattr", "callable", "iter", "next",
-            "repr", "format", "ord", "chr", "divmod", "pow", "all", "any",
-            "slice", "object", "list", "dict", "set", "frozenset", "bytes", "str", "int", "float",
-        )
-        if k in _b
-    }
+    err_capture = io.StringIO()
+    old_stdout, old_stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = out_capture, err_capture
+
+    # 每次执行复制一份，用户代码对 builtins 的修改不影响下一次执行
+    _safe = dict(_SAFE_BUILTINS)
 
     safe_globals = {
         "json": json,
@@ -97,36 +175,63 @@ def main():
         raise ImportError(f"仅允许 import requests 与 json，不允许: {name}")
     _safe["__import__"] = _safe_import
 
-    def _serializable(val):
-        if val is None or isinstance(val, (bool, int, float, str)):
-            return val
-        if isinstance(val, (list, tuple)):
-            return [_serializable(x) for x in val]
-        if isinstance(val, dict):
-            return {str(k): _serializable(v) for k, v in val.items()}
-        return repr(val)
-
     try:
         exec(code, safe_globals)
         result = safe_globals.get("result")
         result = _serializable(result)
     except Exception as e:
-        sys.stdout = old_stdout
-        out = json.dumps({
+        return {
             "error": str(e),
             "stdout": out_capture.getvalue(),
+            "stderr": err_capture.getvalue(),
             "result": None,
-        })
-        print(out, flush=True)
-        sys.exit(0)  # 不 exit(1)，以便父进程从 stdout 解析 JSON
+        }
+    finally:
+        sys.stdout, sys.stderr = old_stdout, old_stderr
 
-    sys.stdout = old_stdout
-    out = json.dumps({
+    return {
         "error": None,
         "stdout": out_capture.getvalue(),
+        "stderr": err_capture.getvalue(),
         "result": result,
-    })
-    print(out, flush=True)
+    }
+
+
+def _read_exact(stream, n: int) -> bytes:
+    """从流中读满 n 字节；对端关闭时返回已读部分"""
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = stream.read(n - len(buf))
+        if not chunk:
+            break
+        buf += chunk
+    return bytes(buf)
+
+
+def _serve():
+    """常驻模式：循环读取 4 字节长度 + 代码，返回 4 字节长度 + JSON 结果，stdin 关闭时退出"""
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    while True:
+        header = _read_exact(stdin, _FRAME_HEADER.size)
+        if len(header) < _FRAME_HEADER.size:
+            break
+        (size,) = _FRAME_HEADER.unpack(header)
+        code = _read_exact(stdin, size).decode("utf-8", errors="replace")
+        data = _dumps(_execute(code))
+        stdout.write(_FRAME_HEADER.pack(len(data)) + data)
+        stdout.flush()
+
+
+def main():
+    if os.environ.get("SANDBOX_PERSISTENT") == "1":
+        _serve()
+        return
+    if not API_BASE:
+        _emit(_execute(""))
+        sys.exit(1)
+    # 不以非 0 退出，以便父进程从 stdout 解析 JSON
+    _emit(_execute(sys.stdin.read()))
 
 
 if __name__ == "__main__":
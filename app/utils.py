@@ -3,7 +3,13 @@
 """
 
 from datetime import datetime, date
-from flask import jsonify
+from flask import current_app, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库 json
+    orjson = None
 
 
 def json_default(obj):
@@ -13,13 +19,90 @@ def json_default(obj):
     raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
 
 
-def cors_jsonify(data, status=200):
-    """返回带状态码的 JSON 响应（兼容旧用法）"""
-    response = jsonify(data)
+class OrjsonProvider(DefaultJSONProvider):
+    """基于 orjson 的 JSON 序列化，输出与默认实现一致（键排序、日期格式）
+
+    orjson 不支持的对象（如超出 64 位的整数）回退到标准库实现。
+    """
+
+    # 日期交给 DefaultJSONProvider.default 处理，保持 HTTP 日期格式；numpy 标量/数组直接序列化
+    _OPTIONS = (
+        (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY)
+        if orjson
+        else 0
+    )
+
+    def _orjson_dumps(self, obj) -> bytes | None:
+        if orjson is None:
+            return None
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._OPTIONS)
+        except TypeError:
+            return None
+
+    def dumps(self, obj, **kwargs) -> str:
+        if not kwargs:
+            data = self._orjson_dumps(obj)
+            if data is not None:
+                return data.decode()
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        # 调试模式下保留默认的缩进输出
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        data = self._orjson_dumps(self._prepare_response_obj(args, kwargs))
+        if data is None:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(data + b"\n", mimetype=self.mimetype)
+
+
+def df_to_records(df) -> list[dict]:
+    """DataFrame 转 list[dict]，等价于 to_dict(orient="records")，但按列批量转换而非逐格装箱"""
+    if df is None or df.empty:
+        return []
+    cols = list(df.columns)
+    # tolist() 直接产出 Python 原生类型；日期列先转 object 以保留 Timestamp 而非整数
+    values = [
+        (s.astype(object) if s.dtype.kind == "M" else s).tolist()
+        for _, s in df.items()
+    ]
+    return [dict(zip(cols, row)) for row in zip(*values)]
+
+
+def _orjson_dumps(obj) -> bytes | None:
+    """按 OrjsonProvider 的选项编码；orjson 不可用或对象不支持时返回 None"""
+    if orjson is None:
+        return None
+    try:
+        return orjson.dumps(obj, default=current_app.json.default, option=OrjsonProvider._OPTIONS)
+    except TypeError:
+        return None
+
+
+def _bytes_response(data: bytes, status=200):
+    # bytes 响应体由 werkzeug 自动设置 Content-Length
+    return current_app.response_class(data + b"\n", status=status, mimetype="application/json")
+
+
+def _json_response(body, status=200):
+    """
+    直接用 orjson 编码并构造响应，跳过 jsonify 的参数处理与调试模式判断（API 响应不做缩进美化）
+    orjson 不可用或对象不支持时回退 jsonify
+    """
+    data = _orjson_dumps(body)
+    if data is not None:
+        return _bytes_response(data, status)
+    response = jsonify(body)
     response.status_code = status
     return response
 
 
+def cors_jsonify(data, status=200):
+    """返回带状态码的 JSON 响应（兼容旧用法）"""
+    return _json_response(data, status)
+
+
 # ============ 统一 API 响应格式 ============
 # 成功: { success: true, data?: any, message?: string }
 # 失败: { success: false, error: string }
@@ -27,6 +110,14 @@ def cors_jsonify(data, status=200):
 
 def api_success(data=None, message: str | None = None, status=200):
     """统一成功响应。data 为 dict 时合并到顶层，便于前端直接使用 data.ledgers 等"""
+    # data 为 dict 时直接拼接编码结果，省去合并到新 dict 的复制；与 success/message 同名的键仍走合并逻辑
+    if isinstance(data, dict) and "success" not in data and "message" not in data:
+        payload = _orjson_dumps(data)
+        if payload is not None:
+            head = b'{"success":true'
+            if message:
+                head += b',"message":' + orjson.dumps(message)
+            return _bytes_response(head + (b"}" if payload == b"{}" else b"," + payload[1:]), status)
     body = {"success": True}
     if data is not None:
         if isinstance(data, dict):
@@ -35,13 +126,9 @@ def api_success(data=None, message: str | None = None, status=200):
             body["data"] = data
     if message:
         body["message"] = message
-    response = jsonify(body)
-    response.status_code = status
-    return response
+    return _json_response(body, status)
 
 
 def api_error(error: str, status=400):
     """统一错误响应"""
-    response = jsonify({"success": False, "error": error})
-    response.status_code = status
-    return response
+    return _json_response({"success": False, "error": error}, status)
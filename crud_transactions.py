@@ -4,18 +4,96 @@
 """
 
 import sqlite3
+import threading
 import pandas as pd
-from typing import Optional, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Union
 from datetime import datetime, timedelta
 import logging
+import os
+import time
 
 from utils.db_sqlite_manager import SQLiteManager
 from return_rate_sqlite import generate_return_rate
+from utils.default_currencies import get_currency_info
+
+# 类别/币种维表缓存有效期（秒）
+_DIM_CACHE_TTL = 60
+
+# 币种不存在时插入，存在时不返回行（SQLite 3.35+ / PostgreSQL / D1 均支持）
+_UPSERT_CURRENCY_SQL = """
+INSERT INTO currencies (code, name, symbol, exchange_rate)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (code) DO NOTHING
+RETURNING id
+"""
+
+# 自动生成关联资金记录的交易类型
+_FUND_LINKED_TYPES = ("买入", "卖出", "开仓", "平仓", "分红")
+
+# get_transactions 返回 DataFrame 时按浮点处理的数值列
+_TRANSACTION_FLOAT_COLUMNS = ("quantity", "price", "amount", "amount_cny", "fee")
+
+# 不分页读取资金明细时每批从游标取出的行数
+_READ_CHUNK_ROWS = 10_000
+
+# 开发调试：设置 FINO_EXPLAIN=1 时在日志中输出列表/计数查询的 SQLite 查询计划
+_EXPLAIN = os.environ.get("FINO_EXPLAIN", "").strip().lower() in ("1", "true", "yes")
+
+# SQLite 3.35 起支持 INSERT ... RETURNING
+_SQLITE_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+# SQLite 3.25+ 支持窗口函数
+_SQLITE_WINDOW = sqlite3.sqlite_version_info >= (3, 25, 0)
+
+# 类别与币种一次性解析：类别按名称 → 「其他」→ 第一个类别回退；币种按 code（为空时按 id）
+_RESOLVE_DIMS_SQL = """
+SELECT
+    COALESCE(
+        (SELECT id FROM categories WHERE name = ? LIMIT 1),
+        (SELECT id FROM categories WHERE name = '其他' LIMIT 1),
+        (SELECT id FROM categories ORDER BY id LIMIT 1)
+    ) AS category_id,
+    (SELECT id FROM currencies WHERE code = ? OR id = ? LIMIT 1) AS currency_id,
+    (SELECT code FROM currencies WHERE code = ? OR id = ? LIMIT 1) AS currency_code
+"""
+
+
+def _to_id(value) -> Optional[int]:
+    """将 id 形式的 category/currency（整数或数字字符串）转为 int，名称/代码返回 None"""
+    if isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
 
 
 class TransactionCRUD:
     """交易业务操作类"""
 
+    # 常用 INSERT 语句统一为类常量：各调用点 SQL 文本一致，可命中连接上的预编译语句缓存
+    _INSERT_TRANSACTION_SQL = """
+        INSERT INTO transactions (ledger_id, account_id, date, type, category_id, code, name,
+                                  quantity, price, currency_id, amount, amount_cny, fee, notes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    _INSERT_LINKED_FUND_TRANSACTION_SQL = """
+        INSERT INTO fund_transactions (
+            ledger_id, date, type, currency_id, notes, transaction_id
+        )
+        VALUES (?, ?, ?, ?, ?, ?)
+    """
+    _INSERT_FUND_ENTRY_SQL = """
+        INSERT INTO fund_transaction_entries
+        (fund_transaction_id, account_id, side, amount, amount_cny, subject_type)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """
+    _INSERT_FUND_ENTRY_WITH_CURRENCY_SQL = """
+        INSERT INTO fund_transaction_entries
+        (fund_transaction_id, account_id, side, amount, amount_cny, currency_id, subject_type)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """
+
     def __init__(self, db_manager: SQLiteManager):
         """初始化交易业务操作类
 
@@ -23,12 +101,292 @@ class TransactionCRUD:
             db_manager: SQLiteManager 实例，提供数据库连接
         """
         self.db_manager = db_manager
+        # 每个线程在其当前连接上复用一个游标：(连接, 游标)
+        self._local = threading.local()
+        # 类别/币种维表缓存：(加载时间, 类别名->id, 默认类别 id, 币种代码->id, 币种 id->代码)
+        self._dims: Optional[tuple] = None
+        # 延后重算收益净值的账本：账本ID -> 最早受影响日期
+        self._pending_return_rate: Dict[int, str] = {}
+        # 后台重算收益净值：单线程执行，_rr_inflight 为已提交尚未结束的账本，由 _rr_lock 保护
+        self._rr_executor: Optional[ThreadPoolExecutor] = None
+        self._rr_inflight: set = set()
+        self._rr_lock = threading.Lock()
 
     @property
     def conn(self) -> sqlite3.Connection:
         """获取数据库连接"""
         return self.db_manager.get_connection()
 
+    @property
+    def _cursor(self):
+        """当前线程连接上复用的游标；连接更换（如归还连接池后重新借出）时重建"""
+        conn = self.conn
+        cached = getattr(self._local, "cursor", None)
+        if cached is None or cached[0] is not conn:
+            cached = (conn, conn.cursor())
+            self._local.cursor = cached
+        return cached[1]
+
+    def _begin_immediate(self, cursor) -> None:
+        """SQLite 下显式开启写事务并立即获取写锁，使整组写入一次提交；其他后端沿用驱动的隐式事务"""
+        conn = self.conn
+        if isinstance(conn, sqlite3.Connection) and not conn.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
+
+    def _insert_returning_id(self, cursor, sql: str, params) -> int:
+        """执行单行 INSERT 并返回新行 id
+
+        SQLite 3.35+ 追加 RETURNING id 在同一语句中取回；PostgreSQL 包装器已自动追加 RETURNING，
+        D1 由响应元数据给出 last_row_id，均沿用 lastrowid。
+        """
+        if _SQLITE_RETURNING and isinstance(self.conn, sqlite3.Connection):
+            cursor.execute(sql.rstrip().rstrip(";") + " RETURNING id", params)
+            return cursor.fetchall()[0][0]
+        cursor.execute(sql, params)
+        return cursor.lastrowid
+
+    def _explain(self, query: str, params) -> None:
+        """FINO_EXPLAIN 开启时记录查询计划，用于确认索引是否命中；仅 SQLite 支持 EXPLAIN QUERY PLAN"""
+        if not _EXPLAIN or not isinstance(self.conn, sqlite3.Connection):
+            return
+        try:
+            plan = self.conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+        except sqlite3.Error as e:
+            logging.warning(f"获取查询计划失败: {e}")
+            return
+        logging.info(
+            "查询计划:\n%s\n%s",
+            " ".join(query.split()),
+            "\n".join(f"  [{row[0]}<-{row[1]}] {row[3]}" for row in plan),
+        )
+
+    def _read_sql_chunked(self, query: str, params: list) -> pd.DataFrame:
+        """分批读取查询结果并拼接为 DataFrame
+
+        一次性读取时 pandas 需先持有全部原始行元组再构建 DataFrame；按 _READ_CHUNK_ROWS
+        分批后同时驻留的原始行只有一批，不分页的大结果集峰值内存明显降低。
+        """
+        self._explain(query, params)
+        chunks = list(
+            pd.read_sql_query(query, self.conn, params=params, chunksize=_READ_CHUNK_ROWS)
+        )
+        if not chunks:
+            return pd.DataFrame()
+        if len(chunks) == 1:
+            return chunks[0]
+        return pd.concat(chunks, ignore_index=True)
+
+    def _begin_single_ledger_read(self, ledger_id) -> bool:
+        """SQLite 库中只有 ledger_id 这一个账本时，开启读事务并返回 True
+
+        此时按账本筛选恒为真，调用方可省去该条件，让查询规划器按其余条件选择索引；
+        调用方查询结束后须 commit 结束读事务。检查与查询处于同一读事务（同一快照），
+        其他进程随后新建的账本及其数据不会混入结果。每次调用都检查而不做进程内缓存，
+        多 worker 部署下缓存无法感知其他进程新建的账本。检查本身（BEGIN + 两行查询 + COMMIT）
+        约 10 微秒，多账本库上的额外开销可忽略。PostgreSQL/D1 上这一次额外往返
+        得不偿失，始终保留账本条件。
+        """
+        conn = self.conn
+        if not ledger_id or not isinstance(conn, sqlite3.Connection) or conn.in_transaction:
+            return False
+        cursor = self._cursor
+        cursor.execute("BEGIN")
+        cursor.execute("SELECT id FROM ledgers LIMIT 2")
+        rows = cursor.fetchall()
+        if len(rows) == 1 and rows[0][0] == _to_id(ledger_id):
+            return True
+        conn.commit()
+        return False
+
+    def _dim_maps(self, cursor, refresh: bool = False) -> tuple:
+        """类别/币种维表的进程内缓存：(类别名->id, 默认类别 id, 币种代码->id, 币种 id->代码)
+
+        维表很小且极少变动，整表读取一次后按 _DIM_CACHE_TTL 过期；本进程内的增删改通过
+        invalidate_dim_caches 立即失效，其他进程的修改最迟在过期后生效。
+        """
+        dims = self._dims
+        if refresh or dims is None or time.monotonic() - dims[0] > _DIM_CACHE_TTL:
+            cursor.execute("SELECT id, name FROM categories ORDER BY id")
+            cat_rows = cursor.fetchall()
+            cat_by_name = {name: cid for cid, name in cat_rows}
+            # 未传或未匹配到类别时：优先使用「其他」，否则使用第一个类别
+            default_cat = cat_by_name.get("其他", cat_rows[0][0] if cat_rows else None)
+            cursor.execute("SELECT id, code FROM currencies")
+            curr_rows = cursor.fetchall()
+            dims = (
+                time.monotonic(),
+                cat_by_name,
+                default_cat,
+                {code: cid for cid, code in curr_rows},
+                {cid: code for cid, code in curr_rows},
+            )
+            self._dims = dims
+        return dims[1:]
+
+    def invalidate_dim_caches(self) -> None:
+        """类别或币种变更后清空维表缓存"""
+        self._dims = None
+
+    def _resolve_currency_id_code(self, cursor, curr) -> tuple:
+        """将币种 code 或 id 解析为 (currency_id, code)，无法解析时返回 (None, None)
+
+        id 与代码同时缓存在维表中，命中时无需查库；未命中时一次查询同时取回两者。
+        """
+        if curr is None or curr == "":
+            curr = "CNY"
+        _, _, curr_by_code, code_by_id = self._dim_maps(cursor)
+        cid = _to_id(curr)
+        if cid is not None:
+            if cid in code_by_id:
+                return cid, code_by_id[cid]
+        elif curr in curr_by_code:
+            return curr_by_code[curr], curr
+        cursor.execute(
+            "SELECT id, code FROM currencies WHERE code = ? OR id = ? LIMIT 1",
+            (str(curr), cid),
+        )
+        r = cursor.fetchone()
+        return (r[0], r[1]) if r else (None, None)
+
+    def _balanced_entry_rows(self, cursor, fund_trans: Dict, entries: List[Dict], analytics) -> List[tuple]:
+        """将多借多贷分录折算为人民币并校验借贷平衡
+
+        所有分录的折算一次批量查询完成，借贷双方各求和一次；不平衡时抛出 ValueError。
+
+        Returns:
+            (account_id, side, amount, amount_cny, currency_id, subject_type) 列表，
+            顺序与 _INSERT_FUND_ENTRY_WITH_CURRENCY_SQL 中主记录 id 之后的字段一致
+        """
+        default_curr = fund_trans.get("currency", "CNY")
+        resolved = []
+        for entry in entries:
+            entry_curr = entry.get("currency", default_curr)
+            ent_currency_id, curr_code = self._resolve_currency_id_code(cursor, entry_curr)
+            if ent_currency_id is None:
+                raise ValueError(f"分录币种无法解析: {entry_curr}")
+            resolved.append((ent_currency_id, curr_code))
+        fund_date = fund_trans.get("date")
+        amounts_cny = analytics.convert_to_cny_batched(
+            [
+                (entry["amount"], curr_code, fund_date)
+                for entry, (_, curr_code) in zip(entries, resolved)
+            ]
+        )
+        rows = [
+            (
+                entry["account_id"],
+                entry["side"],
+                entry["amount"],
+                amount_cny,
+                ent_currency_id,
+                entry.get("subject_type", "cash"),
+            )
+            for entry, (ent_currency_id, _), amount_cny in zip(entries, resolved, amounts_cny)
+        ]
+        debit_cny = sum(row[3] for row in rows if row[1] == "debit")
+        credit_cny = sum(row[3] for row in rows if row[1] != "debit")
+        if abs(debit_cny - credit_cny) > 0.01:
+            raise ValueError(
+                f"借贷不平衡（按人民币折算）：借方 {debit_cny:.2f}，贷方 {credit_cny:.2f}"
+            )
+        return rows
+
+    def _resolve_category_currency(self, cursor, transaction: Dict, action: str) -> Optional[tuple]:
+        """解析交易的 category/currency（支持 name/code 或 id），返回 (category_id, currency_id, currency_code)
+
+        先查维表缓存；未命中时用 _RESOLVE_DIMS_SQL 一次往返同时取回类别与币种。
+        无法解析时记录警告并返回 None；action 用于日志（如「添加交易」）。
+        """
+        cat_by_name, default_cat, curr_by_code, code_by_id = self._dim_maps(cursor)
+
+        cat = transaction.get("category")
+        cat_name = None
+        category_id = _to_id(cat)
+        if category_id is None:
+            category_id = cat_by_name.get(cat or "")
+            if category_id is None:
+                cat_name = cat or ""
+                category_id = default_cat if not cat_name else None
+
+        curr = transaction.get("currency", "CNY")
+        code = None
+        currency_id = _to_id(curr)
+        if currency_id is not None:
+            currency_code = code_by_id.get(currency_id)
+        else:
+            code = (curr or "CNY").strip() or "CNY"
+            currency_id = curr_by_code.get(code)
+            currency_code = curr
+
+        if category_id is None or currency_id is None or not currency_code:
+            # 缓存未命中（可能由其他进程新建）：一次查询回库确认类别与币种
+            db_cat, db_curr, db_code = self._resolve_dims_from_db(
+                cursor, cat_name, code, currency_id
+            )
+            if currency_id is None:
+                currency_id = db_curr
+            # 币种不存在时按设置中的默认汇率插入，随当前事务一并提交
+            if currency_id is None and code:
+                currency_id = self._get_or_create_currency_id(cursor, code)
+            if category_id is None:
+                category_id = db_cat
+            currency_code = currency_code or db_code or "CNY"
+
+        if category_id is None:
+            logging.warning(
+                "无法解析 category 为有效 id（未提供且数据库中无投资类别），%s失败", action
+            )
+            return None
+        if currency_id is None:
+            logging.warning(
+                "无法解析 currency 为有效 id（币种 %s 不存在），%s失败", curr, action
+            )
+            return None
+        return category_id, currency_id, currency_code
+
+    def _get_or_create_currency_id(self, cursor, code: str) -> Optional[int]:
+        """按代码取币种 id，不存在时按设置中的默认汇率插入
+
+        INSERT ... ON CONFLICT DO NOTHING RETURNING id 一次往返完成插入并取回 id；
+        已存在（冲突）时不返回行，再按代码查询。SQLite 3.35 以下不支持 RETURNING，
+        改用 INSERT OR IGNORE 后查询。
+        """
+        code = str(code).strip().upper()
+        name, symbol, rate = get_currency_info(code, getattr(self.db_manager, "config_path", None))
+        params = (code, name, symbol, rate)
+        currency_id = None
+        if isinstance(self.conn, sqlite3.Connection) and not _SQLITE_RETURNING:
+            cursor.execute(
+                "INSERT OR IGNORE INTO currencies (code, name, symbol, exchange_rate) VALUES (?, ?, ?, ?)",
+                params,
+            )
+        else:
+            cursor.execute(_UPSERT_CURRENCY_SQL, params)
+            if getattr(self.db_manager, "db_type", None) == "postgresql":
+                # PostgreSQL 包装器已消费 RETURNING 结果并写入 lastrowid，冲突时为 None
+                currency_id = cursor.lastrowid
+            else:
+                row = cursor.fetchone()
+                currency_id = row[0] if row else None
+        if currency_id is None:
+            cursor.execute("SELECT id FROM currencies WHERE code = ? LIMIT 1", (code,))
+            row = cursor.fetchone()
+            currency_id = row[0] if row else None
+        else:
+            self.invalidate_dim_caches()
+        return currency_id
+
+    @staticmethod
+    def _resolve_dims_from_db(cursor, cat_name, code, currency_id) -> tuple:
+        """单条 SQL 取回 (category_id, currency_id, currency_code)
+
+        类别按「名称 → 其他 → 第一个类别」回退；币种按 code 查询，code 为空时按 currency_id 查询。
+        """
+        curr_id = None if code else currency_id
+        cursor.execute(_RESOLVE_DIMS_SQL, (cat_name or "", code, curr_id, code, curr_id))
+        row = cursor.fetchone()
+        return (row[0], row[1], row[2]) if row else (None, None, None)
+
     def add_transaction(self, transaction: Dict, analytics) -> bool:
         """添加交易记录（买入、卖出、分红等）
 
@@ -53,198 +411,226 @@ class TransactionCRUD:
             bool: 是否成功
         """
         try:
-            cursor = self.conn.cursor()
-            # 解析 category/currency 为 id（支持传入 name/code 或 id）
-            cat = transaction.get("category")
-            if isinstance(cat, int) or (isinstance(cat, str) and (cat or "").isdigit()):
-                category_id = int(cat or 0)
-            else:
-                cursor.execute(
-                    "SELECT id FROM categories WHERE name = ? LIMIT 1", (cat or "",)
-                )
-                r = cursor.fetchone()
-                category_id = r[0] if r else None
-            # 未传或未匹配到类别时：优先使用「其他」，否则使用第一个类别
-            if category_id is None:
-                cursor.execute(
-                    "SELECT id FROM categories WHERE name = ? LIMIT 1", ("其他",)
-                )
-                r = cursor.fetchone()
-                category_id = r[0] if r else None
-            if category_id is None:
-                cursor.execute("SELECT id FROM categories ORDER BY id LIMIT 1")
-                r = cursor.fetchone()
-                category_id = r[0] if r else None
-            if category_id is None:
-                logging.warning(
-                    "无法解析 category 为有效 id（未提供且数据库中无投资类别），添加交易失败"
-                )
+            cursor = self._cursor
+            self._begin_immediate(cursor)
+            if not self._insert_transaction(cursor, transaction, analytics):
+                self.conn.rollback()
                 return False
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logging.error(f"添加交易记录失败: {e}")
+            self.conn.rollback()
+            return False
 
-            curr = transaction.get("currency", "CNY")
-            if isinstance(curr, int) or (
-                isinstance(curr, str) and (curr or "").isdigit()
-            ):
-                currency_id = int(curr or 0)
-            else:
-                code = (curr or "CNY").strip() or "CNY"
-                cursor.execute(
-                    "SELECT id FROM currencies WHERE code = ? LIMIT 1", (code,)
-                )
-                r = cursor.fetchone()
-                currency_id = r[0] if r else None
-                # 币种不存在时由各数据库管理器按设置中的默认汇率插入（SQLite/PostgreSQL/D1 均支持）
-                if currency_id is None and code:
-                    ensure = getattr(
-                        self.db_manager, "ensure_currency_exists", None
+    def add_transactions(self, transactions: List[Dict], analytics) -> bool:
+        """批量添加交易记录：全部写入后统一提交一次，任一条失败则整体回滚
+
+        SQLite 下三张表各用一次 executemany 写入，提交后统一重建受影响的持仓；
+        其他后端逐条写入。
+
+        Args:
+            transactions: 交易记录字典列表，字段同 add_transaction
+            analytics: Analytics 实例，用于更新持仓
+
+        Returns:
+            bool: 是否全部成功
+        """
+        if not transactions:
+            return True
+        if isinstance(self.conn, sqlite3.Connection):
+            return self._add_transactions_batched(transactions, analytics)
+        try:
+            cursor = self._cursor
+            self._begin_immediate(cursor)
+            for transaction in transactions:
+                if not self._insert_transaction(cursor, transaction, analytics):
+                    raise ValueError(
+                        f"交易记录无效: {transaction.get('code')} {transaction.get('date')}"
+                    )
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logging.error(f"批量添加交易记录失败: {e}")
+            self.conn.rollback()
+            # 已回滚的交易可能已计入内存库存，全量重建以保持与数据库一致
+            analytics._rebuild_all_inventory(force_full=True)
+            return False
+
+    def _add_transactions_batched(self, transactions: List[Dict], analytics) -> bool:
+        """SQLite 批量写入：交易、关联资金记录、资金分录各一次 executemany，最后统一重建持仓"""
+        try:
+            cursor = self._cursor
+            self._begin_immediate(cursor)
+            resolved = []
+            for transaction in transactions:
+                dims = self._resolve_category_currency(cursor, transaction, "添加交易")
+                if dims is None:
+                    raise ValueError(
+                        f"交易记录无效: {transaction.get('code')} {transaction.get('date')}"
                     )
-                    if callable(ensure):
-                        ensure(code)
-                    cursor.execute(
-                        "SELECT id FROM currencies WHERE code = ? LIMIT 1",
-                        (code.upper(),),
+                resolved.append(dims)
+            amounts_cny = analytics.convert_to_cny_batched(
+                [
+                    (t["amount"], currency_code, t.get("date"))
+                    for t, (_, _, currency_code) in zip(transactions, resolved)
+                ]
+            )
+
+            cursor.executemany(
+                self._INSERT_TRANSACTION_SQL,
+                [
+                    (
+                        t["ledger_id"],
+                        t["account_id"],
+                        t["date"],
+                        t["type"],
+                        category_id,
+                        t["code"],
+                        t["name"],
+                        t["quantity"],
+                        t["price"],
+                        currency_id,
+                        t["amount"],
+                        amount_cny,
+                        t.get("fee", 0),
+                        t.get("notes", ""),
                     )
-                    r = cursor.fetchone()
-                    currency_id = r[0] if r else None
-            if currency_id is None:
-                logging.warning(
-                    "无法解析 currency 为有效 id（币种 %s 不存在），添加交易失败",
-                    curr,
-                )
-                return False
-            currency_code = (
-                curr if isinstance(curr, str) and not (curr or "").isdigit() else None
+                    for t, (category_id, currency_id, _), amount_cny in zip(
+                        transactions, resolved, amounts_cny
+                    )
+                ],
             )
-            if not currency_code:
-                cursor.execute(
-                    "SELECT code FROM currencies WHERE id = ?", (currency_id,)
+            transaction_ids = self._last_inserted_ids(cursor, len(transactions))
+
+            linked = [
+                (t, transaction_id, currency_id, amount_cny)
+                for t, transaction_id, (_, currency_id, _), amount_cny in zip(
+                    transactions, transaction_ids, resolved, amounts_cny
                 )
-                row = cursor.fetchone()
-                currency_code = row[0] if row else "CNY"
-            trans_date = transaction.get("date")
-            if trans_date:
-                amount_cny = analytics.convert_to_cny_at_date(
-                    transaction["amount"], currency_code, trans_date
+                if t.get("type") in _FUND_LINKED_TYPES
+            ]
+            if linked:
+                cursor.executemany(
+                    self._INSERT_LINKED_FUND_TRANSACTION_SQL,
+                    [
+                        (t["ledger_id"], t["date"], t["type"], currency_id, t.get("notes"), transaction_id)
+                        for t, transaction_id, currency_id, _ in linked
+                    ],
                 )
-            else:
-                amount_cny = analytics.convert_to_cny(
-                    transaction["amount"], currency_code
+                fund_ids = self._last_inserted_ids(cursor, len(linked))
+                cursor.executemany(
+                    self._INSERT_FUND_ENTRY_SQL,
+                    [
+                        row
+                        for (t, _, _, amount_cny), fund_id in zip(linked, fund_ids)
+                        for row in self._linked_entry_rows(fund_id, t, amount_cny)
+                    ],
                 )
+            self.conn.commit()
+        except Exception as e:
+            logging.error(f"批量添加交易记录失败: {e}")
+            self.conn.rollback()
+            return False
 
-            cursor.execute(
-                """
-                INSERT INTO transactions (ledger_id, account_id, date, type, category_id, code, name,
-                                         quantity, price, currency_id, amount, amount_cny, fee, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
+        analytics.rebuild_positions_for(
+            {(t["ledger_id"], t["account_id"], t["code"]) for t in transactions}
+        )
+        return True
+
+    @staticmethod
+    def _linked_entry_rows(fund_transaction_id: int, transaction: Dict, amount_cny: float) -> List[tuple]:
+        """交易关联资金记录的借贷两条分录，字段顺序同 _INSERT_FUND_ENTRY_SQL
+
+        分录金额与交易金额一致；买入/开仓：借-持仓(增)、贷-现金(减)，
+        卖出/平仓/分红：借-现金(增)、贷-持仓(减)。
+        """
+        debit_subject, credit_subject = (
+            ("position", "cash") if transaction["type"] in ("买入", "开仓") else ("cash", "position")
+        )
+        account_id = transaction["account_id"]
+        amount = transaction["amount"]
+        return [
+            (fund_transaction_id, account_id, "debit", amount, amount_cny, debit_subject),
+            (fund_transaction_id, account_id, "credit", amount, amount_cny, credit_subject),
+        ]
+
+    @staticmethod
+    def _last_inserted_ids(cursor, count: int) -> List[int]:
+        """executemany 插入 count 行后的新行 id
+
+        调用方已通过 BEGIN IMMEDIATE 持有写锁，期间无其他写入，新行 id 连续递增。
+        """
+        cursor.execute("SELECT last_insert_rowid()")
+        last_id = cursor.fetchone()[0]
+        return list(range(last_id - count + 1, last_id + 1))
+
+    def _insert_transaction(self, cursor, transaction: Dict, analytics) -> bool:
+        """写入单条交易及其关联资金记录并更新持仓（不提交事务）
+
+        Returns:
+            bool: 类别或币种无法解析时返回 False
+        """
+        # 解析 category/currency 为 id（支持传入 name/code 或 id）
+        resolved = self._resolve_category_currency(cursor, transaction, "添加交易")
+        if resolved is None:
+            return False
+        category_id, currency_id, currency_code = resolved
+        trans_date = transaction.get("date")
+        if trans_date:
+            amount_cny = analytics.convert_to_cny_at_date(
+                transaction["amount"], currency_code, trans_date
+            )
+        else:
+            amount_cny = analytics.convert_to_cny(
+                transaction["amount"], currency_code
+            )
+
+        transaction_id = self._insert_returning_id(
+            cursor,
+            self._INSERT_TRANSACTION_SQL,
+            (
+                transaction["ledger_id"],
+                transaction["account_id"],
+                transaction["date"],
+                transaction["type"],
+                category_id,
+                transaction["code"],
+                transaction["name"],
+                transaction["quantity"],
+                transaction["price"],
+                currency_id,
+                transaction["amount"],
+                amount_cny,
+                transaction.get("fee", 0),
+                transaction.get("notes", ""),
+            ),
+        )
+
+        # 自动创建关联资金记录（与交易一对一，删除时一并删除）
+        trans_type = transaction.get("type")
+        if trans_type in _FUND_LINKED_TYPES:
+            fund_transaction_id = self._insert_returning_id(
+                cursor,
+                self._INSERT_LINKED_FUND_TRANSACTION_SQL,
                 (
                     transaction["ledger_id"],
-                    transaction["account_id"],
                     transaction["date"],
-                    transaction["type"],
-                    category_id,
-                    transaction["code"],
-                    transaction["name"],
-                    transaction["quantity"],
-                    transaction["price"],
+                    trans_type,
                     currency_id,
-                    transaction["amount"],
-                    amount_cny,
-                    transaction.get("fee", 0),
-                    transaction.get("notes", ""),
+                    transaction.get("notes"),
+                    transaction_id,
                 ),
             )
+            # 分录金额、币种、日期与交易一致，直接复用交易的人民币金额
+            cursor.executemany(
+                self._INSERT_FUND_ENTRY_SQL,
+                self._linked_entry_rows(fund_transaction_id, transaction, amount_cny),
+            )
 
-            # 获取刚插入的交易ID
-            transaction_id = cursor.lastrowid
-
-            # 自动创建关联资金记录（与交易一对一，删除时一并删除）
-            trans_type = transaction.get("type")
-            if trans_type in ("买入", "卖出", "开仓", "平仓", "分红"):
-                cursor.execute(
-                    """
-                    INSERT INTO fund_transactions (
-                        ledger_id, date, type, currency_id, notes, transaction_id
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                    (
-                        transaction["ledger_id"],
-                        transaction["date"],
-                        trans_type,
-                        currency_id,
-                        transaction.get("notes"),
-                        transaction_id,
-                    ),
-                )
-                fund_transaction_id = cursor.lastrowid
-                account_id = transaction["account_id"]
-                amount = transaction["amount"]
-                if trans_date:
-                    amount_cny_entry = analytics.convert_to_cny_at_date(
-                        amount, currency_code, trans_date
-                    )
-                else:
-                    amount_cny_entry = analytics.convert_to_cny(
-                        amount, currency_code
-                    )
-                # 买入/开仓：借-持仓(增)、贷-现金(减)；卖出/平仓/分红：借-现金(增)、贷-持仓(减)
-                if trans_type in ("买入", "开仓"):
-                    entries = [
-                        {
-                            "account_id": account_id,
-                            "side": "debit",
-                            "amount": amount,
-                            "subject_type": "position",
-                        },
-                        {
-                            "account_id": account_id,
-                            "side": "credit",
-                            "amount": amount,
-                            "subject_type": "cash",
-                        },
-                    ]
-                else:
-                    entries = [
-                        {
-                            "account_id": account_id,
-                            "side": "debit",
-                            "amount": amount,
-                            "subject_type": "cash",
-                        },
-                        {
-                            "account_id": account_id,
-                            "side": "credit",
-                            "amount": amount,
-                            "subject_type": "position",
-                        },
-                    ]
-                for entry in entries:
-                    cursor.execute(
-                        """
-                        INSERT INTO fund_transaction_entries
-                        (fund_transaction_id, account_id, side, amount, amount_cny, subject_type)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                        (
-                            fund_transaction_id,
-                            entry["account_id"],
-                            entry["side"],
-                            entry["amount"],
-                            amount_cny_entry,
-                            entry.get("subject_type", "cash"),
-                        ),
-                    )
-
-            # 更新持仓（通过 analytics 模块）
-            analytics.update_position(transaction, transaction_id)
-
-            self.conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"添加交易记录失败: {e}")
-            self.conn.rollback()
-            return False
+        # 更新持仓（通过 analytics 模块）
+        analytics.update_position(transaction, transaction_id)
+        return True
 
     def get_transactions(
         self,
@@ -256,7 +642,11 @@ class TransactionCRUD:
         end_date: Optional[str] = None,
         limit: Optional[int] = None,
         offset: Optional[int] = None,
-    ) -> pd.DataFrame:
+        with_total: bool = False,
+        as_records: bool = False,
+        after_date: Optional[str] = None,
+        after_id: Optional[int] = None,
+    ) -> Union[pd.DataFrame, List[Dict]]:
         """获取交易记录
 
         Args:
@@ -268,55 +658,86 @@ class TransactionCRUD:
             end_date: 结束日期（可选）
             limit: 限制返回数量（可选）
             offset: 偏移量，用于分页（可选）
+            with_total: 是否附加 total_count 列（分页前的总条数，同一查询中的计数子查询计算）
+            as_records: 为 True 时直接返回 list[dict]，不构造 DataFrame
+            after_date/after_id: 分页游标（上一页最后一条的日期与ID），只返回排在其后的记录
 
         Returns:
-            pd.DataFrame: 交易记录数据框
+            pd.DataFrame | list[dict]: 交易记录
         """
-        query = """
-            SELECT t.*, l.name as ledger_name, a.name as account_name,
-                   c.code as currency, c.symbol as currency_symbol,
-                   cat.name as category
-            FROM transactions t
-            LEFT JOIN ledgers l ON t.ledger_id = l.id
-            LEFT JOIN accounts a ON t.account_id = a.id
-            LEFT JOIN currencies c ON t.currency_id = c.id
-            LEFT JOIN categories cat ON t.category_id = cat.id
-            WHERE 1=1
-        """
-        params = []
+        # 按类别筛选时直接在 categories 连接上按名称匹配（name 唯一索引），参数位于 WHERE 之前
+        cat_filter = (
+            " INNER JOIN categories cat ON t.category_id = cat.id AND cat.name = ?"
+            if category
+            else ""
+        )
+        cat_join = cat_filter or " LEFT JOIN categories cat ON t.category_id = cat.id"
+        where = " WHERE 1=1"
+        params = [category] if category else []
 
         if ledger_id:
-            query += " AND t.ledger_id = ?"
+            where += " AND t.ledger_id = ?"
             params.append(ledger_id)
 
         if account_id:
-            query += " AND t.account_id = ?"
+            where += " AND t.account_id = ?"
             params.append(account_id)
 
         if trans_type:
-            query += " AND t.type = ?"
+            where += " AND t.type = ?"
             params.append(trans_type)
 
-        if category:
-            query += " AND t.category_id = (SELECT id FROM categories WHERE name = ? LIMIT 1)"
-            params.append(category)
-
         if start_date:
-            query += " AND t.date >= ?"
+            where += " AND t.date >= ?"
             params.append(start_date)
 
         if end_date:
-            query += " AND t.date <= ?"
+            where += " AND t.date <= ?"
             params.append(end_date)
 
+        # 游标分页：按 (date, id) 定位，借助索引直接跳到上一页末尾，无需扫描并丢弃 OFFSET 之前的行
+        if after_date is not None and after_id is not None:
+            where += " AND (t.date, t.id) < (?, ?)"
+            params.extend([after_date, after_id])
+
+        # 总数用不相关的计数子查询在同一次往返中得出，只执行一次且可走覆盖索引；
+        # 窗口函数 COUNT(*) OVER () 会迫使分页前物化并排序全部匹配行，LIMIT 无法提前结束
+        total_col = ""
+        if with_total:
+            total_col = f", (SELECT COUNT(*) FROM transactions t{cat_filter}{where}) as total_count"
+            params = params + params
+        query = f"""
+            SELECT t.*, l.name as ledger_name, a.name as account_name,
+                   c.code as currency, c.symbol as currency_symbol,
+                   cat.name as category{total_col}
+            FROM transactions t
+            LEFT JOIN ledgers l ON t.ledger_id = l.id
+            LEFT JOIN accounts a ON t.account_id = a.id
+            LEFT JOIN currencies c ON t.currency_id = c.id{cat_join}{where}
+        """
+
         query += " ORDER BY t.date DESC, t.id DESC"
 
+        # LIMIT/OFFSET 用参数传入，翻页时 SQL 文本不变，可复用已预编译的语句
         if limit:
-            query += f" LIMIT {limit}"
+            query += " LIMIT ?"
+            params.append(int(limit))
             if offset is not None:
-                query += f" OFFSET {offset}"
-
-        df = pd.read_sql_query(query, self.conn, params=params)
+                query += " OFFSET ?"
+                params.append(int(offset))
+
+        self._explain(query, params)
+        cursor = self._cursor
+        cursor.execute(query, params)
+        columns = [description[0] for description in cursor.description or ()]
+        if as_records:
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        # 一次取回后整体构造 DataFrame，数值列显式转 float64，避免 pandas 逐行推断类型
+        df = pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+        float_cols = [c for c in _TRANSACTION_FLOAT_COLUMNS if c in df.columns]
+        if float_cols:
+            df[float_cols] = df[float_cols].astype("float64")
         return df
 
     def get_transactions_count(
@@ -341,12 +762,18 @@ class TransactionCRUD:
         Returns:
             int: 符合条件的交易记录总数
         """
-        query = """
+        cat_join = (
+            "INNER JOIN categories cat ON t.category_id = cat.id AND cat.name = ?"
+            if category
+            else ""
+        )
+        query = f"""
             SELECT COUNT(*) as count
             FROM transactions t
+            {cat_join}
             WHERE 1=1
         """
-        params = []
+        params = [category] if category else []
 
         if ledger_id:
             query += " AND t.ledger_id = ?"
@@ -360,10 +787,6 @@ class TransactionCRUD:
             query += " AND t.type = ?"
             params.append(trans_type)
 
-        if category:
-            query += " AND t.category_id = (SELECT id FROM categories WHERE name = ? LIMIT 1)"
-            params.append(category)
-
         if start_date:
             query += " AND t.date >= ?"
             params.append(start_date)
@@ -373,7 +796,8 @@ class TransactionCRUD:
             params.append(end_date)
 
         try:
-            cursor = self.conn.cursor()
+            self._explain(query, params)
+            cursor = self._cursor
             cursor.execute(query, params)
             result = cursor.fetchone()
             return result[0] if result else 0
@@ -391,7 +815,7 @@ class TransactionCRUD:
             Dict: 交易记录字典，如果不存在则返回 None
         """
         try:
-            cursor = self.conn.cursor()
+            cursor = self._cursor
             cursor.execute(
                 """
                 SELECT t.*, l.name as ledger_name, a.name as account_name,
@@ -428,71 +852,11 @@ class TransactionCRUD:
             bool: 是否成功
         """
         try:
-            cursor = self.conn.cursor()
-            cat = transaction.get("category")
-            if isinstance(cat, int) or (isinstance(cat, str) and (cat or "").isdigit()):
-                category_id = int(cat or 0)
-            else:
-                cursor.execute(
-                    "SELECT id FROM categories WHERE name = ? LIMIT 1", (cat or "",)
-                )
-                r = cursor.fetchone()
-                category_id = r[0] if r else None
-            if category_id is None:
-                cursor.execute(
-                    "SELECT id FROM categories WHERE name = ? LIMIT 1", ("其他",)
-                )
-                r = cursor.fetchone()
-                category_id = r[0] if r else None
-            if category_id is None:
-                cursor.execute("SELECT id FROM categories ORDER BY id LIMIT 1")
-                r = cursor.fetchone()
-                category_id = r[0] if r else None
-            if category_id is None:
-                logging.warning(
-                    "无法解析 category 为有效 id（未提供且数据库中无投资类别），更新交易失败"
-                )
+            cursor = self._cursor
+            resolved = self._resolve_category_currency(cursor, transaction, "更新交易")
+            if resolved is None:
                 return False
-
-            curr = transaction.get("currency", "CNY")
-            if isinstance(curr, int) or (
-                isinstance(curr, str) and (curr or "").isdigit()
-            ):
-                currency_id = int(curr or 0)
-            else:
-                code = (curr or "CNY").strip() or "CNY"
-                cursor.execute(
-                    "SELECT id FROM currencies WHERE code = ? LIMIT 1", (code,)
-                )
-                r = cursor.fetchone()
-                currency_id = r[0] if r else None
-                if currency_id is None and code:
-                    ensure = getattr(
-                        self.db_manager, "ensure_currency_exists", None
-                    )
-                    if callable(ensure):
-                        ensure(code)
-                    cursor.execute(
-                        "SELECT id FROM currencies WHERE code = ? LIMIT 1",
-                        (code.upper(),),
-                    )
-                    r = cursor.fetchone()
-                    currency_id = r[0] if r else None
-            if currency_id is None:
-                logging.warning(
-                    "无法解析 currency 为有效 id（币种 %s 不存在），更新交易失败",
-                    curr,
-                )
-                return False
-            currency_code = (
-                curr if isinstance(curr, str) and not (curr or "").isdigit() else None
-            )
-            if not currency_code:
-                cursor.execute(
-                    "SELECT code FROM currencies WHERE id = ?", (currency_id,)
-                )
-                row = cursor.fetchone()
-                currency_code = row[0] if row else "CNY"
+            category_id, currency_id, currency_code = resolved
             trans_date = transaction.get("date")
             if trans_date:
                 amount_cny = analytics.convert_to_cny_at_date(
@@ -503,22 +867,22 @@ class TransactionCRUD:
                     transaction["amount"], currency_code
                 )
 
+            # 修改前的 (账本, 账户, 代码)，用于只重建受影响的持仓
+            cursor.execute(
+                "SELECT ledger_id, account_id, code FROM transactions WHERE id = ?",
+                (transaction_id,),
+            )
+            affected = {tuple(r) for r in cursor.fetchall()}
+            affected.add(
+                (transaction["ledger_id"], transaction["account_id"], transaction["code"])
+            )
+
             # 编辑交易时同步更新关联的资金明细，避免平仓改开仓（或反之）后现金余额未更新
+            # 分录由外键 ON DELETE CASCADE 随资金明细一并删除
             cursor.execute(
-                "SELECT id FROM fund_transactions WHERE transaction_id = ?",
+                "DELETE FROM fund_transactions WHERE transaction_id = ?",
                 (transaction_id,),
             )
-            old_fund_rows = cursor.fetchall()
-            for (ft_id,) in old_fund_rows:
-                cursor.execute(
-                    "DELETE FROM fund_transaction_entries WHERE fund_transaction_id = ?",
-                    (ft_id,),
-                )
-            if old_fund_rows:
-                cursor.execute(
-                    "DELETE FROM fund_transactions WHERE transaction_id = ?",
-                    (transaction_id,),
-                )
 
             cursor.execute(
                 """
@@ -550,13 +914,9 @@ class TransactionCRUD:
             # 若更新后为开仓/平仓，重新写入资金明细，使账户现金余额与交易类型一致
             trans_type = transaction.get("type")
             if trans_type in ("开仓", "平仓"):
-                cursor.execute(
-                    """
-                    INSERT INTO fund_transactions (
-                        ledger_id, date, type, currency_id, notes, transaction_id
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
+                fund_transaction_id = self._insert_returning_id(
+                    cursor,
+                    self._INSERT_LINKED_FUND_TRANSACTION_SQL,
                     (
                         transaction["ledger_id"],
                         transaction["date"],
@@ -566,66 +926,16 @@ class TransactionCRUD:
                         transaction_id,
                     ),
                 )
-                fund_transaction_id = cursor.lastrowid
-                account_id = transaction["account_id"]
-                if trans_type == "开仓":
-                    entries = [
-                        {
-                            "account_id": account_id,
-                            "side": "debit",
-                            "amount": transaction["amount"],
-                            "subject_type": "position",
-                        },
-                        {
-                            "account_id": account_id,
-                            "side": "credit",
-                            "amount": transaction["amount"],
-                            "subject_type": "cash",
-                        },
-                    ]
-                else:
-                    entries = [
-                        {
-                            "account_id": account_id,
-                            "side": "debit",
-                            "amount": transaction["amount"],
-                            "subject_type": "cash",
-                        },
-                        {
-                            "account_id": account_id,
-                            "side": "credit",
-                            "amount": transaction["amount"],
-                            "subject_type": "position",
-                        },
-                    ]
-                for entry in entries:
-                    amt = entry["amount"]
-                    if trans_date:
-                        amt_cny = analytics.convert_to_cny_at_date(
-                            amt, currency_code, trans_date
-                        )
-                    else:
-                        amt_cny = analytics.convert_to_cny(amt, currency_code)
-                    cursor.execute(
-                        """
-                        INSERT INTO fund_transaction_entries
-                        (fund_transaction_id, account_id, side, amount, amount_cny, subject_type)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            fund_transaction_id,
-                            entry["account_id"],
-                            entry["side"],
-                            amt,
-                            amt_cny,
-                            entry.get("subject_type", "cash"),
-                        ),
-                    )
+                # 分录金额、币种、日期与交易一致，直接复用交易的人民币金额
+                cursor.executemany(
+                    self._INSERT_FUND_ENTRY_SQL,
+                    self._linked_entry_rows(fund_transaction_id, transaction, amount_cny),
+                )
 
             self.conn.commit()
 
-            # 重新同步所有持仓
-            analytics.rebuild_all_positions()
+            # 仅重建修改前后涉及的持仓
+            analytics.rebuild_positions_for(affected)
 
             return True
         except Exception as e:
@@ -654,7 +964,12 @@ class TransactionCRUD:
         )
 
     def delete_transaction(
-        self, transaction_id: int, analytics, db=None, rebuild_positions: bool = True
+        self,
+        transaction_id: int,
+        analytics,
+        db=None,
+        rebuild_positions: bool = True,
+        defer_return_rate: bool = False,
     ) -> bool:
         """删除交易记录并重新同步持仓。若该交易有关联的资金明细（与 transaction_id 关联），则一并删除。
         同时删除对应的持仓历史（position_history）中受影响的记录，并重新生成。
@@ -664,12 +979,14 @@ class TransactionCRUD:
             analytics: Analytics 实例，用于重新同步持仓
             db: Database 实例，用于重新生成持仓历史（可选）
             rebuild_positions: 是否重新同步持仓，默认为True。批量删除时可以设为False，最后统一重建
+            defer_return_rate: 为 True 时仅记录账本，由 flush_pending_return_rate 统一重算收益净值；
+                默认提交到后台线程重算
 
         Returns:
             bool: 是否成功
         """
         try:
-            cursor = self.conn.cursor()
+            cursor = self._cursor
             # 先获取交易信息（需在删除前）
             cursor.execute(
                 "SELECT ledger_id, account_id, code, date FROM transactions WHERE id = ?",
@@ -678,12 +995,8 @@ class TransactionCRUD:
             row = cursor.fetchone()
             if not row:
                 return False
-            ledger_id, account_id, code, trans_date = row
-            trans_date_str = (
-                trans_date.strftime("%Y-%m-%d")
-                if isinstance(trans_date, datetime)
-                else str(trans_date)
-            )
+            # date 列在各后端均为 TEXT/VARCHAR（ISO-8601），取出即为字符串
+            ledger_id, account_id, code, trans_date_str = row
 
             # 删除受影响的持仓历史（从交易日期开始）
             self._delete_position_history_for_transaction(cursor, transaction_id)
@@ -696,9 +1009,9 @@ class TransactionCRUD:
             cursor.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
             self.conn.commit()
 
-            # 重新同步所有持仓
+            # 仅重建该交易涉及的持仓
             if rebuild_positions:
-                analytics.rebuild_all_positions()
+                analytics.rebuild_positions_for({(ledger_id, account_id, code)})
 
             # 重新生成持仓历史快照（从交易日期到昨天，不查询价格API）
             if db is not None:
@@ -709,18 +1022,10 @@ class TransactionCRUD:
                         trans_date_str, end_date, ledger_id, account_id
                     )
 
-            # 净值法增量重算：从交易日期到昨天
-            try:
-                generate_return_rate(
-                    self.conn,
-                    ledger_id=ledger_id,
-                    full_refresh=True,
-                    write_to_db=True,
-                    db=db,
-                    incremental_from_date=trans_date_str if trans_date_str else None,
-                )
-            except Exception as e:
-                logging.error(f"删除交易后重新计算收益净值失败: {e}")
+            # 净值法增量重算：从交易日期到昨天，在后台线程执行
+            self.mark_return_rate(ledger_id, trans_date_str)
+            if not defer_return_rate:
+                self.schedule_return_rate(db, [ledger_id])
 
             return True
         except Exception as e:
@@ -728,6 +1033,168 @@ class TransactionCRUD:
             self.conn.rollback()
             return False
 
+    def mark_return_rate(self, ledger_id: int, from_date: str) -> None:
+        """记录账本需从 from_date 起重算收益净值（同一账本保留最早日期）"""
+        with self._rr_lock:
+            pending = self._pending_return_rate.get(ledger_id)
+            if pending is None or from_date < pending:
+                self._pending_return_rate[ledger_id] = from_date
+
+    def flush_pending_return_rate(
+        self, db=None, ledger_ids: Optional[List[int]] = None
+    ) -> None:
+        """在当前线程对延后的账本各重算一次收益净值（从最早受影响日期开始）
+
+        后台正在重算的账本留给后台线程处理，避免同一账本并发写入。
+
+        Args:
+            db: Database 实例（可选）
+            ledger_ids: 仅处理这些账本，默认处理全部待重算账本
+        """
+        with self._rr_lock:
+            targets = [
+                (lid, self._pending_return_rate.pop(lid))
+                for lid in (
+                    list(self._pending_return_rate) if ledger_ids is None else ledger_ids
+                )
+                if lid in self._pending_return_rate and lid not in self._rr_inflight
+            ]
+        for ledger_id, from_date in targets:
+            self._generate_return_rate(db, ledger_id, from_date)
+
+    def schedule_return_rate(self, db=None, ledger_ids: Optional[List[int]] = None) -> None:
+        """将延后的账本提交到后台线程重算收益净值，调用方立即返回
+
+        同一账本已在后台排队或执行时不重复提交：后台任务结束前会再次检查该账本，
+        期间新记录的日期合并为一次重算。
+        """
+        with self._rr_lock:
+            targets = [
+                lid
+                for lid in (
+                    list(self._pending_return_rate) if ledger_ids is None else ledger_ids
+                )
+                if lid in self._pending_return_rate and lid not in self._rr_inflight
+            ]
+            if not targets:
+                return
+            if self._rr_executor is None:
+                self._rr_executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="fino-return-rate"
+                )
+            self._rr_inflight.update(targets)
+        for ledger_id in targets:
+            self._rr_executor.submit(self._return_rate_worker, db, ledger_id)
+
+    def _return_rate_worker(self, db, ledger_id: int) -> None:
+        """后台任务：重算该账本收益净值，直至没有新的待重算日期；结束后归还本线程的连接"""
+        try:
+            while True:
+                with self._rr_lock:
+                    from_date = self._pending_return_rate.pop(ledger_id, None)
+                    if from_date is None:
+                        self._rr_inflight.discard(ledger_id)
+                        return
+                self._generate_return_rate(db, ledger_id, from_date)
+        finally:
+            release = getattr(self.db_manager, "release_connection", None)
+            if callable(release):
+                release()
+
+    def _generate_return_rate(self, db, ledger_id: int, from_date: str) -> None:
+        try:
+            generate_return_rate(
+                self.conn,
+                ledger_id=ledger_id,
+                full_refresh=True,
+                write_to_db=True,
+                db=db,
+                incremental_from_date=from_date or None,
+            )
+        except Exception as e:
+            logging.error(f"重新计算收益净值失败（账本 {ledger_id}）: {e}")
+
+    def delete_transactions_bulk(
+        self, transaction_ids: List[int], analytics, db=None
+    ) -> bool:
+        """批量删除交易记录：一次查询受影响范围、一次事务完成删除，最后统一重建持仓、快照与收益净值
+
+        Args:
+            transaction_ids: 交易记录ID列表
+            analytics: Analytics 实例，用于重新同步持仓
+            db: Database 实例，用于重新生成持仓历史（可选）
+
+        Returns:
+            bool: 是否成功
+        """
+        ids = list(dict.fromkeys(int(i) for i in transaction_ids))
+        if not ids:
+            return False
+        placeholders = ",".join("?" * len(ids))
+        try:
+            cursor = self._cursor
+            cursor.execute(
+                f"SELECT ledger_id, account_id, code, date FROM transactions WHERE id IN ({placeholders})",
+                ids,
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return False
+
+            # 各 (账本, 账户, 代码) 受影响的最早日期
+            first_dates: Dict[tuple, str] = {}
+            for ledger_id, account_id, code, date_str in rows:
+                key = (ledger_id, account_id, code)
+                if key not in first_dates or date_str < first_dates[key]:
+                    first_dates[key] = date_str
+
+            self._begin_immediate(cursor)
+            cursor.executemany(
+                """
+                DELETE FROM position_history
+                WHERE ledger_id = ? AND account_id = ? AND code = ? AND date >= ?
+            """,
+                [(*key, date_str) for key, date_str in first_dates.items()],
+            )
+            cursor.execute(
+                f"DELETE FROM fund_transactions WHERE transaction_id IN ({placeholders})",
+                ids,
+            )
+            cursor.execute(f"DELETE FROM transactions WHERE id IN ({placeholders})", ids)
+            self.conn.commit()
+
+            analytics.rebuild_positions_for(first_dates.keys())
+
+            # 按账户、账本取最早日期，各只重算一次
+            account_dates: Dict[tuple, str] = {}
+            ledger_dates: Dict[int, str] = {}
+            for (ledger_id, account_id, _), date_str in first_dates.items():
+                account_key = (ledger_id, account_id)
+                if date_str < account_dates.get(account_key, "9999-99-99"):
+                    account_dates[account_key] = date_str
+                if date_str < ledger_dates.get(ledger_id, "9999-99-99"):
+                    ledger_dates[ledger_id] = date_str
+
+            # 重新生成持仓历史快照（从最早交易日期到昨天，不查询价格API）
+            if db is not None:
+                end_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+                for (ledger_id, account_id), date_str in account_dates.items():
+                    if date_str <= end_date:
+                        db.generate_snapshots_only(
+                            date_str, end_date, ledger_id, account_id
+                        )
+
+            # 净值法增量重算：每个账本从最早受影响日期开始，在后台线程执行
+            for ledger_id, date_str in ledger_dates.items():
+                self.mark_return_rate(ledger_id, date_str)
+            self.schedule_return_rate(db, list(ledger_dates))
+
+            return True
+        except Exception as e:
+            logging.error(f"批量删除交易记录失败: {e}")
+            self.conn.rollback()
+            return False
+
     def add_fund_transaction(self, fund_trans: Dict, analytics) -> bool:
         """添加资金明细记录（支持多借多贷）
 
@@ -747,40 +1214,27 @@ class TransactionCRUD:
         Returns:
             bool: 是否成功
         """
-        def _resolve_currency(cursor, curr):
-            """将 code 或 id 解析为 (currency_id, code)。"""
-            if curr is None or curr == "":
-                curr = "CNY"
-            if isinstance(curr, int) or (
-                isinstance(curr, str) and (curr or "").isdigit()
-            ):
-                cid = int(curr or 0)
-                r = cursor.execute(
-                    "SELECT id, code FROM currencies WHERE id = ? LIMIT 1", (cid,)
-                ).fetchone()
-                return (r[0], r[1]) if r else (None, None)
-            cursor.execute(
-                "SELECT id, code FROM currencies WHERE code = ? LIMIT 1", (curr or "CNY",)
-            )
-            r = cursor.fetchone()
-            return (r[0], r[1]) if r else (None, None)
-
         try:
-            cursor = self.conn.cursor()
+            cursor = self._cursor
+            self._begin_immediate(cursor)
             entries = fund_trans.get("entries", [])
 
             # 主记录 currency_id：有 entries 时用首条分录币种，否则用 fund_trans.currency
             if entries:
                 first_curr = entries[0].get("currency", fund_trans.get("currency", "CNY"))
-                currency_id, _ = _resolve_currency(cursor, first_curr)
+                currency_id, currency_code = self._resolve_currency_id_code(cursor, first_curr)
             else:
-                currency_id, _ = _resolve_currency(cursor, fund_trans.get("currency", "CNY"))
+                currency_id, currency_code = self._resolve_currency_id_code(
+                    cursor, fund_trans.get("currency", "CNY")
+                )
             if currency_id is None:
                 logging.warning("无法解析 currency 为有效 id，添加资金明细失败")
+                self.conn.rollback()
                 return False
 
             # 创建主交易记录
-            cursor.execute(
+            transaction_id = self._insert_returning_id(
+                cursor,
                 """
                 INSERT INTO fund_transactions (
                     ledger_id, date, type, currency_id, notes
@@ -796,25 +1250,14 @@ class TransactionCRUD:
                 ),
             )
 
-            transaction_id = cursor.lastrowid
-
             # 添加借贷分录明细
             if not entries:
                 # 兼容旧格式：如果没有entries，尝试从旧字段创建
                 if "debit_account" in fund_trans or "credit_account" in fund_trans:
                     # 旧格式，需要迁移
                     amount = fund_trans.get("amount", 0)
-                    curr = fund_trans.get("currency", "CNY")
-                    curr_code = (
-                        curr
-                        if isinstance(curr, str)
-                        else (
-                            cursor.execute(
-                                "SELECT code FROM currencies WHERE id=?", (curr,)
-                            ).fetchone()
-                            or ("CNY",)
-                        )[0]
-                    )
+                    # 无 entries 时主记录币种即 fund_trans.currency，上面已解析出代码
+                    curr_code = currency_code
                     fund_date = fund_trans.get("date")
                     if fund_date:
                         amount_cny = analytics.convert_to_cny_at_date(
@@ -823,104 +1266,28 @@ class TransactionCRUD:
                     else:
                         amount_cny = analytics.convert_to_cny(amount, curr_code)
 
-                    # 旧格式：分录使用主记录同一币种
-                    ent_currency_id = currency_id
-                    if fund_trans.get("account_id"):
-                        cursor.execute(
-                            """
-                            INSERT INTO fund_transaction_entries 
-                            (fund_transaction_id, account_id, side, amount, amount_cny, currency_id, subject_type)
-                            VALUES (?, ?, 'debit', ?, ?, ?, 'cash')
-                        """,
-                            (
-                                transaction_id,
-                                fund_trans["account_id"],
-                                amount,
-                                amount_cny,
-                                ent_currency_id,
-                            ),
-                        )
-
-                    if fund_trans.get("target_account_id"):
-                        cursor.execute(
-                            """
-                            INSERT INTO fund_transaction_entries 
-                            (fund_transaction_id, account_id, side, amount, amount_cny, currency_id, subject_type)
-                            VALUES (?, ?, 'credit', ?, ?, ?, 'cash')
-                        """,
-                            (
-                                transaction_id,
-                                fund_trans["target_account_id"],
-                                amount,
-                                amount_cny,
-                                ent_currency_id,
-                            ),
-                        )
-                    elif fund_trans.get("account_id"):
-                        cursor.execute(
-                            """
-                            INSERT INTO fund_transaction_entries 
-                            (fund_transaction_id, account_id, side, amount, amount_cny, currency_id, subject_type)
-                            VALUES (?, ?, 'credit', ?, ?, ?, 'cash')
-                        """,
-                            (
-                                transaction_id,
-                                fund_trans["account_id"],
-                                amount,
-                                amount_cny,
-                                ent_currency_id,
-                            ),
-                        )
+                    # 旧格式：分录使用主记录同一币种；account_id 为借方，贷方为 target_account_id（缺省同 account_id）
+                    debit_account = fund_trans.get("account_id")
+                    credit_account = fund_trans.get("target_account_id") or debit_account
+                    cursor.executemany(
+                        self._INSERT_FUND_ENTRY_WITH_CURRENCY_SQL,
+                        [
+                            (transaction_id, account, side, amount, amount_cny, currency_id, "cash")
+                            for account, side in ((debit_account, "debit"), (credit_account, "credit"))
+                            if account
+                        ],
+                    )
                 else:
                     raise ValueError("必须提供 entries 或兼容的旧格式字段")
             else:
                 # 多借多贷：每笔分录可有独立币种，按人民币折算后校验借贷平衡
-                fund_date = fund_trans.get("date")
-                debit_cny = 0.0
-                credit_cny = 0.0
-                entries_with_cny = []
-                for entry in entries:
-                    entry_curr = entry.get("currency", fund_trans.get("currency", "CNY"))
-                    ent_currency_id, curr_code = _resolve_currency(cursor, entry_curr)
-                    if ent_currency_id is None:
-                        raise ValueError(f"分录币种无法解析: {entry_curr}")
-                    amount = entry["amount"]
-                    if fund_date:
-                        amount_cny = analytics.convert_to_cny_at_date(
-                            amount, curr_code, fund_date
-                        )
-                    else:
-                        amount_cny = analytics.convert_to_cny(amount, curr_code)
-                    if entry["side"] == "debit":
-                        debit_cny += amount_cny
-                    else:
-                        credit_cny += amount_cny
-                    entries_with_cny.append(
-                        (entry["account_id"], entry["side"], amount, amount_cny, entry.get("subject_type", "cash"), ent_currency_id)
-                    )
-
-                if abs(debit_cny - credit_cny) > 0.01:
-                    raise ValueError(
-                        f"借贷不平衡（按人民币折算）：借方 {debit_cny:.2f}，贷方 {credit_cny:.2f}"
-                    )
-
-                for account_id, side, amount, amount_cny, subject_type, ent_currency_id in entries_with_cny:
-                    cursor.execute(
-                        """
-                        INSERT INTO fund_transaction_entries 
-                        (fund_transaction_id, account_id, side, amount, amount_cny, currency_id, subject_type)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """,
-                        (
-                            transaction_id,
-                            account_id,
-                            side,
-                            amount,
-                            amount_cny,
-                            ent_currency_id,
-                            subject_type,
-                        ),
-                    )
+                cursor.executemany(
+                    self._INSERT_FUND_ENTRY_WITH_CURRENCY_SQL,
+                    [
+                        (transaction_id,) + row
+                        for row in self._balanced_entry_rows(cursor, fund_trans, entries, analytics)
+                    ],
+                )
 
             self.conn.commit()
             return True
@@ -941,6 +1308,7 @@ class TransactionCRUD:
         end_date: Optional[str] = None,
         limit: Optional[int] = None,
         offset: Optional[int] = None,
+        with_total: bool = False,
     ) -> pd.DataFrame:
         """获取资金明细记录（支持多借多贷）
 
@@ -952,110 +1320,130 @@ class TransactionCRUD:
             end_date: 结束日期（可选）
             limit: 限制返回数量（可选）
             offset: 偏移量，用于分页（可选）
+            with_total: 是否附加 total_count 列（分页前的总条数，同一查询中的计数子查询计算）
 
         Returns:
             pd.DataFrame: 资金明细数据框
         """
-        # 借贷记账法：借方/贷方展示为「账户-子科目(持仓/现金) 金额」，持仓与现金为账户下子科目
-        query = """
-            SELECT 
-                ft.id,
-                ft.ledger_id,
-                ft.date,
-                ft.type,
-                c.code as currency,
-                ft.notes,
-                ft.created_at,
-                l.name as ledger_name,
-                c.symbol as currency_symbol,
-                COALESCE((
-                    SELECT GROUP_CONCAT(
-                        a.name || '-' || (CASE WHEN COALESCE(fte.subject_type,'cash')='position' THEN '持仓' ELSE '现金' END) || ' ' || fte.amount,
-                        '; '
-                    )
-                    FROM fund_transaction_entries fte
-                    LEFT JOIN accounts a ON fte.account_id = a.id
-                    WHERE fte.fund_transaction_id = ft.id AND fte.side = 'debit'
-                ), '') as debit_display,
-                COALESCE((
-                    SELECT GROUP_CONCAT(
-                        a.name || '-' || (CASE WHEN COALESCE(fte.subject_type,'cash')='position' THEN '持仓' ELSE '现金' END) || ' ' || fte.amount,
-                        '; '
-                    )
-                    FROM fund_transaction_entries fte
-                    LEFT JOIN accounts a ON fte.account_id = a.id
-                    WHERE fte.fund_transaction_id = ft.id AND fte.side = 'credit'
-                ), '') as credit_display,
-                COALESCE((
-                    SELECT GROUP_CONCAT(a.name || ' (' || fte.amount || ')', '; ')
-                    FROM fund_transaction_entries fte
-                    LEFT JOIN accounts a ON fte.account_id = a.id
-                    WHERE fte.fund_transaction_id = ft.id AND fte.side = 'debit'
-                ), '') as debit_accounts,
-                COALESCE((
-                    SELECT GROUP_CONCAT(a.name || ' (' || fte.amount || ')', '; ')
-                    FROM fund_transaction_entries fte
-                    LEFT JOIN accounts a ON fte.account_id = a.id
-                    WHERE fte.fund_transaction_id = ft.id AND fte.side = 'credit'
-                ), '') as credit_accounts,
-                COALESCE((
-                    SELECT SUM(fte.amount)
-                    FROM fund_transaction_entries fte
-                    WHERE fte.fund_transaction_id = ft.id AND fte.side = 'debit'
-                ), 0) as total_debit,
-                COALESCE((
-                    SELECT SUM(fte.amount)
-                    FROM fund_transaction_entries fte
-                    WHERE fte.fund_transaction_id = ft.id AND fte.side = 'credit'
-                ), 0) as total_credit,
-                COALESCE((
-                    SELECT SUM(fte.amount_cny)
-                    FROM fund_transaction_entries fte
-                    WHERE fte.fund_transaction_id = ft.id AND fte.side = 'debit'
-                ), 0) as total_debit_cny,
-                COALESCE((
-                    SELECT SUM(fte.amount_cny)
-                    FROM fund_transaction_entries fte
-                    WHERE fte.fund_transaction_id = ft.id AND fte.side = 'credit'
-                ), 0) as total_credit_cny
-            FROM fund_transactions ft
-            LEFT JOIN ledgers l ON ft.ledger_id = l.id
-            LEFT JOIN currencies c ON ft.currency_id = c.id
-            WHERE 1=1
-        """
+        # 先按条件筛选并分页资金明细，再只对本页记录关联分录、按借贷方向一次聚合
+        where = " WHERE 1=1"
         params = []
 
-        if ledger_id:
-            query += " AND ft.ledger_id = ?"
+        single_ledger = self._begin_single_ledger_read(ledger_id)
+        if ledger_id and not single_ledger:
+            where += " AND ft.ledger_id = ?"
             params.append(ledger_id)
 
         if account_id:
-            query += """ AND EXISTS (
-                SELECT 1 FROM fund_transaction_entries fte 
-                WHERE fte.fund_transaction_id = ft.id AND fte.account_id = ?
+            # 非关联子查询：按 (account_id, fund_transaction_id) 索引一次取出该账户涉及的资金明细 id，
+            # 再按主键匹配，避免对每条资金明细逐条探查分录
+            where += """ AND ft.id IN (
+                SELECT fund_transaction_id FROM fund_transaction_entries
+                WHERE account_id = ?
             )"""
             params.append(account_id)
 
         if trans_type:
-            query += " AND ft.type = ?"
+            where += " AND ft.type = ?"
             params.append(trans_type)
 
         if start_date:
-            query += " AND ft.date >= ?"
+            where += " AND ft.date >= ?"
             params.append(start_date)
 
         if end_date:
-            query += " AND ft.date <= ?"
+            where += " AND ft.date <= ?"
             params.append(end_date)
 
-        query += " ORDER BY ft.date DESC, ft.id DESC"
-
+        # 总数用不相关的计数子查询在同一次往返中得出，只执行一次且可走覆盖索引；
+        # 窗口函数 COUNT(*) OVER () 会迫使分页前物化并排序全部匹配行，LIMIT 无法提前结束
+        total_col = ""
+        if with_total:
+            total_col = f", (SELECT COUNT(*) FROM fund_transactions ft{where}) as total_count"
+            params = params + params
+        page_query = f"""
+            SELECT ft.id, ft.ledger_id, ft.date, ft.type, ft.currency_id, ft.notes, ft.created_at{total_col}
+            FROM fund_transactions ft{where}
+            ORDER BY ft.date DESC, ft.id DESC"""
+
+        # LIMIT/OFFSET 用参数传入，翻页时 SQL 文本不变，可复用已预编译的语句
         if limit:
-            query += f" LIMIT {limit}"
+            page_query += " LIMIT ?"
+            params.append(int(limit))
             if offset is not None:
-                query += f" OFFSET {offset}"
+                page_query += " OFFSET ?"
+                params.append(int(offset))
 
-        return pd.read_sql_query(query, self.conn, params=params)
+        # 借贷记账法：借方/贷方展示为「账户-子科目(持仓/现金) 金额」，持仓与现金为账户下子科目
+        # 分录按 id 排序后再聚合，拼接顺序与录入顺序一致
+        query = f"""
+            WITH page AS ({page_query}),
+            entries AS (
+                SELECT fte.fund_transaction_id, fte.side, fte.amount, fte.amount_cny,
+                       fte.subject_type, a.name AS account_name
+                FROM page
+                JOIN fund_transaction_entries fte ON fte.fund_transaction_id = page.id
+                LEFT JOIN accounts a ON fte.account_id = a.id
+                ORDER BY fte.fund_transaction_id, fte.id
+            ),
+            agg AS (
+                SELECT
+                    fund_transaction_id,
+                    GROUP_CONCAT(
+                        CASE WHEN side = 'debit' THEN
+                            account_name || '-' || (CASE WHEN COALESCE(subject_type,'cash')='position' THEN '持仓' ELSE '现金' END) || ' ' || amount
+                        END,
+                        '; '
+                    ) AS debit_display,
+                    GROUP_CONCAT(
+                        CASE WHEN side = 'credit' THEN
+                            account_name || '-' || (CASE WHEN COALESCE(subject_type,'cash')='position' THEN '持仓' ELSE '现金' END) || ' ' || amount
+                        END,
+                        '; '
+                    ) AS credit_display,
+                    GROUP_CONCAT(
+                        CASE WHEN side = 'debit' THEN account_name || ' (' || amount || ')' END, '; '
+                    ) AS debit_accounts,
+                    GROUP_CONCAT(
+                        CASE WHEN side = 'credit' THEN account_name || ' (' || amount || ')' END, '; '
+                    ) AS credit_accounts,
+                    SUM(CASE WHEN side = 'debit' THEN amount END) AS total_debit,
+                    SUM(CASE WHEN side = 'credit' THEN amount END) AS total_credit,
+                    SUM(CASE WHEN side = 'debit' THEN amount_cny END) AS total_debit_cny,
+                    SUM(CASE WHEN side = 'credit' THEN amount_cny END) AS total_credit_cny
+                FROM entries
+                GROUP BY fund_transaction_id
+            )
+            SELECT 
+                page.id,
+                page.ledger_id,
+                page.date,
+                page.type,
+                c.code as currency,
+                page.notes,
+                page.created_at,
+                l.name as ledger_name,
+                c.symbol as currency_symbol,
+                COALESCE(agg.debit_display, '') as debit_display,
+                COALESCE(agg.credit_display, '') as credit_display,
+                COALESCE(agg.debit_accounts, '') as debit_accounts,
+                COALESCE(agg.credit_accounts, '') as credit_accounts,
+                COALESCE(agg.total_debit, 0) as total_debit,
+                COALESCE(agg.total_credit, 0) as total_credit,
+                COALESCE(agg.total_debit_cny, 0) as total_debit_cny,
+                COALESCE(agg.total_credit_cny, 0) as total_credit_cny{", page.total_count" if with_total else ""}
+            FROM page
+            LEFT JOIN ledgers l ON page.ledger_id = l.id
+            LEFT JOIN currencies c ON page.currency_id = c.id
+            LEFT JOIN agg ON agg.fund_transaction_id = page.id
+            ORDER BY page.date DESC, page.id DESC
+        """
+
+        try:
+            return self._read_sql_chunked(query, params)
+        finally:
+            if single_ledger:
+                self.conn.commit()
 
     def get_fund_transactions_count(
         self,
@@ -1084,14 +1472,15 @@ class TransactionCRUD:
         """
         params = []
 
-        if ledger_id:
+        single_ledger = self._begin_single_ledger_read(ledger_id)
+        if ledger_id and not single_ledger:
             query += " AND ft.ledger_id = ?"
             params.append(ledger_id)
 
         if account_id:
-            query += """ AND EXISTS (
-                SELECT 1 FROM fund_transaction_entries fte 
-                WHERE fte.fund_transaction_id = ft.id AND fte.account_id = ?
+            query += """ AND ft.id IN (
+                SELECT fund_transaction_id FROM fund_transaction_entries
+                WHERE account_id = ?
             )"""
             params.append(account_id)
 
@@ -1108,13 +1497,17 @@ class TransactionCRUD:
             params.append(end_date)
 
         try:
-            cursor = self.conn.cursor()
+            self._explain(query, params)
+            cursor = self._cursor
             cursor.execute(query, params)
             result = cursor.fetchone()
             return result[0] if result else 0
         except Exception as e:
             logging.error(f"获取资金明细记录总数失败: {e}")
             return 0
+        finally:
+            if single_ledger:
+                self.conn.commit()
 
     def get_fund_transaction_by_id(self, fund_trans_id: int) -> Optional[Dict]:
         """根据ID获取单条资金明细记录（包含多借多贷明细）
@@ -1126,7 +1519,7 @@ class TransactionCRUD:
             Dict: 资金明细字典，如果不存在则返回 None
         """
         try:
-            cursor = self.conn.cursor()
+            cursor = self._cursor
             # 获取主记录
             cursor.execute(
                 """
@@ -1154,14 +1547,9 @@ class TransactionCRUD:
                 """,
                     (fund_trans_id,),
                 )
-                entries = []
-                for entry_row in cursor.fetchall():
-                    entry_columns = [
-                        description[0] for description in cursor.description
-                    ]
-                    entries.append(dict(zip(entry_columns, entry_row)))
-
-                result["entries"] = entries
+                entry_rows = cursor.fetchall()
+                entry_columns = [description[0] for description in cursor.description]
+                result["entries"] = [dict(zip(entry_columns, r)) for r in entry_rows]
                 return result
             return None
         except Exception as e:
@@ -1179,6 +1567,7 @@ class TransactionCRUD:
         end_date: Optional[str] = None,
         limit: Optional[int] = None,
         offset: Optional[int] = None,
+        with_total: bool = False,
     ) -> pd.DataFrame:
         """获取指定账户的资金变动明细（基于 fund_transaction_entries）
 
@@ -1192,26 +1581,23 @@ class TransactionCRUD:
             end_date: 结束日期（可选）
             limit: 限制返回数量（可选）
             offset: 偏移量（可选）
+            with_total: 是否附加 total_count 列（分页前的总条数，窗口函数计算；
+                不支持窗口函数的旧版 SQLite 不附加，由调用方另行计数）
 
         Returns:
             pd.DataFrame: 账户变动明细
         """
-        query = """
-            SELECT
-                ft.id as fund_transaction_id,
-                ft.date,
-                ft.type,
-                ft.notes,
-                c.code as currency,
-                fte.side,
-                fte.amount,
-                fte.amount_cny,
-                COALESCE(fte.subject_type, 'cash') as subject_type,
-                CASE WHEN fte.side = 'debit' THEN fte.amount_cny ELSE -fte.amount_cny END as balance_change_cny,
-                CASE WHEN COALESCE(fte.subject_type, 'cash') = 'cash'
-                     THEN CASE WHEN fte.side = 'debit' THEN fte.amount_cny ELSE -fte.amount_cny END
-                     ELSE 0 END as cash_change_cny,
-                (
+        # 余额为截至该分录（按日期、资金明细 id、分录 id 排序）的现金累计，需基于账户全部分录计算，
+        # 故在 CTE 内算好余额后再按类型、日期筛选与分页
+        has_window = _SQLITE_WINDOW or not isinstance(self.conn, sqlite3.Connection)
+        total_col = ",\n                COUNT(*) OVER () as total_count" if with_total and has_window else ""
+        if has_window:
+            balance_sql = """COALESCE(SUM(e.cash_change_cny) OVER (
+                    ORDER BY e.date, e.fund_transaction_id, e.entry_id
+                    ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+                ), 0)"""
+        else:
+            balance_sql = """(
                     SELECT COALESCE(SUM(
                         CASE WHEN COALESCE(fte2.subject_type, 'cash') = 'cash'
                              THEN CASE WHEN fte2.side = 'debit' THEN fte2.amount_cny ELSE -fte2.amount_cny END
@@ -1219,40 +1605,80 @@ class TransactionCRUD:
                     ), 0)
                     FROM fund_transaction_entries fte2
                     JOIN fund_transactions ft2 ON fte2.fund_transaction_id = ft2.id
-                    WHERE fte2.account_id = fte.account_id
+                    WHERE fte2.account_id = e.account_id
                     AND (
-                        ft2.date < ft.date
-                        OR (ft2.date = ft.date AND ft2.id < ft.id)
-                        OR (ft2.date = ft.date AND ft2.id = ft.id AND fte2.id <= fte.id)
+                        ft2.date < e.date
+                        OR (ft2.date = e.date AND ft2.id < e.fund_transaction_id)
+                        OR (ft2.date = e.date AND ft2.id = e.fund_transaction_id AND fte2.id <= e.entry_id)
                     )
-                ) as balance
-            FROM fund_transaction_entries fte
-            JOIN fund_transactions ft ON fte.fund_transaction_id = ft.id
-            LEFT JOIN currencies c ON ft.currency_id = c.id
-            WHERE fte.account_id = ?
+                )"""
+        query = f"""
+            WITH entries AS (
+                SELECT
+                    ft.id as fund_transaction_id,
+                    ft.date,
+                    ft.type,
+                    ft.notes,
+                    c.code as currency,
+                    fte.side,
+                    fte.amount,
+                    fte.amount_cny,
+                    COALESCE(fte.subject_type, 'cash') as subject_type,
+                    CASE WHEN fte.side = 'debit' THEN fte.amount_cny ELSE -fte.amount_cny END as balance_change_cny,
+                    CASE WHEN COALESCE(fte.subject_type, 'cash') = 'cash'
+                         THEN CASE WHEN fte.side = 'debit' THEN fte.amount_cny ELSE -fte.amount_cny END
+                         ELSE 0 END as cash_change_cny,
+                    fte.account_id,
+                    fte.id as entry_id
+                FROM fund_transaction_entries fte
+                JOIN fund_transactions ft ON fte.fund_transaction_id = ft.id
+                LEFT JOIN currencies c ON ft.currency_id = c.id
+                WHERE fte.account_id = ?
+            ),
+            balanced AS (
+                SELECT e.*, {balance_sql} as balance
+                FROM entries e
+            )
+            SELECT
+                fund_transaction_id,
+                date,
+                type,
+                notes,
+                currency,
+                side,
+                amount,
+                amount_cny,
+                subject_type,
+                balance_change_cny,
+                cash_change_cny,
+                balance{total_col}
+            FROM balanced
+            WHERE 1=1
         """
         params = [account_id]
 
         if trans_type:
-            query += " AND ft.type = ?"
+            query += " AND type = ?"
             params.append(trans_type)
 
         if start_date:
-            query += " AND ft.date >= ?"
+            query += " AND date >= ?"
             params.append(start_date)
 
         if end_date:
-            query += " AND ft.date <= ?"
+            query += " AND date <= ?"
             params.append(end_date)
 
-        query += " ORDER BY ft.date DESC, ft.id DESC, fte.id DESC"
+        query += " ORDER BY date DESC, fund_transaction_id DESC, entry_id DESC"
 
         if limit:
-            query += f" LIMIT {limit}"
+            query += " LIMIT ?"
+            params.append(int(limit))
             if offset is not None:
-                query += f" OFFSET {offset}"
+                query += " OFFSET ?"
+                params.append(int(offset))
 
-        return pd.read_sql_query(query, self.conn, params=params)
+        return self._read_sql_chunked(query, params)
 
     def get_account_transaction_entries_count(
         self,
@@ -1283,7 +1709,8 @@ class TransactionCRUD:
             params.append(end_date)
 
         try:
-            cursor = self.conn.cursor()
+            self._explain(query, params)
+            cursor = self._cursor
             cursor.execute(query, params)
             result = cursor.fetchone()
             return result[0] if result else 0
@@ -1296,7 +1723,7 @@ class TransactionCRUD:
     ) -> bool:
         """更新资金明细（仅允许无关联交易的本金投入/撤出/收入/支出/内转）。"""
         try:
-            cursor = self.conn.cursor()
+            cursor = self._cursor
             cursor.execute(
                 "SELECT transaction_id FROM fund_transactions WHERE id = ?",
                 (fund_trans_id,),
@@ -1305,30 +1732,11 @@ class TransactionCRUD:
             if row and row[0] is not None:
                 raise ValueError("开仓/平仓关联的资金明细请到交易明细中编辑")
 
-            def _resolve_currency(cursor, curr):
-                if curr is None or curr == "":
-                    curr = "CNY"
-                if isinstance(curr, int) or (
-                    isinstance(curr, str) and (curr or "").isdigit()
-                ):
-                    cid = int(curr or 0)
-                    r = cursor.execute(
-                        "SELECT id, code FROM currencies WHERE id = ? LIMIT 1",
-                        (cid,),
-                    ).fetchone()
-                    return (r[0], r[1]) if r else (None, None)
-                cursor.execute(
-                    "SELECT id, code FROM currencies WHERE code = ? LIMIT 1",
-                    (curr or "CNY",),
-                )
-                r = cursor.fetchone()
-                return (r[0], r[1]) if r else (None, None)
-
             entries = fund_trans.get("entries", [])
             if not entries:
                 raise ValueError("必须提供 entries")
             first_curr = entries[0].get("currency", fund_trans.get("currency", "CNY"))
-            currency_id, _ = _resolve_currency(cursor, first_curr)
+            currency_id, _ = self._resolve_currency_id_code(cursor, first_curr)
             if currency_id is None:
                 raise ValueError("无法解析币种")
 
@@ -1351,66 +1759,13 @@ class TransactionCRUD:
                 (fund_trans_id,),
             )
 
-            fund_date = fund_trans.get("date")
-            debit_cny = 0.0
-            credit_cny = 0.0
-            entries_with_cny = []
-            for entry in entries:
-                entry_curr = entry.get("currency", fund_trans.get("currency", "CNY"))
-                ent_currency_id, curr_code = _resolve_currency(cursor, entry_curr)
-                if ent_currency_id is None:
-                    raise ValueError(f"分录币种无法解析: {entry_curr}")
-                amount = entry["amount"]
-                if fund_date:
-                    amount_cny = analytics.convert_to_cny_at_date(
-                        amount, curr_code, fund_date
-                    )
-                else:
-                    amount_cny = analytics.convert_to_cny(amount, curr_code)
-                if entry["side"] == "debit":
-                    debit_cny += amount_cny
-                else:
-                    credit_cny += amount_cny
-                entries_with_cny.append(
-                    (
-                        entry["account_id"],
-                        entry["side"],
-                        amount,
-                        amount_cny,
-                        entry.get("subject_type", "cash"),
-                        ent_currency_id,
-                    )
-                )
-
-            if abs(debit_cny - credit_cny) > 0.01:
-                raise ValueError(
-                    f"借贷不平衡（按人民币折算）：借方 {debit_cny:.2f}，贷方 {credit_cny:.2f}"
-                )
-
-            for (
-                account_id,
-                side,
-                amount,
-                amount_cny,
-                subject_type,
-                ent_currency_id,
-            ) in entries_with_cny:
-                cursor.execute(
-                    """
-                    INSERT INTO fund_transaction_entries
-                    (fund_transaction_id, account_id, side, amount, amount_cny, currency_id, subject_type)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        fund_trans_id,
-                        account_id,
-                        side,
-                        amount,
-                        amount_cny,
-                        ent_currency_id,
-                        subject_type,
-                    ),
-                )
+            cursor.executemany(
+                self._INSERT_FUND_ENTRY_WITH_CURRENCY_SQL,
+                [
+                    (fund_trans_id,) + row
+                    for row in self._balanced_entry_rows(cursor, fund_trans, entries, analytics)
+                ],
+            )
 
             self.conn.commit()
             return True
@@ -1431,7 +1786,8 @@ class TransactionCRUD:
             bool: 是否成功
         """
         try:
-            cursor = self.conn.cursor()
+            cursor = self._cursor
+            self._begin_immediate(cursor)
             cursor.execute(
                 "SELECT transaction_id FROM fund_transactions WHERE id = ?",
                 (fund_trans_id,),
@@ -1439,7 +1795,8 @@ class TransactionCRUD:
             row = cursor.fetchone()
             linked_transaction_id = row[0] if row and row[0] is not None else None
             if linked_transaction_id is not None:
-                # 有关联交易：先删除受影响的持仓历史，再删除该交易对应的全部资金明细，最后删交易
+                # 有关联交易：先删除受影响的持仓历史，再删除该交易对应的全部资金明细，最后删交易；
+                # 分录均由外键 ON DELETE CASCADE 随资金明细删除
                 self._delete_position_history_for_transaction(
                     cursor, linked_transaction_id
                 )
@@ -1458,6 +1815,7 @@ class TransactionCRUD:
             return True
         except Exception as e:
             logging.error(f"删除资金明细失败: {e}")
+            self.conn.rollback()
             return False
 
     def add_transaction_with_fund(self, transaction: Dict, analytics) -> bool:
@@ -1471,71 +1829,14 @@ class TransactionCRUD:
             bool: 是否成功
         """
         try:
-            cursor = self.conn.cursor()
-            cat = transaction.get("category")
-            if isinstance(cat, int) or (isinstance(cat, str) and (cat or "").isdigit()):
-                category_id = int(cat or 0)
-            else:
-                cursor.execute(
-                    "SELECT id FROM categories WHERE name = ? LIMIT 1", (cat or "",)
-                )
-                r = cursor.fetchone()
-                category_id = r[0] if r else None
-            if category_id is None:
-                cursor.execute(
-                    "SELECT id FROM categories WHERE name = ? LIMIT 1", ("其他",)
-                )
-                r = cursor.fetchone()
-                category_id = r[0] if r else None
-            if category_id is None:
-                cursor.execute("SELECT id FROM categories ORDER BY id LIMIT 1")
-                r = cursor.fetchone()
-                category_id = r[0] if r else None
-            if category_id is None:
-                logging.warning(
-                    "无法解析 category 为有效 id（未提供且数据库中无投资类别），添加交易及资金明细失败"
-                )
+            cursor = self._cursor
+            # 交易、资金明细与分录在同一写事务中插入并一次提交，开始即取得写锁，避免中途升级锁时遇到 SQLITE_BUSY
+            self._begin_immediate(cursor)
+            resolved = self._resolve_category_currency(cursor, transaction, "添加交易及资金明细")
+            if resolved is None:
+                self.conn.rollback()
                 return False
-
-            curr = transaction.get("currency", "CNY")
-            if isinstance(curr, int) or (
-                isinstance(curr, str) and (curr or "").isdigit()
-            ):
-                currency_id = int(curr or 0)
-            else:
-                code = (curr or "CNY").strip() or "CNY"
-                cursor.execute(
-                    "SELECT id FROM currencies WHERE code = ? LIMIT 1", (code,)
-                )
-                r = cursor.fetchone()
-                currency_id = r[0] if r else None
-                if currency_id is None and code:
-                    ensure = getattr(
-                        self.db_manager, "ensure_currency_exists", None
-                    )
-                    if callable(ensure):
-                        ensure(code)
-                    cursor.execute(
-                        "SELECT id FROM currencies WHERE code = ? LIMIT 1",
-                        (code.upper(),),
-                    )
-                    r = cursor.fetchone()
-                    currency_id = r[0] if r else None
-            if currency_id is None:
-                logging.warning(
-                    "无法解析 currency 为有效 id（币种 %s 不存在），添加交易及资金明细失败",
-                    curr,
-                )
-                return False
-            curr_code = (
-                curr if isinstance(curr, str) and not (curr or "").isdigit() else None
-            )
-            if not curr_code:
-                cursor.execute(
-                    "SELECT code FROM currencies WHERE id = ?", (currency_id,)
-                )
-                row = cursor.fetchone()
-                curr_code = row[0] if row else "CNY"
+            category_id, currency_id, curr_code = resolved
             trans_date = transaction.get("date")
             if trans_date:
                 amount_cny = analytics.convert_to_cny_at_date(
@@ -1544,12 +1845,9 @@ class TransactionCRUD:
             else:
                 amount_cny = analytics.convert_to_cny(transaction["amount"], curr_code)
 
-            cursor.execute(
-                """
-                INSERT INTO transactions (ledger_id, account_id, date, type, category_id, code, name,
-                                         quantity, price, currency_id, amount, amount_cny, fee, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
+            transaction_id = self._insert_returning_id(
+                cursor,
+                self._INSERT_TRANSACTION_SQL,
                 (
                     transaction["ledger_id"],
                     transaction["account_id"],
@@ -1567,18 +1865,11 @@ class TransactionCRUD:
                     transaction.get("notes", ""),
                 ),
             )
-
-            transaction_id = cursor.lastrowid
             analytics.update_position(transaction, transaction_id)
 
-            account_id = transaction["account_id"]
-            cursor.execute(
-                """
-                INSERT INTO fund_transactions (
-                    ledger_id, date, type, currency_id, notes, transaction_id
-                )
-                VALUES (?, ?, ?, ?, ?, ?)
-            """,
+            fund_transaction_id = self._insert_returning_id(
+                cursor,
+                self._INSERT_LINKED_FUND_TRANSACTION_SQL,
                 (
                     transaction["ledger_id"],
                     transaction["date"],
@@ -1589,67 +1880,11 @@ class TransactionCRUD:
                 ),
             )
 
-            fund_transaction_id = cursor.lastrowid
-
-            # 开仓和平仓的资金变动：在核心层区分持仓与现金
-            # 开仓：借-持仓(增)、贷-现金(减)；平仓：借-现金(增)、贷-持仓(减)
-            trans_type = transaction["type"]
-            if trans_type == "开仓":
-                entries = [
-                    {
-                        "account_id": account_id,
-                        "side": "debit",
-                        "amount": transaction["amount"],
-                        "subject_type": "position",
-                    },
-                    {
-                        "account_id": account_id,
-                        "side": "credit",
-                        "amount": transaction["amount"],
-                        "subject_type": "cash",
-                    },
-                ]
-            else:
-                entries = [
-                    {
-                        "account_id": account_id,
-                        "side": "debit",
-                        "amount": transaction["amount"],
-                        "subject_type": "cash",
-                    },
-                    {
-                        "account_id": account_id,
-                        "side": "credit",
-                        "amount": transaction["amount"],
-                        "subject_type": "position",
-                    },
-                ]
-
-            trans_date = transaction.get("date")
-            for entry in entries:
-                amount = entry["amount"]
-                if trans_date:
-                    amount_cny_entry = analytics.convert_to_cny_at_date(
-                        amount, curr_code, trans_date
-                    )
-                else:
-                    amount_cny_entry = analytics.convert_to_cny(amount, curr_code)
-                subject_type = entry.get("subject_type", "cash")
-                cursor.execute(
-                    """
-                    INSERT INTO fund_transaction_entries 
-                    (fund_transaction_id, account_id, side, amount, amount_cny, subject_type)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                    (
-                        fund_transaction_id,
-                        entry["account_id"],
-                        entry["side"],
-                        amount,
-                        amount_cny_entry,
-                        subject_type,
-                    ),
-                )
+            # 开仓和平仓的资金变动：在核心层区分持仓与现金；分录金额、币种、日期与交易一致，直接复用交易的人民币金额
+            cursor.executemany(
+                self._INSERT_FUND_ENTRY_SQL,
+                self._linked_entry_rows(fund_transaction_id, transaction, amount_cny),
+            )
 
             # 手续费已包含在开仓/平仓的 amount 中（开仓：amount=数量*价格+手续费；平仓：amount=数量*价格-手续费），
             # 无需额外创建支出类型的资金明细，否则会重复记账
@@ -10,7 +10,7 @@
 
 import sqlite3
 import pandas as pd
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
 from datetime import datetime, timedelta
 import logging
 
@@ -83,7 +83,6 @@ class Database:
             d1_database_id=db_kwargs.get("d1_database_id") or cfg["d1"]["database_id"],
             d1_api_token=db_kwargs.get("d1_api_token") or cfg["d1"]["api_token"],
         )
-        self.conn = self.db_manager.get_connection()
 
         # 初始化业务操作层
         self.transaction_crud = TransactionCRUD(self.db_manager)
@@ -96,6 +95,17 @@ class Database:
         self.wac_inventory = self.analytics.wac_inventory
         self._ledger_cost_methods = self.analytics._ledger_cost_methods
 
+    @property
+    def conn(self):
+        """当前数据库连接（PostgreSQL 连接池模式下按线程借出）"""
+        return self.db_manager.get_connection()
+
+    def release_connection(self):
+        """请求结束时归还连接（仅连接池模式下有实际操作）"""
+        release = getattr(self.db_manager, "release_connection", None)
+        if release:
+            release()
+
     # ============ 账本管理 ============
 
     def get_ledgers(self, username: Optional[str] = None) -> pd.DataFrame:
@@ -309,23 +319,10 @@ class Database:
         """添加账户（currency 为币种代码，如 'CNY'）"""
         try:
             cursor = self.conn.cursor()
-            cursor.execute("SELECT id FROM currencies WHERE code = ?", (currency,))
-            row = cursor.fetchone()
-            currency_id = row[0] if row else None
+            # 币种 id 优先取自维表缓存；不存在时按默认汇率插入，随账户一并提交
+            currency_id, _ = self.transaction_crud._resolve_currency_id_code(cursor, currency)
             if currency_id is None:
-                # 尝试插入默认币种
-                rate = DEFAULT_EXCHANGE_RATES.get(currency, 1.0)
-                info = {"CNY": ("人民币", "¥"), "HKD": ("港币", "HK$"), "USD": ("美元", "$"),
-                        "EUR": ("欧元", "€"), "GBP": ("英镑", "£"), "JPY": ("日元", "¥")}
-                name_str, symbol = info.get(currency, (currency, currency))
-                cursor.execute(
-                    "INSERT OR IGNORE INTO currencies (code, name, symbol, exchange_rate) VALUES (?, ?, ?, ?)",
-                    (currency, name_str, symbol, rate),
-                )
-                self.conn.commit()
-                cursor.execute("SELECT id FROM currencies WHERE code = ?", (currency,))
-                row = cursor.fetchone()
-                currency_id = row[0] if row else None
+                currency_id = self.transaction_crud._get_or_create_currency_id(cursor, currency)
             if currency_id is None:
                 logging.warning(f"币种 '{currency}' 不存在，添加账户失败")
                 return False
@@ -344,6 +341,7 @@ class Database:
             return True
         except Exception as e:
             logging.error(f"添加账户失败: {e}")
+            self.conn.rollback()
             return False
 
     def update_account(
@@ -393,9 +391,7 @@ class Database:
             if currency is None or str(currency).strip() == "":
                 currency_id = old_currency_id
             else:
-                cursor.execute("SELECT id FROM currencies WHERE code = ?", (currency,))
-                curr_row = cursor.fetchone()
-                currency_id = curr_row[0] if curr_row else None
+                currency_id, _ = self.transaction_crud._resolve_currency_id_code(cursor, currency)
                 if currency_id is None:
                     logging.warning(f"币种 '{currency}' 不存在，更新账户失败")
                     return False
@@ -529,10 +525,12 @@ class Database:
 
     # ============ 币种管理 ============
 
-    def get_currencies(self) -> pd.DataFrame:
+    def get_currencies(self) -> List[Dict]:
         """获取所有币种"""
-        query = "SELECT * FROM currencies ORDER BY id"
-        return pd.read_sql_query(query, self.conn)
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM currencies ORDER BY id")
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
     def update_exchange_rate(self, code: str, rate: float) -> bool:
         """更新汇率（如果汇率有变化，会自动触发历史数据修正）"""
@@ -561,6 +559,7 @@ class Database:
             self.conn.commit()
 
             clear_related_cache()
+            self.analytics.invalidate_rate_cache()
 
             if old_rate is not None:
                 logging.info(
@@ -635,6 +634,8 @@ class Database:
 
             # 清除相关缓存
             clear_related_cache()
+            self.transaction_crud.invalidate_dim_caches()
+            self.analytics.invalidate_rate_cache()
 
             return True
         except Exception as e:
@@ -660,10 +661,12 @@ class Database:
 
     # ============ 投资类别管理 ============
 
-    def get_categories(self) -> pd.DataFrame:
+    def get_categories(self) -> List[Dict]:
         """获取所有投资类别"""
-        query = "SELECT * FROM categories ORDER BY id"
-        return pd.read_sql_query(query, self.conn)
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM categories ORDER BY id")
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
     def add_category(self, name: str, description: str = None) -> bool:
         """添加投资类别"""
@@ -680,6 +683,7 @@ class Database:
 
             # 清除相关缓存
             clear_related_cache()
+            self.transaction_crud.invalidate_dim_caches()
 
             return True
         except _DB_INTEGRITY_ERROR:
@@ -731,6 +735,7 @@ class Database:
 
             # 清除相关缓存
             clear_related_cache()
+            self.transaction_crud.invalidate_dim_caches()
 
             return True
         except Exception as e:
@@ -784,6 +789,7 @@ class Database:
 
             # 清除相关缓存
             clear_related_cache()
+            self.transaction_crud.invalidate_dim_caches()
 
             logging.info(f"成功删除类别 '{category_name}' (ID: {category_id})")
             return True
@@ -825,6 +831,7 @@ class Database:
         start_date: str,
         ledger_id: Optional[int] = None,
         account_id: Optional[int] = None,
+        background_return_rate: bool = False,
     ) -> None:
         """更新从指定日期到昨天的持仓历史、账户余额历史（不查询价格API）
 
@@ -832,6 +839,7 @@ class Database:
             start_date: 开始日期 "YYYY-MM-DD"
             ledger_id: 账本ID，None 表示所有账本
             account_id: 账户ID，None 表示所有账户
+            background_return_rate: 为 True 时收益净值提交到后台线程重算（需指定 ledger_id）
         """
         from datetime import datetime, timedelta
 
@@ -844,12 +852,21 @@ class Database:
                 return
 
             self.generate_snapshots_only(start_date, end_date, ledger_id, account_id)
-            self.generate_return_rate(
-                ledger_id=ledger_id,
-                full_refresh=True,
-                write_to_db=True,
-                incremental_from_date=start_date,
-            )
+            if ledger_id is not None:
+                # 与删除交易共用待重算队列，后台正在重算该账本时合并为一次
+                ledger_id = int(ledger_id)
+                self.transaction_crud.mark_return_rate(ledger_id, start_date)
+                if background_return_rate:
+                    self.transaction_crud.schedule_return_rate(self, [ledger_id])
+                else:
+                    self.transaction_crud.flush_pending_return_rate(self, [ledger_id])
+            else:
+                self.generate_return_rate(
+                    ledger_id=ledger_id,
+                    full_refresh=True,
+                    write_to_db=True,
+                    incremental_from_date=start_date,
+                )
             logging.info(
                 f"已更新 {start_date} 到 {end_date} 的历史快照（账本: {ledger_id if ledger_id else '全部'}）"
             )
@@ -871,6 +888,25 @@ class Database:
                 )
         return result
 
+    def add_transactions(self, transactions: List[Dict]) -> bool:
+        """批量添加交易记录（单个事务），成功后按账本从最早交易日期更新一次历史快照与收益率"""
+        result = self.transaction_crud.add_transactions(transactions, self.analytics)
+        if result:
+            start_dates: Dict[int, str] = {}
+            for transaction in transactions:
+                ledger_id = transaction.get("ledger_id")
+                clear_related_cache(
+                    ledger_id=ledger_id, account_id=transaction.get("account_id")
+                )
+                trans_date = transaction.get("date")
+                if trans_date and (
+                    ledger_id not in start_dates or trans_date < start_dates[ledger_id]
+                ):
+                    start_dates[ledger_id] = trans_date
+            for ledger_id, start_date in start_dates.items():
+                self._update_history_for_date(start_date, ledger_id=ledger_id)
+        return result
+
     def update_history_after_transaction(
         self, trans_date: str, ledger_id: Optional[int] = None
     ) -> None:
@@ -900,6 +936,60 @@ class Database:
             offset,
         )
 
+    def get_transactions_page(
+        self,
+        ledger_id: Optional[int] = None,
+        account_id: Optional[int] = None,
+        trans_type: Optional[str] = None,
+        category: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        after_date: Optional[str] = None,
+        after_id: Optional[int] = None,
+    ) -> Tuple[List[Dict], int]:
+        """获取一页交易记录及符合条件的总数
+
+        传入 after_date/after_id 时按游标分页（忽略 offset），否则按 offset 分页；
+        offset 分页时总数由同一查询中的计数子查询得出。
+        """
+        keyset = after_date is not None and after_id is not None
+        rows = self.transaction_crud.get_transactions(
+            ledger_id,
+            account_id,
+            trans_type,
+            category,
+            start_date,
+            end_date,
+            limit,
+            None if keyset else offset,
+            with_total=not keyset,
+            as_records=True,
+            after_date=after_date,
+            after_id=after_id,
+        )
+        if keyset:
+            # 计数子查询与分页共用 WHERE，游标条件会缩小其统计范围，总数需单独计算
+            total = self.get_transactions_count(
+                ledger_id, account_id, trans_type, category, start_date, end_date
+            )
+            return rows, total
+        if not rows:
+            # 计数子查询的结果随分页行返回，越过末页时没有行可携带，只能单独计数
+            total = (
+                self.get_transactions_count(
+                    ledger_id, account_id, trans_type, category, start_date, end_date
+                )
+                if offset
+                else 0
+            )
+            return rows, total
+        total = int(rows[0]["total_count"])
+        for row in rows:
+            del row["total_count"]
+        return rows, total
+
     def get_transactions_count(
         self,
         ledger_id: Optional[int] = None,
@@ -929,23 +1019,32 @@ class Database:
                 ledger_id=transaction.get("ledger_id"),
                 account_id=transaction.get("account_id"),
             )
-            # 更新交易日期的历史数据
+            # 更新交易日期的历史数据，收益净值在后台重算
             trans_date = transaction.get("date")
             if trans_date:
                 self._update_history_for_date(
-                    trans_date, ledger_id=transaction.get("ledger_id")
+                    trans_date,
+                    ledger_id=transaction.get("ledger_id"),
+                    background_return_rate=True,
                 )
         return result
 
     def delete_transaction(
-        self, transaction_id: int, rebuild_positions: bool = True
+        self,
+        transaction_id: int,
+        rebuild_positions: bool = True,
+        defer_return_rate: bool = False,
     ) -> bool:
-        """删除交易记录并重新同步持仓"""
+        """删除交易记录并重新同步持仓
+
+        收益净值默认提交到后台线程重算；defer_return_rate=True 时延后到
+        flush_pending_return_rate 统一重算
+        """
         transaction = self.get_transaction_by_id(transaction_id)
         trans_date = transaction.get("date") if transaction else None
         ledger_id = transaction.get("ledger_id") if transaction else None
         result = self.transaction_crud.delete_transaction(
-            transaction_id, self.analytics, self, rebuild_positions
+            transaction_id, self.analytics, self, rebuild_positions, defer_return_rate
         )
         if result and transaction:
             clear_related_cache(
@@ -954,6 +1053,19 @@ class Database:
             )
         return result
 
+    def flush_pending_return_rate(self) -> None:
+        """重算所有延后的账本收益净值（与 delete_transaction(defer_return_rate=True) 配合使用）"""
+        self.transaction_crud.flush_pending_return_rate(self)
+
+    def delete_transactions_bulk(self, transaction_ids: List[int]) -> bool:
+        """批量删除交易记录，最后统一重新同步持仓"""
+        result = self.transaction_crud.delete_transactions_bulk(
+            transaction_ids, self.analytics, self
+        )
+        if result:
+            clear_related_cache()
+        return result
+
     def get_positions(
         self, ledger_id: Optional[int] = None, account_id: Optional[int] = None
     ) -> pd.DataFrame:
@@ -1190,7 +1302,7 @@ class Database:
 
         currencies = self.get_currencies()
 
-        if currencies.empty:
+        if not currencies:
             logging.info("📭 没有币种需要更新汇率")
             return results
 
@@ -1199,7 +1311,7 @@ class Database:
         start_date = end_date = yesterday
 
         cursor = self.conn.cursor()
-        for _, currency_row in currencies.iterrows():
+        for currency_row in currencies:
             currency_code = currency_row["code"]
 
             # 跳过人民币
@@ -1248,6 +1360,7 @@ class Database:
                 )
 
         self.conn.commit()
+        self.analytics.invalidate_rate_cache()
         if results["exchange_history_written"] > 0:
             logging.info(
                 f"💱 已写入 {results['exchange_history_written']} 条汇率历史到 exchange_rate_history"
@@ -1303,6 +1416,40 @@ class Database:
             ledger_id, account_id, trans_type, start_date, end_date, limit, offset
         )
 
+    def get_fund_transactions_page(
+        self,
+        ledger_id: Optional[int] = None,
+        account_id: Optional[int] = None,
+        trans_type: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+    ) -> Tuple[pd.DataFrame, int]:
+        """获取一页资金明细及符合条件的总数，总数由同一查询中的计数子查询得出"""
+        df = self.transaction_crud.get_fund_transactions(
+            ledger_id, account_id, trans_type, start_date, end_date, limit, offset,
+            with_total=True,
+        )
+        return self._split_total(
+            df,
+            offset,
+            lambda: self.get_fund_transactions_count(
+                ledger_id, account_id, trans_type, start_date, end_date
+            ),
+        )
+
+    @staticmethod
+    def _split_total(df: pd.DataFrame, offset: Optional[int], count_fn) -> Tuple[pd.DataFrame, int]:
+        """从分页结果中取出 total_count 列作为总数；本页无行或未附加该列时改用单独计数"""
+        if "total_count" not in df.columns:
+            return df, count_fn()
+        if df.empty:
+            # total_count 随分页行返回（计数子查询或窗口函数），越过末页时没有行可携带，只能单独计数
+            return df.drop(columns="total_count"), count_fn() if offset else 0
+        total = int(df["total_count"].iat[0])
+        return df.drop(columns="total_count"), total
+
     def get_fund_transactions_count(
         self,
         ledger_id: Optional[int] = None,
@@ -1355,6 +1502,28 @@ class Database:
             account_id, trans_type, start_date, end_date, limit, offset
         )
 
+    def get_account_transaction_entries_page(
+        self,
+        account_id: int,
+        trans_type: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+    ) -> Tuple[pd.DataFrame, int]:
+        """获取一页账户变动明细及符合条件的总数"""
+        df = self.transaction_crud.get_account_transaction_entries(
+            account_id, trans_type, start_date, end_date, limit, offset,
+            with_total=True,
+        )
+        return self._split_total(
+            df,
+            offset,
+            lambda: self.get_account_transaction_entries_count(
+                account_id, trans_type, start_date, end_date
+            ),
+        )
+
     def get_account_transaction_entries_count(
         self,
         account_id: int,
@@ -1685,6 +1854,8 @@ class Database:
                 exchange_inserted += 1
 
         self.conn.commit()
+        if exchange_inserted:
+            self.analytics.invalidate_rate_cache()
         logging.info(
             f"历史价格补全: 证券 {security_inserted} 条, 汇率 {exchange_inserted} 条"
         )
@@ -2542,6 +2713,8 @@ class Database:
             # 清除内存中的库存缓存
             self.analytics._rebuild_all_inventory()
             clear_related_cache()
+            self.transaction_crud.invalidate_dim_caches()
+            self.analytics.invalidate_rate_cache()
 
             logging.info("数据库已清空并重新初始化默认数据")
             return True
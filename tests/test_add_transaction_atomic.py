@@ -0,0 +1,49 @@
+"""
+新增交易的原子性：写事务中触发库存全量重建时不得提前提交
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+
+def _transaction(d):
+    return {
+        "ledger_id": 1,
+        "account_id": 1,
+        "date": d,
+        "type": "买入",
+        "category": "股票",
+        "code": "600000",
+        "name": "浦发银行",
+        "quantity": 100,
+        "price": 10,
+        "currency": "CNY",
+        "amount": 1000,
+        "fee": 0,
+    }
+
+
+def test_add_transaction_rolls_back_after_inventory_rebuild(tmp_path, monkeypatch):
+    db = Database(str(tmp_path / "atomic.db"))
+    db.add_ledger("L1")
+    db.add_account(1, "A1", "券商", "CNY")
+    for d in ("2024-01-02", "2024-01-03"):
+        assert db.transaction_crud.add_transaction(_transaction(d), db.analytics)
+
+    # 模拟其他进程写入后本进程库存落后，新增交易会走全量重建分支
+    db.analytics._last_processed_ids.clear()
+    db.conn.execute("DELETE FROM inventory_state")
+    db.conn.commit()
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("sync failed")
+
+    monkeypatch.setattr(db.analytics, "_sync_position_from_inventory", fail)
+    assert not db.transaction_crud.add_transaction(_transaction("2024-01-04"), db.analytics)
+
+    count = db.conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    assert count == 2
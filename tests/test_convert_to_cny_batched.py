@@ -0,0 +1,60 @@
+"""
+批量汇率折算：(币种, 日期) 组合超过 SQLite 复合 SELECT 500 项上限时分批查询
+"""
+
+import os
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+
+def _dates(n):
+    start = date(2024, 1, 1)
+    return [(start + timedelta(days=i)).isoformat() for i in range(n)]
+
+
+def test_convert_to_cny_batched_over_500_pairs(tmp_path):
+    db = Database(str(tmp_path / "fx.db"))
+    db.conn.execute(
+        "INSERT INTO exchange_rate_history (currency_code, date, rate) VALUES ('USD', '2024-06-01', 7.0)"
+    )
+    db.conn.commit()
+    rows = [(1.0, "USD", d) for d in _dates(600)] + [(2.0, "HKD", None)]
+
+    result = db.analytics.convert_to_cny_batched(rows)
+
+    expected = [
+        db.analytics.convert_to_cny_at_date(amount, code, d) if d else db.analytics.convert_to_cny(amount, code)
+        for amount, code, d in rows
+    ]
+    assert result == expected
+
+
+def test_add_transactions_with_600_distinct_fx_dates(tmp_path):
+    db = Database(str(tmp_path / "bulk.db"))
+    db.add_ledger("L1")
+    db.add_account(1, "A1", "券商", "USD")
+    transactions = [
+        {
+            "ledger_id": 1,
+            "account_id": 1,
+            "date": d,
+            "type": "买入",
+            "category": "股票",
+            "code": "AAPL",
+            "name": "Apple",
+            "quantity": 1,
+            "price": 10,
+            "currency": "USD",
+            "amount": 10,
+            "fee": 0,
+        }
+        for d in _dates(600)
+    ]
+
+    assert db.transaction_crud.add_transactions(transactions, db.analytics)
+    count = db.conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    assert count == 600
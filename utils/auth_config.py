@@ -4,7 +4,12 @@
 
 import os
 import yaml
-from yaml.loader import SafeLoader
+
+# 优先使用 libyaml 的 C 实现加载器，未编译 libyaml 时回退到纯 Python 版本
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 # 管理员角色标识
 ADMIN_ROLE = "admin"
@@ -7,7 +7,10 @@
 
 import hashlib
 import functools
-from typing import Optional, Callable
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Callable
 
 
 def make_cache_key(*args, **kwargs) -> str:
@@ -16,6 +19,47 @@ def make_cache_key(*args, **kwargs) -> str:
     return hashlib.md5(key_str.encode()).hexdigest()
 
 
+class TTLCache:
+    """线程安全的进程内 TTL 缓存：条目超过 ttl 秒过期，超过 maxsize 时淘汰最早写入的条目"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取未过期的缓存值，未命中返回 default"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """写入缓存值"""
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """删除并返回缓存值"""
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+
 def cached_query(ttl: int = 300):
     """缓存查询装饰器占位，直接执行原函数。"""
     def decorator(func: Callable) -> Callable:
@@ -7,6 +7,11 @@ import os
 import yaml
 from typing import Dict, Any, Optional
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 # 默认配置路径（与 app.py 一致）
 DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "conf", "config.yaml")
 
@@ -23,7 +28,7 @@ def load_database_config(config_path: Optional[str] = None) -> Dict[str, Any]:
     if os.path.exists(path):
         try:
             with open(path, "r", encoding="utf-8") as f:
-                full_config = yaml.safe_load(f)
+                full_config = yaml.load(f, Loader=SafeLoader)
             config = (full_config or {}).get("database") or {}
         except Exception:
             pass
@@ -160,8 +165,8 @@ def save_database_config(
         full_config = {}
         if os.path.exists(path):
             with open(path, "r", encoding="utf-8") as f:
-                full_config = yaml.safe_load(f) or {}
-        full_config["database"] = {
+                full_config = yaml.load(f, Loader=SafeLoader) or {}
+        database = {
             "type": db_type,
             "sqlite": {"path": sqlite_path},
             "postgresql": {
@@ -178,6 +183,10 @@ def save_database_config(
                 "api_token": d1_api_token,
             },
         }
+        # 与现有配置一致时不重写文件
+        if full_config.get("database") == database:
+            return True
+        full_config["database"] = database
         with open(path, "w", encoding="utf-8") as f:
             yaml.dump(full_config, f, allow_unicode=True, default_flow_style=False, sort_keys=False)
         return True
@@ -3,8 +3,10 @@ PostgreSQL 数据库管理器 - 基础设施层
 与 SQLiteManager 接口兼容，支持多数据库架构
 """
 
+import os
 import re
 import logging
+import threading
 from typing import Optional, Any, List, Tuple
 
 from utils.default_currencies import get_all_default_currencies, get_currency_info
@@ -140,9 +142,11 @@ class PostgreSQLManager:
         password: str = "",
         sslmode: str = "prefer",
         config_path: Optional[str] = None,
+        pool_size: Optional[int] = None,
     ):
         try:
             import psycopg2
+            import psycopg2.pool
         except ImportError:
             raise ImportError("使用 PostgreSQL 需要安装 psycopg2: pip install psycopg2-binary")
 
@@ -154,25 +158,33 @@ class PostgreSQLManager:
         self._password = password
         self._sslmode = sslmode
         self.config_path = config_path
-        self.conn: Optional[Any] = None
         self._psycopg2 = psycopg2
+        # 连接池：每个线程借用一条连接，请求结束时由 release_connection 归还
+        self._pool_size = pool_size or min(2 * (os.cpu_count() or 1), 25)
+        self._pool: Optional[Any] = None
+        self._local = threading.local()
         self._connect()
         self._create_tables()
         self._init_default_data()
 
     def _connect(self):
-        """建立数据库连接"""
-        self.conn = _PGConnectionWrapper(
-            self._psycopg2.connect(
-                host=self._host,
-                port=self._port,
-                dbname=self._database,
-                user=self._user,
-                password=self._password,
-                sslmode=self._sslmode,
-            )
+        """建立数据库连接池"""
+        self._pool = self._psycopg2.pool.ThreadedConnectionPool(
+            1,
+            self._pool_size,
+            host=self._host,
+            port=self._port,
+            dbname=self._database,
+            user=self._user,
+            password=self._password,
+            sslmode=self._sslmode,
         )
 
+    @property
+    def conn(self):
+        """当前线程使用的连接"""
+        return self.get_connection()
+
     def _create_tables(self):
         """创建数据库表（PostgreSQL 语法）"""
         cursor = self.conn.cursor()
@@ -405,6 +417,14 @@ class PostgreSQLManager:
         ''')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_rounding_diff_date ON rounding_diff(date)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_rounding_diff_ledger ON rounding_diff(ledger_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_ledger_date ON transactions(ledger_id, date, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions(account_id, date, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_ledger_type_date ON transactions(ledger_id, type, date, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_fund_transaction_entries_fund_side ON fund_transaction_entries(fund_transaction_id, side)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_fund_transaction_entries_account_fund ON fund_transaction_entries(account_id, fund_transaction_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_fund_transactions_date ON fund_transactions(date, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_fund_transactions_ledger_date ON fund_transactions(ledger_id, date, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_fund_transactions_transaction ON fund_transactions(transaction_id)')
 
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS account_balance_history (
@@ -503,16 +523,37 @@ class PostgreSQLManager:
         self.conn.commit()
 
     def get_connection(self):
-        """获取数据库连接（已包装，支持 ? 占位符和 lastrowid）"""
-        if self.conn is None:
-            self._connect()
-        return self.conn
+        """获取当前线程的数据库连接（已包装，支持 ? 占位符和 lastrowid），首次调用时从连接池借出"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self._pool is None:
+                self._connect()
+            conn = _PGConnectionWrapper(self._pool.getconn())
+            self._local.conn = conn
+        return conn
+
+    def release_connection(self):
+        """将当前线程借出的连接归还连接池（未提交的事务会被回滚）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._pool is None:
+            return
+        self._local.conn = None
+        broken = False
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
+        try:
+            self._pool.putconn(conn._conn, close=broken)
+        except Exception as e:
+            logging.getLogger(__name__).warning("归还 PostgreSQL 连接失败: %s", e)
 
     def close(self):
-        """关闭数据库连接"""
-        if self.conn:
+        """关闭连接池中的全部连接"""
+        self._local = threading.local()
+        if self._pool:
             try:
-                self.conn.close()
+                self._pool.closeall()
             except Exception:
                 pass
-            self.conn = None
+            self._pool = None
@@ -3,8 +3,10 @@ SQLite 数据库管理器 - 基础设施层
 负责数据库连接、表结构创建、数据库迁移和初始化
 """
 
+import queue
 import sqlite3
 import logging
+import threading
 from typing import Optional
 
 from utils.default_currencies import get_all_default_currencies, get_currency_info
@@ -13,26 +15,58 @@ from utils.default_currencies import get_all_default_currencies, get_currency_in
 class SQLiteManager:
     """SQLite 数据库管理器 - 基础设施层"""
 
-    def __init__(self, db_path: str = "investment.db", config_path: Optional[str] = None):
+    def __init__(self, db_path: str = "investment.db", config_path: Optional[str] = None, pool_size: int = 8):
         """初始化数据库连接
 
         Args:
             db_path: 数据库文件路径
             config_path: 配置文件路径，用于读取 default_exchange_rates 等设置（可选）
+            pool_size: 连接池中保留的空闲连接数上限
         """
         self.db_type = "sqlite"
         self.db_path = db_path
         self.config_path = config_path
-        self.conn: Optional[sqlite3.Connection] = None
+        # 连接池：每个线程独占一条连接，请求结束时由 release_connection 归还
+        # 内存库的每条连接互相独立，只能共用同一条连接
+        self._pool_size = pool_size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._local = threading.local()
+        self._shared: Optional[sqlite3.Connection] = None
         self._connect()
         self._create_tables()
         self._init_default_data()
 
+    def _open_connection(self) -> sqlite3.Connection:
+        """新建一条数据库连接并设置 PRAGMA"""
+        # 查询条件组合有限，放大语句缓存使各组合的预编译语句都能复用
+        # detect_types=0：日期列按 TEXT 原样返回字符串，调用方无需再做 datetime 转换
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            timeout=30,
+            cached_statements=256,
+            detect_types=0,
+        )
+        # 启用外键约束
+        conn.execute("PRAGMA foreign_keys = ON")
+        # WAL：读写互不阻塞，多连接并发读；NORMAL 在 WAL 下仍可保证一致性
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -64000")
+        return conn
+
     def _connect(self):
         """建立数据库连接"""
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        # 启用外键约束
-        self.conn.execute("PRAGMA foreign_keys = ON")
+        if self.db_path == ":memory:":
+            self._shared = self._shared or self._open_connection()
+        else:
+            self.get_connection()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """当前线程使用的连接"""
+        return self.get_connection()
 
     def _create_tables(self):
         """创建数据库表"""
@@ -170,6 +204,11 @@ class SQLiteManager:
 
         self.conn.commit()
 
+    def _set_foreign_keys(self, enabled: bool) -> None:
+        """切换外键约束。PRAGMA foreign_keys 在事务内执行不生效，切换前先提交已有改动"""
+        self.conn.commit()
+        self.conn.execute(f"PRAGMA foreign_keys = {'ON' if enabled else 'OFF'}")
+
     def _migrate_database(self, cursor):
         """数据库迁移：检查并添加缺失的列和表"""
         # 检查 ledgers 表是否有 cost_method 列
@@ -205,7 +244,7 @@ class SQLiteManager:
             logging.info(
                 "迁移数据库：重建 ledgers 表，唯一约束改为 (owner_username, name)"
             )
-            cursor.execute("PRAGMA foreign_keys = OFF")
+            self._set_foreign_keys(False)
             cursor.execute("""
                 CREATE TABLE ledgers_new (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -224,7 +263,7 @@ class SQLiteManager:
             """)
             cursor.execute("DROP TABLE ledgers")
             cursor.execute("ALTER TABLE ledgers_new RENAME TO ledgers")
-            cursor.execute("PRAGMA foreign_keys = ON")
+            self._set_foreign_keys(True)
 
         # 检查是否存在 categories 表
         cursor.execute("""
@@ -264,7 +303,7 @@ class SQLiteManager:
         acc_cols = [c[1] for c in cursor.fetchall()]
         if "currency_id" not in acc_cols and "currency" in acc_cols:
             logging.info("迁移数据库：accounts 表从 currency(TEXT) 迁移到 currency_id")
-            cursor.execute("PRAGMA foreign_keys = OFF")
+            self._set_foreign_keys(False)
             cursor.execute("""
                 CREATE TABLE accounts_new (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -289,7 +328,7 @@ class SQLiteManager:
             """)
             cursor.execute("DROP TABLE accounts")
             cursor.execute("ALTER TABLE accounts_new RENAME TO accounts")
-            cursor.execute("PRAGMA foreign_keys = ON")
+            self._set_foreign_keys(True)
 
         # 检查是否存在 fund_transaction_entries 表
         cursor.execute("""
@@ -384,7 +423,7 @@ class SQLiteManager:
             # 重建表结构
             logging.info("迁移数据库：重建 fund_transactions 表结构")
             # 禁用外键检查（临时）
-            cursor.execute("PRAGMA foreign_keys = OFF")
+            self._set_foreign_keys(False)
 
             # 创建新表（使用 currency_id 外键）
             cursor.execute("""
@@ -430,7 +469,7 @@ class SQLiteManager:
             )
 
             # 重新启用外键检查
-            cursor.execute("PRAGMA foreign_keys = ON")
+            self._set_foreign_keys(True)
 
             logging.info("迁移数据库：fund_transactions 表结构迁移完成")
 
@@ -723,6 +762,59 @@ class SQLiteManager:
                     VALUES (?, '默认对话', ?, COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP))
                 """, (uname, msgs, ut, ut))
 
+        # 交易列表按账本/账户筛选、按日期倒序分页：复合索引可直接按序扫描，免去排序
+        cursor.execute("""
+            SELECT name FROM sqlite_master
+            WHERE type='index' AND name='idx_transactions_ledger_date'
+        """)
+        if not cursor.fetchone():
+            logging.info("迁移数据库：创建 transactions 分页索引")
+            cursor.execute(
+                "CREATE INDEX idx_transactions_ledger_date ON transactions(ledger_id, date, id)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions(account_id, date, id)"
+            )
+            # 收集统计信息，使查询规划器能在两个索引间正确选择
+            cursor.execute("ANALYZE transactions")
+
+        # 按账本 + 交易类型筛选时同样可按 (date, id) 顺序扫描
+        cursor.execute("""
+            SELECT name FROM sqlite_master
+            WHERE type='index' AND name='idx_transactions_ledger_type_date'
+        """)
+        if not cursor.fetchone():
+            logging.info("迁移数据库：创建 transactions 类型筛选索引")
+            cursor.execute(
+                "CREATE INDEX idx_transactions_ledger_type_date ON transactions(ledger_id, type, date, id)"
+            )
+            cursor.execute("ANALYZE transactions")
+
+        # 资金明细：分录按主记录/账户关联，主记录按账本、日期分页，删除交易时按 transaction_id 查找
+        cursor.execute("""
+            SELECT name FROM sqlite_master
+            WHERE type='index' AND name='idx_fund_transaction_entries_fund_side'
+        """)
+        if not cursor.fetchone():
+            logging.info("迁移数据库：创建资金明细索引")
+            cursor.execute(
+                "CREATE INDEX idx_fund_transaction_entries_fund_side ON fund_transaction_entries(fund_transaction_id, side)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_fund_transaction_entries_account_fund ON fund_transaction_entries(account_id, fund_transaction_id)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_fund_transactions_date ON fund_transactions(date, id)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_fund_transactions_ledger_date ON fund_transactions(ledger_id, date, id)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_fund_transactions_transaction ON fund_transactions(transaction_id)"
+            )
+            cursor.execute("ANALYZE fund_transactions")
+            cursor.execute("ANALYZE fund_transaction_entries")
+
     def _init_default_data(self):
         """初始化默认数据（仅在首次创建时），币种与汇率使用设置中的默认值"""
         cursor = self.conn.cursor()
@@ -768,10 +860,13 @@ class SQLiteManager:
         if not (code and str(code).strip()):
             return
         code = str(code).strip().upper()
-        cursor = self.conn.cursor()
+        conn = self.conn
+        cursor = conn.cursor()
         cursor.execute("SELECT id FROM currencies WHERE code = ? LIMIT 1", (code,))
         if cursor.fetchone():
             return
+        # 调用方已开启事务（如添加交易）时随其一并提交，不提前结束外层事务
+        in_transaction = conn.in_transaction
         name, symbol, rate = get_currency_info(code, self.config_path)
         cursor.execute(
             """
@@ -780,20 +875,51 @@ class SQLiteManager:
         """,
             (code, name, symbol, rate),
         )
-        self.conn.commit()
+        if not in_transaction:
+            conn.commit()
 
     def get_connection(self) -> sqlite3.Connection:
-        """获取数据库连接
+        """获取当前线程的数据库连接（首次调用时从连接池取出或新建）
 
         Returns:
             sqlite3.Connection: 数据库连接对象
         """
-        if self.conn is None:
-            self._connect()
-        return self.conn
+        if self._shared is not None:
+            return self._shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open_connection()
+            self._local.conn = conn
+        return conn
+
+    def release_connection(self):
+        """将当前线程的连接归还连接池（未提交的事务会被回滚）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        if conn.in_transaction:
+            logging.warning("归还 SQLite 连接时存在未提交的事务，已回滚")
+            conn.rollback()
+        if self._idle.qsize() < self._pool_size:
+            self._idle.put(conn)
+        else:
+            conn.close()
 
     def close(self):
-        """关闭数据库连接"""
-        if self.conn:
-            self.conn.close()
-            self.conn = None
+        """关闭所有数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        if self._shared is not None:
+            self._shared.close()
+            self._shared = None
@@ -33,8 +33,12 @@ def _load_config_rates(config_path: Optional[str] = None) -> Dict[str, float]:
         return {}
     try:
         import yaml
+        try:
+            from yaml import CSafeLoader as SafeLoader
+        except ImportError:
+            from yaml import SafeLoader
         with open(config_path, "r", encoding="utf-8") as f:
-            cfg = yaml.safe_load(f) or {}
+            cfg = yaml.load(f, Loader=SafeLoader) or {}
         rates = (cfg.get("default_exchange_rates") or cfg.get("default_currencies"))
         if isinstance(rates, dict):
             return {str(k).upper(): float(v) for k, v in rates.items()}